@@ -9,7 +9,8 @@ Executa as 6 perguntas do desafio e exibe, para cada uma:
 - intent roteado
 - SQL gerado (quando houver)
 - status de validação (dry-run)
-- bytes estimados do dry-run (quando fornecido pelo grafo)
+- bytes estimados do dry-run (quando fornecido pelo grafo) e desvio do modelo
+  local de custo em relação a ele (resumo ao final)
 - shape + prévia dos dados retornados
 - resposta final sintetizada em PT-BR
 
@@ -56,6 +57,7 @@ if str(REPO_ROOT) not in sys.path:
     sys.path.insert(0, str(REPO_ROOT))
 
 from src.agent.graph import run_debug, GRAPH_VERSION  # noqa: E402
+from src.utils.cost import drift_stats  # noqa: E402
 
 
 # Perguntas do desafio
@@ -95,6 +97,10 @@ def _preview_df(df: Any, n: int = 5, width: int = 120) -> str:
     try:
         import pandas as pd  # type: ignore
 
+        # ArrowResult (grafo): converte apenas as primeiras linhas
+        if hasattr(df, "head_records"):
+            df = df.head(n)
+
         if isinstance(df, pd.DataFrame):
             # Tenta usar tabulate se estiver disponível para tabela mais legível
             try:
@@ -259,6 +265,25 @@ def main() -> int:
                 print(f"- latency_ms: {elapsed_ms:.0f}")
                 if dry_bytes is not None:
                     print(f"- dry_run_bytes: {dry_bytes:,}")
+                if meta.get("estimated_bytes") is not None:
+                    drift = meta.get("estimate_drift_pct")
+                    print(
+                        f"- estimated_bytes(local): {meta['estimated_bytes']:,} "
+                        f"| drift={'n/a' if drift is None else f'{drift:+.1f}%'}"
+                    )
+                if meta.get("query_path"):
+                    print(f"- query_path: {meta['query_path']}")
+                stats = meta.get("job_stats") or {}
+                if stats:
+                    print(
+                        f"- job: {stats.get('job_id') or 'n/a'} | cache_hit={stats.get('cache_hit')} "
+                        f"| billed={stats.get('total_bytes_billed')} | slot_ms={stats.get('slot_millis')} "
+                        f"| queue_ms={stats.get('queue_ms')} | run_ms={stats.get('run_ms')}"
+                    )
+                if meta.get("read_path"):
+                    print(
+                        f"- read: {meta['read_path']} ({meta.get('read_ms') or 0:.0f} ms)"
+                    )
 
                 if sql and not args.no_sql:
                     print(f"- sql: {sql}")
@@ -286,6 +311,12 @@ def main() -> int:
                     "validation_ok": valid_ok,
                     "validation_error": valid_err,
                     "dry_run_bytes": dry_bytes,
+                    "estimated_bytes": meta.get("estimated_bytes"),
+                    "estimate_drift_pct": meta.get("estimate_drift_pct"),
+                    "read_path": meta.get("read_path"),
+                    "read_ms": meta.get("read_ms"),
+                    "query_path": meta.get("query_path"),
+                    "job_stats": meta.get("job_stats"),
                     "graph_version": graph_v,
                     "latency_ms": round(elapsed_ms, 0),
                     "df_shape": _shape(df),
@@ -305,6 +336,15 @@ def main() -> int:
         # 130 é um código comum para SIGINT
         return 130
 
+    # Desvio do modelo local de custo × dry-run (amostras desta execução)
+    drift = drift_stats()
+    if drift.get("samples"):
+        print(
+            f"\nModelo de custo: {drift['samples']} amostra(s) | "
+            f"erro médio {drift['mean_abs_pct']:.1f}% | p90 {drift['p90_abs_pct']:.1f}% | "
+            f"viés {drift['mean_pct']:+.1f}%"
+        )
+
     # Exporta JSON (opcional)
     if args.json_out:
         out_path = Path(args.json_out)
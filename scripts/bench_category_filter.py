@@ -0,0 +1,129 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Relatório: filtro textual LIKE × IN sobre o dicionário de categorias.
+
+Objetivo
+--------
+Para cada template do gerador com filtro textual (perguntas 2 a 4 do desafio),
+gera o SQL nos dois modos (`AGENT_CATEGORY_IN` desligado/ligado) e mostra:
+- bytes estimados no dry-run de cada um;
+- com --execute: bytes processados e slot-time (`slot_millis`) de cada job,
+  e a economia do IN;
+- se as duas respostas coincidem.
+
+O cache de resultados local é desligado; o cache do BigQuery pode responder
+uma repetição (slot_millis ≈ 0, indicado como "cache").
+
+Uso
+---
+python scripts/bench_category_filter.py
+python scripts/bench_category_filter.py --execute
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Garante import de 'src' quando rodar fora do pytest
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.acceptance_test import QUESTIONS  # noqa: E402
+from src.agent import categories  # noqa: E402
+from src.agent.nodes import generate_sql  # noqa: E402
+from src.utils import bq  # noqa: E402
+
+FILTER_QUESTIONS = QUESTIONS[1:4]
+
+
+def _sql(question: str, use_in: bool) -> str:
+    prev = categories.CATEGORY_IN_ENABLED
+    categories.CATEGORY_IN_ENABLED = use_in
+    try:
+        return generate_sql(question)["sql"]
+    finally:
+        categories.CATEGORY_IN_ENABLED = prev
+
+
+def _measure(sql: str, execute: bool) -> Dict[str, Any]:
+    out: Dict[str, Any] = {"dry_run_bytes": None, "bytes": None, "slot_ms": None}
+    v = bq.dry_run(sql)
+    if not v.get("ok"):
+        out["error"] = v.get("error")
+        return out
+    out["dry_run_bytes"] = v.get("dry_run_bytes")
+    if execute:
+        r = bq.execute(sql, prevalidated=v)
+        if not r.get("ok"):
+            out["error"] = r.get("error")
+            return out
+        stats = r.get("job_stats") or {}
+        out.update(
+            bytes=stats.get("total_bytes_processed"),
+            slot_ms=stats.get("slot_millis"),
+            cache_hit=stats.get("cache_hit"),
+            rows=r["df"].to_dict("records"),
+        )
+    return out
+
+
+def _fmt(value: Optional[float], unit: str) -> str:
+    return "—" if value is None else f"{value:,.0f} {unit}"
+
+
+def _saved(before: Optional[float], after: Optional[float], unit: str) -> str:
+    if before is None or after is None:
+        return "—"
+    pct = f" ({(before - after) / before:.0%})" if before else ""
+    return f"{before - after:,.0f} {unit}{pct}"
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--execute", action="store_true", help="Executa os dois SQL (mede slot-time)"
+    )
+    args = parser.parse_args(argv)
+
+    entry = categories.load_dictionary()
+    if entry is None:
+        print("Dicionário de categorias indisponível; nada a comparar.")
+        return 1
+    print(
+        f"Dicionário ({entry['source']}): "
+        + ", ".join(f"{c}={len(v)}" for c, v in entry["values"].items())
+    )
+
+    # Mede o custo real de cada consulta, não o cache de resultados
+    bq.RESULT_CACHE_ENABLED = False
+    for i, question in enumerate(FILTER_QUESTIONS, start=2):
+        like = _measure(_sql(question, False), args.execute)
+        in_ = _measure(_sql(question, True), args.execute)
+        print(f"\n[{i}] {question}")
+        for label, m in (("LIKE", like), ("IN", in_)):
+            if m.get("error"):
+                print(f"  {label:4}: falha: {m['error']}")
+                continue
+            cache = " (cache)" if m.get("cache_hit") else ""
+            print(
+                f"  {label:4}: dry-run {_fmt(m['dry_run_bytes'], 'B')} | "
+                f"processado {_fmt(m['bytes'], 'B')} | slot {_fmt(m['slot_ms'], 'ms')}{cache}"
+            )
+        print(
+            f"  economia: {_saved(like['dry_run_bytes'], in_['dry_run_bytes'], 'B')} "
+            f"estimados; slot {_saved(like['slot_ms'], in_['slot_ms'], 'ms')}"
+        )
+        if args.execute and "rows" in like and "rows" in in_:
+            print(
+                f"  respostas {'iguais' if like['rows'] == in_['rows'] else 'DIFERENTES'}"
+            )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,92 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Microbenchmark: gerador de SQL (`src.agent.nodes.generate_sql`).
+
+Objetivo
+--------
+Para as 4 perguntas de dados do desafio, mede (mediana de N repetições, em µs):
+- perfil em cache: caminho normal, só montagem de strings sobre o `SchemaProfile`;
+- perfil por pergunta: `SchemaProfile.from_schema` a cada chamada (custo que o
+  gerador pagava antes de o perfil ser pré-computado).
+
+Roda offline: usa um schema fixo com as colunas reais de `chamado`.
+
+Uso
+---
+python scripts/bench_generator.py
+python scripts/bench_generator.py --repeat 20000
+"""
+
+from __future__ import annotations
+
+import argparse
+import logging
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# Garante import de 'src' quando rodar fora do pytest
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.acceptance_test import QUESTIONS  # noqa: E402
+from src.agent import nodes  # noqa: E402
+
+DATA_QUESTIONS = QUESTIONS[:4]
+
+SCHEMA = {
+    "id_chamado": "STRING",
+    "data_inicio": "TIMESTAMP",
+    "data_particao": "DATE",
+    "id_bairro": "STRING",
+    "id_unidade_organizacional": "STRING",
+    "nome_unidade_organizacional": "STRING",
+    "categoria": "STRING",
+    "tipo": "STRING",
+    "subtipo": "STRING",
+    "descricao": "STRING",
+    "status": "STRING",
+}
+
+
+def _median_us(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1e6)
+    return statistics.median(samples)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument(
+        "--repeat", type=int, default=5000, help="Repetições por pergunta"
+    )
+    args = parser.parse_args(argv)
+
+    # Os logs INFO de cada SQL dominariam a medição
+    logging.disable(logging.INFO)
+    profile = nodes.SchemaProfile.from_schema(SCHEMA)
+    build_us = _median_us(lambda: nodes.SchemaProfile.from_schema(SCHEMA), args.repeat)
+    print(f"SchemaProfile.from_schema: {build_us:8.1f} µs")
+
+    for i, question in enumerate(DATA_QUESTIONS, start=1):
+        nodes._profile = lambda: profile
+        cached_us = _median_us(lambda: nodes.generate_sql(question), args.repeat)
+        nodes._profile = lambda: nodes.SchemaProfile.from_schema(SCHEMA)
+        rebuilt_us = _median_us(lambda: nodes.generate_sql(question), args.repeat)
+        print(
+            f"[{i}] perfil em cache: {cached_us:7.1f} µs | "
+            f"perfil por pergunta: {rebuilt_us:7.1f} µs  "
+            f"({rebuilt_us / max(cached_us, 1e-6):.1f}×)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,109 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Benchmark: índice colunar em memória (`src.agent.index`) × BigQuery.
+
+Objetivo
+--------
+Para as 4 perguntas de dados do desafio, mede:
+- tempo de resposta do índice (mediana de N repetições, em ms)
+- tempo do caminho BigQuery (`bq.execute` do SQL gerado, sem cache de resultados)
+- se as duas respostas coincidem
+
+Uso
+---
+# Índice a partir do espelho local (scripts/sync_mirror.py):
+python scripts/bench_index.py
+
+# Índice carregado do BigQuery, só partições a partir de 2023:
+python scripts/bench_index.py --source bigquery --since 2023-01-01
+
+# Só o índice (sem BigQuery):
+python scripts/bench_index.py --no-bigquery --repeat 1000
+"""
+
+from __future__ import annotations
+
+import argparse
+import datetime as dt
+import statistics
+import sys
+import time
+from pathlib import Path
+from typing import List, Optional
+
+# Garante import de 'src' quando rodar fora do pytest
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+from scripts.acceptance_test import QUESTIONS  # noqa: E402
+from src.agent.index import ChamadoIndex  # noqa: E402
+from src.agent.nodes import generate_sql  # noqa: E402
+from src.utils import bq  # noqa: E402
+
+DATA_QUESTIONS = QUESTIONS[:4]
+
+
+def _median_ms(fn, repeat: int) -> float:
+    samples = []
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - t0) * 1000)
+    return statistics.median(samples)
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--source", choices=("mirror", "bigquery"), default="mirror")
+    parser.add_argument("--dest", default=None, help="Diretório do espelho local")
+    parser.add_argument("--since", default=None, help="Primeira partição (YYYY-MM-DD)")
+    parser.add_argument("--repeat", type=int, default=200, help="Repetições do índice")
+    parser.add_argument(
+        "--no-bigquery", action="store_true", help="Não mede o BigQuery"
+    )
+    args = parser.parse_args(argv)
+
+    since = dt.date.fromisoformat(args.since) if args.since else None
+    t0 = time.perf_counter()
+    if args.source == "mirror":
+        index = ChamadoIndex.from_mirror(args.dest, since=since)
+    else:
+        index = ChamadoIndex.from_bigquery(since=since)
+    print(
+        f"Índice ({index.source}): {len(index):,} linhas, {index.nbytes / 1024**2:.1f} MiB, "
+        f"{index.first_day} a {index.last_day}, carga em {time.perf_counter() - t0:.1f}s"
+    )
+
+    # Mede o custo real de cada consulta, não o cache de resultados
+    bq.RESULT_CACHE_ENABLED = False
+    for i, question in enumerate(DATA_QUESTIONS, start=1):
+        gen = generate_sql(question)
+        template = gen["template"]
+        answer = index.answer(template)
+        print(f"\n[{i}] {question}")
+        if answer is None:
+            print("  índice: não cobre o template")
+            continue
+        idx_ms = _median_ms(lambda: index.answer(template), args.repeat)
+        print(f"  índice:   {idx_ms:10.3f} ms  {answer.to_pylist()}")
+        if args.no_bigquery:
+            continue
+        t0 = time.perf_counter()
+        out = bq.execute(gen["sql"], result_format="arrow")
+        bq_ms = (time.perf_counter() - t0) * 1000
+        if not out.get("ok"):
+            print(f"  bigquery: falha: {out.get('error')}")
+            continue
+        rows = out["table"].table.to_pylist()
+        print(
+            f"  bigquery: {bq_ms:10.1f} ms  {rows}  "
+            f"({'igual' if rows == answer.to_pylist() else 'DIFERENTE'}; "
+            f"{bq_ms / max(idx_ms, 1e-6):,.0f}× mais lento)"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
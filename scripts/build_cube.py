@@ -0,0 +1,186 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Construção incremental do cubo de rollup diário (`src.agent.cube`).
+
+Objetivo
+--------
+Para cada partição de `chamado`, grava `GROUP BY dimensões, COUNT(1) AS n` em
+<AGENT_CUBE_DIR> (layout Hive, igual ao espelho). Só partições novas ou
+alteradas são reagregadas — mesmo manifesto e escrita atômica de
+`scripts/sync_mirror.py`.
+
+Fontes
+------
+- bigquery (padrão): o GROUP BY roda no BigQuery e só os agregados trafegam.
+- mirror: agrega localmente o espelho Parquet (sem Google Cloud); a
+  "origem" de cada partição é a entrada dela no manifesto do espelho.
+
+O agente só responde pelo cubo com AGENT_CUBE=1, e só para janelas em que todas
+as partições da origem foram agregadas (dias com falha ficam para a próxima
+execução e, até lá, seguem para o BigQuery).
+
+Uso
+---
+python scripts/build_cube.py
+python scripts/build_cube.py --source mirror
+python scripts/build_cube.py --since 2023-01-01 --workers 8
+python scripts/build_cube.py --plan
+python scripts/build_cube.py --budget-gb 100
+
+Orçamento
+---------
+Com --source bigquery, as agregações rodam na sessão de orçamento
+"cube-build" (limite BQ_SESSION_BUDGET_BYTES; --budget-gb fixa o desta
+execução). Partições recusadas ficam como falha e são retomadas na próxima
+execução, como no espelho.
+"""
+
+from __future__ import annotations
+
+import argparse
+import sys
+import time
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+# Garante import de 'src' quando rodar fora do pytest
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import pyarrow as pa  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+from scripts import sync_mirror  # noqa: E402
+from src.agent import cube  # noqa: E402
+from src.agent.nodes import TAB_BAIRRO, TAB_CHAMADO  # noqa: E402
+from src.utils import bq  # noqa: E402
+from src.utils.backends import LOCAL_SNAPSHOT_DIR  # noqa: E402
+
+# Granularidade diária: o timestamp de abertura não entra como dimensão
+_NOT_DIMENSIONS = ("data_inicio",)
+
+
+def _fetch_rollup_bigquery(day: str, dims: List[str]) -> pa.Table:
+    out = bq.execute(cube.rollup_sql(day, dims), result_format="arrow", timeout=600)
+    if not out.get("ok"):
+        raise RuntimeError(f"Falha ao agregar {day}: {out.get('error')}")
+    return out["table"].table
+
+
+def build(
+    dest: Optional[str] = None,
+    source: str = "bigquery",
+    mirror: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    workers: int = 4,
+    prune: bool = False,
+    plan_only: bool = False,
+    log=print,
+) -> Dict[str, Any]:
+    """
+    Atualiza o cubo (só partições novas/alteradas).
+
+    Returns
+    -------
+    dict
+        {"downloaded", "unchanged", "failed", "pruned", "rows", "seconds"}
+        ("rows" = linhas do cubo gravadas, não chamados)
+    """
+    t0 = time.monotonic()
+    base = Path(dest or cube.CUBE_DIR)
+    if source == "mirror":
+        mirror_base = Path(mirror or LOCAL_SNAPSHOT_DIR)
+        mirror_root = mirror_base / TAB_CHAMADO
+        mirror_manifest = sync_mirror._load_manifest(mirror_root)
+        dims = [
+            c for c in mirror_manifest.get("columns", []) if c not in _NOT_DIMENSIONS
+        ]
+        remote = mirror_manifest.get("partitions", {})
+
+        def fetch(day: str, columns: List[str]) -> pa.Table:
+            path = sync_mirror._partition_file(mirror_root, day)
+            return cube.rollup_table(pq.read_table(path, columns=columns), columns)
+
+        def bairro() -> pa.Table:
+            return pq.read_table(mirror_base / f"{TAB_BAIRRO}.parquet")
+
+    else:
+        dims = [c for c in sync_mirror.mirror_columns() if c not in _NOT_DIMENSIONS]
+        remote = sync_mirror.list_partitions()
+        fetch = _fetch_rollup_bigquery
+        bairro = sync_mirror.fetch_bairro
+    if not dims:
+        raise RuntimeError("Nenhuma dimensão disponível para o cubo.")
+
+    summary = sync_mirror.sync_partitions(
+        base / TAB_CHAMADO,
+        dims,
+        remote,
+        fetch,
+        since=since,
+        until=until,
+        workers=workers,
+        prune=prune,
+        plan_only=plan_only,
+        log=log,
+    )
+    if not plan_only:
+        try:
+            sync_mirror._atomic_write_table(bairro(), base / f"{TAB_BAIRRO}.parquet")
+        except Exception as e:
+            summary["failed"]["bairro"] = repr(e)
+            log(f"  falha bairro: {e!r}")
+    summary["seconds"] = time.monotonic() - t0
+    return summary
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dest", default=None, help="Diretório do cubo")
+    parser.add_argument("--source", choices=("bigquery", "mirror"), default="bigquery")
+    parser.add_argument(
+        "--mirror", default=None, help="Diretório do espelho (--source mirror)"
+    )
+    parser.add_argument("--since", default=None, help="Primeira partição (YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="Última partição (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=4, help="Partições em paralelo")
+    parser.add_argument("--prune", action="store_true", help="Remove partições órfãs")
+    parser.add_argument("--plan", action="store_true", help="Só mostra o plano")
+    parser.add_argument(
+        "--budget-gb",
+        type=float,
+        default=None,
+        help="Orçamento da sessão em GB por janela (0 = sem limite)",
+    )
+    args = parser.parse_args(argv)
+
+    # O cubo já é o cache: não duplica os agregados no cache de resultados
+    bq.RESULT_CACHE_ENABLED = False
+    sync_mirror.apply_budget(args.budget_gb)
+    with bq.budget_session("cube-build"):
+        summary = build(
+            dest=args.dest,
+            source=args.source,
+            mirror=args.mirror,
+            since=args.since,
+            until=args.until,
+            workers=args.workers,
+            prune=args.prune,
+            plan_only=args.plan,
+        )
+    print(
+        f"Concluído em {summary['seconds']:.1f}s: {len(summary['downloaded'])} "
+        f"partição(ões), {summary['rows']:,} linhas no cubo; "
+        f"{len(summary['failed'])} falha(s)."
+    )
+    hint = sync_mirror.budget_hint(summary, "cube-build")
+    if hint:
+        print(hint)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+Espelho local incremental de `datario.adm_central_atendimento_1746.chamado`.
+
+Objetivo
+--------
+Manter em disco uma cópia em Parquet, particionada no estilo Hive por
+`data_particao`, para o backend local (`AGENT_BACKEND=duckdb`) e benchmarks:
+
+<destino>/datario.adm_central_atendimento_1746.chamado/
+    _manifest.json
+    data_particao=2024-11-28/part-0.parquet
+    ...
+<destino>/datario.dados_mestres.bairro.parquet
+
+- Só baixa partições novas ou alteradas desde a última sincronização
+  (`last_modified_time`/`total_rows` de INFORMATION_SCHEMA.PARTITIONS
+  comparados com o manifesto local), além das lidas antes do fim do dia.
+- Projeta apenas as colunas que `generate_sql` pode referenciar
+  (`src.agent.nodes.GENERATOR_COLUMNS`, interseção com o schema real).
+- Escrita atômica (arquivo temporário + `os.replace`): leitores nunca veem uma
+  partição pela metade. O manifesto é atualizado a cada partição concluída, então
+  uma sincronização interrompida retoma de onde parou.
+
+Uso
+---
+# Sincroniza tudo (destino padrão: LOCAL_SNAPSHOT_DIR):
+python scripts/sync_mirror.py
+
+# Só uma faixa de partições, com 4 downloads em paralelo:
+python scripts/sync_mirror.py --since 2023-01-01 --until 2024-12-31 --workers 4
+
+# Mostra o plano sem baixar nada:
+python scripts/sync_mirror.py --plan
+
+# Remove partições locais que não existem mais na origem:
+python scripts/sync_mirror.py --prune
+
+# Carga inicial completa, com orçamento próprio (GB por janela de BQ_BUDGET_WINDOW):
+python scripts/sync_mirror.py --budget-gb 500
+
+Orçamento
+---------
+Todas as consultas rodam na sessão de orçamento "mirror-sync" (também nos
+downloads em paralelo), limitada por BQ_SESSION_BUDGET_BYTES (padrão: 20 GB
+por hora). Uma sincronização completa passa disso: as partições recusadas
+ficam como falha e são retomadas na próxima execução. Use --budget-gb (0 = sem
+limite) para fixar o orçamento desta execução.
+"""
+
+from __future__ import annotations
+
+import argparse
+import concurrent.futures
+import contextvars
+import datetime as dt
+import json
+import os
+import shutil
+import sys
+import threading
+import time
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional
+
+# Garante import de 'src' quando rodar fora do pytest
+REPO_ROOT = Path(__file__).resolve().parents[1]
+if str(REPO_ROOT) not in sys.path:
+    sys.path.insert(0, str(REPO_ROOT))
+
+import pyarrow as pa  # noqa: E402
+import pyarrow.parquet as pq  # noqa: E402
+
+from src.agent.cube import partition_complete  # noqa: E402
+from src.agent.nodes import (  # noqa: E402
+    DATASET_CHAMADO,
+    GENERATOR_COLUMNS,
+    TAB_BAIRRO,
+    TAB_CHAMADO,
+    TABLE_CHAMADO,
+)
+from src.utils import bq  # noqa: E402
+from src.utils.backends import LOCAL_SNAPSHOT_DIR  # noqa: E402
+from src.utils.schema import get_table_schema  # noqa: E402
+
+MANIFEST = "_manifest.json"
+PARTITION_KEY = "data_particao"
+# Colunas da dimensão de bairros usadas no JOIN do gerador
+BAIRRO_COLUMNS = ("id_bairro", "nome")
+
+
+# Metadados
+
+
+def mirror_columns() -> List[str]:
+    """Colunas projetadas no espelho (sem a chave de partição, que vai no caminho)."""
+    schema = get_table_schema(DATASET_CHAMADO, TABLE_CHAMADO)
+    return [c for c in GENERATOR_COLUMNS if c in schema and c != PARTITION_KEY]
+
+
+def list_partitions() -> Dict[str, Dict[str, Any]]:
+    """
+    Partições diárias da origem.
+
+    Returns
+    -------
+    dict
+        {"YYYY-MM-DD": {"last_modified": str ISO, "rows": int}}
+    """
+    out = bq.execute(
+        f"""
+        SELECT partition_id, total_rows, last_modified_time
+        FROM `{DATASET_CHAMADO}.INFORMATION_SCHEMA.PARTITIONS`
+        WHERE table_name = '{TABLE_CHAMADO}'
+        """,
+        timeout=120,
+    )
+    if not out.get("ok"):
+        raise RuntimeError(f"Falha ao listar partições: {out.get('error')}")
+    parts: Dict[str, Dict[str, Any]] = {}
+    df = out["df"]
+    for pid, rows, modified in zip(
+        df["partition_id"], df["total_rows"], df["last_modified_time"]
+    ):
+        pid = str(pid or "")
+        if len(pid) != 8 or not pid.isdigit():
+            continue  # __NULL__ / __UNPARTITIONED__
+        parts[f"{pid[:4]}-{pid[4:6]}-{pid[6:]}"] = {
+            "last_modified": str(modified),
+            "rows": int(rows or 0),
+        }
+    return parts
+
+
+def fetch_partition(day: str, columns: List[str]) -> pa.Table:
+    """Linhas de uma partição, só com as colunas projetadas."""
+    out = bq.execute(
+        f"SELECT {', '.join(columns)} FROM `{TAB_CHAMADO}` "
+        f"WHERE {PARTITION_KEY} = DATE '{day}'",
+        result_format="arrow",
+        timeout=600,
+    )
+    if not out.get("ok"):
+        raise RuntimeError(f"Falha ao baixar {day}: {out.get('error')}")
+    return out["table"].table
+
+
+def fetch_bairro() -> pa.Table:
+    out = bq.execute(
+        f"SELECT {', '.join(BAIRRO_COLUMNS)} FROM `{TAB_BAIRRO}`",
+        result_format="arrow",
+        timeout=120,
+    )
+    if not out.get("ok"):
+        raise RuntimeError(f"Falha ao baixar bairros: {out.get('error')}")
+    return out["table"].table
+
+
+# Escrita atômica e manifesto
+
+
+def _atomic_write_table(table: pa.Table, path: Path) -> None:
+    """Grava em `<path>.tmp-<pid>` (fora do glob *.parquet) e renomeia."""
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.tmp-{os.getpid()}-{threading.get_ident()}")
+    try:
+        pq.write_table(table, tmp, compression="zstd")
+        os.replace(tmp, path)
+    finally:
+        tmp.unlink(missing_ok=True)
+
+
+def _load_manifest(root: Path) -> Dict[str, Any]:
+    try:
+        return json.loads((root / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {"columns": [], "partitions": {}}
+
+
+def _save_manifest(root: Path, manifest: Dict[str, Any]) -> None:
+    root.mkdir(parents=True, exist_ok=True)
+    tmp = root / f".{MANIFEST}.tmp-{os.getpid()}"
+    tmp.write_text(json.dumps(manifest, indent=1, sort_keys=True), encoding="utf-8")
+    os.replace(tmp, root / MANIFEST)
+
+
+def _partition_file(root: Path, day: str) -> Path:
+    return root / f"{PARTITION_KEY}={day}" / "part-0.parquet"
+
+
+def plan_sync(
+    remote: Dict[str, Dict[str, Any]],
+    manifest: Dict[str, Any],
+    columns: List[str],
+    root: Path,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+) -> Dict[str, List[str]]:
+    """
+    Compara origem × manifesto local.
+
+    Returns
+    -------
+    dict
+        {"download": [...], "unchanged": [...], "stale": [...]} — "stale" são
+        partições locais ausentes na origem (removidas só com --prune).
+    """
+    local = manifest.get("partitions", {})
+    same_columns = manifest.get("columns") == columns
+    download, unchanged = [], []
+    for day in sorted(remote):
+        if (since and day < since) or (until and day > until):
+            continue
+        entry = local.get(day)
+        if (
+            same_columns
+            and entry is not None
+            and entry.get("last_modified") == remote[day]["last_modified"]
+            and entry.get("rows") == remote[day]["rows"]
+            and partition_complete(day, entry)
+            and _partition_file(root, day).exists()
+        ):
+            unchanged.append(day)
+        else:
+            download.append(day)
+    stale = sorted(d for d in local if d not in remote)
+    return {"download": download, "unchanged": unchanged, "stale": stale}
+
+
+def sync_partitions(
+    root: Path,
+    columns: List[str],
+    remote: Dict[str, Dict[str, Any]],
+    fetch: Callable[[str, List[str]], pa.Table],
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    workers: int = 4,
+    prune: bool = False,
+    plan_only: bool = False,
+    log=print,
+) -> Dict[str, Any]:
+    """
+    Núcleo incremental: baixa (`fetch(day, columns)`) só as partições novas ou
+    alteradas de `remote`, com escrita atômica e manifesto por partição.
+
+    Também usado pelo cubo de rollup (`scripts/build_cube.py`), que troca
+    `fetch` por uma agregação.
+
+    Returns
+    -------
+    dict
+        {"downloaded", "unchanged", "failed", "pruned", "rows"}
+    """
+    manifest = _load_manifest(root)
+    if manifest.get("columns") != columns:
+        # Projeção mudou: tudo que estiver no manifesto é baixado de novo
+        log(f"Projeção: {', '.join(columns)}")
+    plan = plan_sync(remote, manifest, columns, root, since=since, until=until)
+    log(
+        f"Partições: {len(plan['download'])} a baixar, {len(plan['unchanged'])} "
+        f"inalteradas, {len(plan['stale'])} ausentes na origem"
+    )
+    summary: Dict[str, Any] = {
+        "downloaded": [],
+        "unchanged": plan["unchanged"],
+        "failed": {},
+        "pruned": [],
+        "rows": 0,
+    }
+    if plan_only:
+        summary["planned"] = plan["download"]
+        return summary
+
+    if manifest.get("columns") != columns:
+        manifest = {"columns": columns, "partitions": {}}
+    manifest.setdefault("partitions", {})
+    manifest["since"] = since
+    # Partições da origem nesta execução (com a versão): quem lê o manifesto sabe
+    # quais dias faltam ou estão desatualizados (falha, orçamento, fora de
+    # --since/--until) em vez de supor contiguidade
+    manifest["source_partitions"] = {
+        day: remote[day].get("last_modified") for day in sorted(remote)
+    }
+    # Partições a baixar saem do manifesto antes do download: se falharem, ficam
+    # como pendentes em vez de manter a entrada da versão anterior
+    for day in plan["download"]:
+        manifest["partitions"].pop(day, None)
+    _save_manifest(root, manifest)
+    lock = threading.Lock()
+
+    def _one(day: str) -> int:
+        read_at = dt.datetime.now(dt.timezone.utc).isoformat()
+        table = fetch(day, columns)
+        _atomic_write_table(table, _partition_file(root, day))
+        with lock:
+            manifest["partitions"][day] = {
+                **remote[day],
+                "synced_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+                # Quando os dados foram lidos da origem (herdado do espelho,
+                # se a origem for ele): antes do fim do dia = partição parcial
+                "as_of": remote[day].get("as_of")
+                or remote[day].get("synced_at")
+                or read_at,
+            }
+            # Manifesto salvo a cada partição: retomada após interrupção
+            _save_manifest(root, manifest)
+        return table.num_rows
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=max(1, workers), thread_name_prefix="mirror"
+    ) as pool:
+        # Cada download herda a sessão de orçamento do chamador
+        futures = {
+            pool.submit(contextvars.copy_context().run, _one, day): day
+            for day in plan["download"]
+        }
+        for fut in concurrent.futures.as_completed(futures):
+            day = futures[fut]
+            try:
+                summary["rows"] += fut.result()
+                summary["downloaded"].append(day)
+                log(f"  ok {day}")
+            except Exception as e:
+                summary["failed"][day] = repr(e)
+                log(f"  falha {day}: {e!r}")
+
+    if prune:
+        for day in plan["stale"]:
+            shutil.rmtree(_partition_file(root, day).parent, ignore_errors=True)
+            manifest["partitions"].pop(day, None)
+            summary["pruned"].append(day)
+    _save_manifest(root, manifest)
+    summary["downloaded"].sort()
+    return summary
+
+
+def sync(
+    dest: Optional[str] = None,
+    since: Optional[str] = None,
+    until: Optional[str] = None,
+    workers: int = 4,
+    prune: bool = False,
+    plan_only: bool = False,
+    log=print,
+) -> Dict[str, Any]:
+    """
+    Sincroniza o espelho local.
+
+    Returns
+    -------
+    dict
+        {"downloaded", "unchanged", "failed", "pruned", "rows", "seconds"}
+    """
+    t0 = time.monotonic()
+    base = Path(dest or LOCAL_SNAPSHOT_DIR)
+    summary = sync_partitions(
+        base / TAB_CHAMADO,
+        mirror_columns(),
+        list_partitions(),
+        fetch_partition,
+        since=since,
+        until=until,
+        workers=workers,
+        prune=prune,
+        plan_only=plan_only,
+        log=log,
+    )
+    if not plan_only:
+        # Dimensão pequena: cópia integral a cada sincronização
+        try:
+            _atomic_write_table(fetch_bairro(), base / f"{TAB_BAIRRO}.parquet")
+        except Exception as e:
+            summary["failed"]["bairro"] = repr(e)
+            log(f"  falha bairro: {e!r}")
+    summary["seconds"] = time.monotonic() - t0
+    return summary
+
+
+# CLI
+
+
+def apply_budget(budget_gb: Optional[float]) -> None:
+    """
+    Fixa o orçamento de bytes por sessão desta execução (None mantém
+    BQ_SESSION_BUDGET_BYTES; 0 desliga). O do processo acompanha, para não
+    ficar abaixo do da sessão.
+    """
+    if budget_gb is None:
+        return
+    budget = int(budget_gb * 10**9)
+    bq.SESSION_BUDGET_BYTES = budget
+    if budget == 0 or 0 < bq.PROCESS_BUDGET_BYTES < budget:
+        bq.PROCESS_BUDGET_BYTES = budget
+
+
+def budget_hint(summary: Dict[str, Any], session: str) -> Optional[str]:
+    """Aviso quando alguma partição foi recusada pelo orçamento de bytes."""
+    if not any("Orçamento de bytes" in err for err in summary["failed"].values()):
+        return None
+    usage = bq.budget_usage(session)
+    return (
+        f"Orçamento da sessão '{session}' esgotado ({usage['session_bytes']:,} bytes "
+        f"na janela): rode de novo mais tarde para retomar, ou use --budget-gb."
+    )
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--dest", default=None, help="Diretório do snapshot local")
+    parser.add_argument("--since", default=None, help="Primeira partição (YYYY-MM-DD)")
+    parser.add_argument("--until", default=None, help="Última partição (YYYY-MM-DD)")
+    parser.add_argument("--workers", type=int, default=4, help="Downloads em paralelo")
+    parser.add_argument("--prune", action="store_true", help="Remove partições órfãs")
+    parser.add_argument("--plan", action="store_true", help="Só mostra o plano")
+    parser.add_argument(
+        "--budget-gb",
+        type=float,
+        default=None,
+        help="Orçamento da sessão em GB por janela (0 = sem limite)",
+    )
+    args = parser.parse_args(argv)
+
+    # O espelho já é o cache: não duplica as partições no cache de resultados
+    bq.RESULT_CACHE_ENABLED = False
+    apply_budget(args.budget_gb)
+    with bq.budget_session("mirror-sync"):
+        summary = sync(
+            dest=args.dest,
+            since=args.since,
+            until=args.until,
+            workers=args.workers,
+            prune=args.prune,
+            plan_only=args.plan,
+        )
+    print(
+        f"Concluído em {summary['seconds']:.1f}s: {len(summary['downloaded'])} "
+        f"partição(ões), {summary['rows']:,} linhas; {len(summary['failed'])} falha(s)."
+    )
+    hint = budget_hint(summary, "mirror-sync")
+    if hint:
+        print(hint)
+    return 1 if summary["failed"] else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,381 @@
+"""
+src/agent/categories.py
+-----------------------
+
+Dicionário de valores distintos das colunas categóricas de `chamado`
+(categoria, tipo, subtipo) e casamento local de termos do usuário.
+
+Com o dicionário, o gerador (`src.agent.nodes`) troca o filtro textual
+    (LOWER(subtipo) LIKE '%iluminação%' AND LOWER(subtipo) LIKE '%pública%') OR ...
+por igualdade sobre os valores já resolvidos:
+    subtipo IN ('Reparo de lâmpada apagada', ...) OR ...
+`match` usa a mesma regra do LIKE (todos os termos contidos no valor em
+minúsculas), então o resultado não muda enquanto o dicionário estiver em dia.
+Colunas de texto livre (descricao, titulo...) continuam com LIKE.
+
+Carga (sempre em segundo plano)
+-------------------------------
+A geração de SQL nunca espera pelo dicionário: sem ele, usa LIKE e agenda a
+carga. Fontes, da mais barata para a mais cara:
+1) cubo local (`src.agent.cube`): custo zero;
+2) espelho Parquet local (`scripts/sync_mirror.py`): custo zero;
+3) `SELECT DISTINCT` no backend ativo, limitado às partições dos últimos
+   AGENT_CATEGORY_LOOKBACK_DAYS dias e cobrado na sessão de orçamento
+   "categories" (não na de quem perguntou).
+Cada fonte registra desde quando cobre a tabela (`since`) e o último dia que
+viu completo (`through`: nunca o dia corrente nem partição lida antes do fim do
+dia, a mesma regra do cubo); janelas que começam antes de `since` ou terminam
+depois de `through` continuam com LIKE (um valor novo ainda não estaria no
+dicionário).
+
+Cache
+-----
+Memória + disco (um JSON por backend em AGENT_CATEGORY_DIR). Mais velho que
+AGENT_CATEGORY_TTL: servido e recarregado por uma thread em segundo plano.
+
+Configuração
+------------
+AGENT_CATEGORY_IN=1 liga o filtro IN no gerador (padrão: LIKE).
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import datetime as dt
+import json
+import os
+import threading
+import time
+
+from src.utils import backends, bq
+from src.utils.backends import get_backend
+from src.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+CATEGORY_IN_ENABLED = os.getenv("AGENT_CATEGORY_IN", "0") == "1"
+CATEGORY_COLUMNS = ("categoria", "tipo", "subtipo")
+CATEGORY_DIR = os.getenv(
+    "AGENT_CATEGORY_DIR",
+    str(Path(__file__).resolve().parents[2] / ".cache" / "categories"),
+)
+CATEGORY_TTL = float(os.getenv("AGENT_CATEGORY_TTL", str(24 * 3600)))
+# Partições lidas pela consulta de carga (só quando não há cubo/espelho)
+CATEGORY_LOOKBACK_DAYS = int(os.getenv("AGENT_CATEGORY_LOOKBACK_DAYS", "400"))
+CATEGORY_BUDGET_SESSION = "categories"
+# Acima disso, a coluna continua com LIKE (lista IN longa não compensa)
+CATEGORY_IN_MAX_VALUES = int(os.getenv("AGENT_CATEGORY_IN_MAX_VALUES", "200"))
+# Espera mínima entre tentativas após uma falha de carga
+_RETRY_AFTER = 300.0
+MANIFEST = "_manifest.json"
+
+
+# Casamento local
+
+
+def match(values: Sequence[str], terms: Sequence[str]) -> List[str]:
+    """
+    Valores que contêm todos os termos (sem diferenciar caixa) — a mesma regra
+    de `LOWER(col) LIKE '%t1%' AND LOWER(col) LIKE '%t2%'`.
+    """
+    needles = [t.lower() for t in terms if t and t.strip()]
+    if not needles:
+        return list(values)
+    return [v for v in values if all(n in v.lower() for n in needles)]
+
+
+# Fontes
+#   Cada uma devolve ({coluna: [valores]}, since, through) ou None quando não se
+#   aplica; since = primeiro dia coberto ("YYYY-MM-DD") ou None (tabela inteira);
+#   through = último dia completo coberto (None: desconhecido, nenhuma janela
+#   usa IN); um dia ainda em andamento pode receber valores novos até acabar.
+
+Values = Dict[str, List[str]]
+Found = Tuple[Values, Optional[str], Optional[str]]
+
+
+def _from_cube(columns: Sequence[str]) -> Optional[Found]:
+    """Valores distintos do cubo local (já em memória após a primeira carga)."""
+    from src.agent import cube
+
+    try:
+        index, info = cube.load_cube()
+    except Exception as e:
+        log.debug("categorias | cubo ilegível: %r", e)
+        return None
+    if index is None or not all(c in index.columns for c in columns):
+        return None
+    values = {
+        c: sorted(v for v in index.columns[c].values if v is not None) for c in columns
+    }
+    return values, info.get("since"), info.get("complete_through")
+
+
+def _from_mirror(columns: Sequence[str]) -> Optional[Found]:
+    """Valores distintos do espelho Parquet local (só as colunas pedidas)."""
+    import pyarrow.compute as pc
+    import pyarrow.dataset as ds
+
+    from src.agent import cube
+    from src.agent.nodes import TAB_CHAMADO
+
+    root = Path(backends.LOCAL_SNAPSHOT_DIR) / TAB_CHAMADO
+    try:
+        manifest = json.loads((root / MANIFEST).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    if not all(c in manifest.get("columns", []) for c in columns):
+        return None
+    table = ds.dataset(root, format="parquet", partitioning="hive").to_table(
+        columns=list(columns)
+    )
+    values = {
+        c: sorted(v for v in pc.unique(table.column(c)).to_pylist() if v is not None)
+        for c in columns
+    }
+    through = cube.complete_through(manifest.get("partitions") or {})
+    return values, manifest.get("since"), through
+
+
+def _from_backend(columns: Sequence[str]) -> Found:
+    """`SELECT DISTINCT` limitado por partição, na sessão de orçamento própria."""
+    from src.agent.nodes import TAB_CHAMADO, _profile
+
+    day_expr = _profile().day_expr
+    if day_expr is None:
+        raise RuntimeError("chamado sem coluna de data para limitar a carga")
+    # UTC, como CURRENT_DATE() do BigQuery
+    today = dt.datetime.now(dt.timezone.utc).date()
+    since = today - dt.timedelta(days=CATEGORY_LOOKBACK_DAYS)
+    sql = (
+        f"SELECT DISTINCT {', '.join(columns)} FROM `{TAB_CHAMADO}` "
+        f"WHERE {day_expr} >= DATE '{since:%Y-%m-%d}'"
+    )
+    with bq.budget_session(CATEGORY_BUDGET_SESSION):
+        out = get_backend().execute(sql)
+    if not out.get("ok"):
+        raise RuntimeError(f"Falha ao listar categorias: {out.get('error')}")
+    df = out["df"]
+    values = {c: sorted({str(v) for v in df[c].dropna()}) for c in columns}
+    # Hoje ainda recebe chamados: só até ontem o dicionário está completo
+    return values, since.isoformat(), (today - dt.timedelta(days=1)).isoformat()
+
+
+def _fetch(columns: Sequence[str]) -> Tuple[Found, str]:
+    for source, fn in (("cube", _from_cube), ("mirror", _from_mirror)):
+        try:
+            found = fn(columns)
+        except Exception as e:
+            log.debug("categorias | fonte %s falhou: %r", source, e)
+            found = None
+        if found is not None:
+            return found, source
+    return _from_backend(columns), get_backend().name
+
+
+# Cache em memória + disco
+
+_LOCK = threading.Lock()
+# backend → {"fetched_at", "source", "since", "through", "values": {coluna: [valores]}}
+_CACHE: Dict[str, Dict[str, Any]] = {}
+_REFRESHING: set = set()
+_FAILED_AT: Dict[str, float] = {}
+# (backend, fetched_at, colunas, termos) → {coluna: valores casados}
+_MATCHES: Dict[Tuple[Any, ...], Dict[str, List[str]]] = {}
+
+
+def _cache_path(backend: str) -> Path:
+    return Path(CATEGORY_DIR) / f"categories.{backend}.json"
+
+
+def _disk_get(backend: str) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(_cache_path(backend).read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _disk_put(backend: str, entry: Dict[str, Any]) -> None:
+    """Grava de forma atômica (tmp + os.replace); falhas de disco só são logadas."""
+    path = _cache_path(backend)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(entry, ensure_ascii=False), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        log.debug("categorias | falha ao gravar cache: %r", e)
+
+
+def _load(backend: str, columns: Sequence[str]) -> Dict[str, Any]:
+    (values, since, through), source = _fetch(columns)
+    entry = {
+        "fetched_at": time.time(),
+        "source": source,
+        "since": since,
+        "through": through,
+        "values": values,
+    }
+    with _LOCK:
+        _CACHE[backend] = entry
+        _FAILED_AT.pop(backend, None)
+    _disk_put(backend, entry)
+    log.info(
+        "categorias | dicionário carregado (%s, de %s a %s): %s",
+        source,
+        since or "o início",
+        through or "?",
+        {c: len(v) for c, v in values.items()},
+    )
+    return entry
+
+
+def _refresh(backend: str, columns: Sequence[str]) -> None:
+    try:
+        _load(backend, columns)
+    except Exception as e:
+        # Mantém a cópia antiga (se houver); nova tentativa após _RETRY_AFTER
+        log.warning("categorias | carga falhou; seguindo com LIKE. err=%r", e)
+        with _LOCK:
+            _FAILED_AT[backend] = time.time()
+    finally:
+        with _LOCK:
+            _REFRESHING.discard(backend)
+
+
+def _schedule_refresh(backend: str, columns: Sequence[str]) -> None:
+    with _LOCK:
+        if backend in _REFRESHING:
+            return
+        if time.time() - _FAILED_AT.get(backend, 0.0) < _RETRY_AFTER:
+            return
+        _REFRESHING.add(backend)
+    threading.Thread(
+        target=_refresh,
+        args=(backend, tuple(columns)),
+        name="categories-refresh",
+        daemon=True,
+    ).start()
+
+
+def _columns(columns: Sequence[str]) -> Tuple[str, ...]:
+    return tuple(c for c in CATEGORY_COLUMNS if c in columns)
+
+
+def get_dictionary(
+    columns: Sequence[str] = CATEGORY_COLUMNS,
+) -> Optional[Dict[str, Any]]:
+    """
+    Dicionário de valores distintos do backend ativo, sem bloquear.
+
+    Ausente (ou sem alguma das colunas, ou gravado sem `through`), agenda a
+    carga em segundo plano e devolve None; vencido, é servido e recarregado em
+    segundo plano.
+
+    Parameters
+    ----------
+    columns : Sequence[str]
+        Colunas categóricas presentes no schema (subconjunto de CATEGORY_COLUMNS).
+
+    Returns
+    -------
+    dict | None
+        {"fetched_at": float, "source": "cube"|"mirror"|backend,
+         "since": "YYYY-MM-DD"|None, "through": "YYYY-MM-DD"|None,
+         "values": {coluna: [valores]}}
+        ou None se ainda não houver dicionário (quem chama usa LIKE).
+    """
+    columns = _columns(columns)
+    if not columns:
+        return None
+    backend = get_backend().name
+    with _LOCK:
+        entry = _CACHE.get(backend)
+    if entry is None:
+        entry = _disk_get(backend)
+        if entry is not None:
+            with _LOCK:
+                entry = _CACHE.setdefault(backend, entry)
+    if (
+        entry is None
+        or "through" not in entry
+        or not all(c in entry["values"] for c in columns)
+    ):
+        _schedule_refresh(backend, columns)
+        return None
+    if time.time() - entry["fetched_at"] >= CATEGORY_TTL:
+        _schedule_refresh(backend, columns)
+    return entry
+
+
+def load_dictionary(
+    columns: Optional[Sequence[str]] = None,
+) -> Optional[Dict[str, Any]]:
+    """
+    Carrega o dicionário agora (scripts e testes; nunca no caminho da pergunta).
+    Sem `columns`, usa as colunas de texto do perfil de schema do gerador.
+    Devolve None se nenhuma fonte funcionar.
+    """
+    try:
+        if columns is None:
+            from src.agent.nodes import _profile
+
+            columns = _profile().text_columns
+        columns = _columns(columns)
+        if not columns:
+            return None
+        return _load(get_backend().name, columns)
+    except Exception as e:
+        log.warning("categorias | dicionário indisponível: %r", e)
+        return None
+
+
+def resolve_terms(
+    columns: Sequence[str],
+    terms: Sequence[str],
+    start: Optional[dt.date] = None,
+    end: Optional[dt.date] = None,
+) -> Optional[Dict[str, List[str]]]:
+    """
+    {coluna: valores exatos que casam com os termos}, para as colunas do
+    dicionário dentre `columns`. None sem dicionário ou quando a janela da
+    consulta ([start, end); start None = sem limite, end None = até hoje em UTC)
+    sai do que o dicionário cobre. Memorizado por versão do dicionário.
+    """
+    entry = get_dictionary(columns)
+    if entry is None:
+        return None
+    since = entry.get("since")
+    if since and (start is None or start < dt.date.fromisoformat(since)):
+        return None
+    last_day = (
+        end - dt.timedelta(days=1)
+        if end is not None
+        else dt.datetime.now(dt.timezone.utc).date()
+    )
+    through = entry.get("through")
+    if through is None or last_day > dt.date.fromisoformat(through):
+        return None
+    cols = tuple(c for c in columns if c in entry["values"])
+    key = (get_backend().name, entry["fetched_at"], cols, tuple(terms))
+    with _LOCK:
+        cached = _MATCHES.get(key)
+    if cached is None:
+        cached = {c: match(entry["values"][c], terms) for c in cols}
+        with _LOCK:
+            if len(_MATCHES) > 1024:
+                _MATCHES.clear()
+            _MATCHES[key] = cached
+    return cached
+
+
+def clear_dictionary(disk: bool = False) -> None:
+    """Limpa o dicionário em memória (e, com `disk=True`, os arquivos persistidos)."""
+    with _LOCK:
+        _CACHE.clear()
+        _MATCHES.clear()
+        _FAILED_AT.clear()
+    if disk:
+        for path in Path(CATEGORY_DIR).glob("categories.*.json"):
+            path.unlink(missing_ok=True)
@@ -0,0 +1,257 @@
+"""
+src/agent/cube.py
+-----------------
+
+Cubo de rollup diário de `chamado`: uma linha por combinação
+dia × dimensões do gerador (subtipo, tipo, id_bairro, unidade...), com
+`n = COUNT(1)`. Os templates do gerador são somas sobre essas linhas, então o
+cubo responde sem varrer a tabela de fatos.
+
+Layout (mesmo do espelho local, `scripts/sync_mirror.py`)
+--------------------------------------------------------
+<AGENT_CUBE_DIR>/datario.adm_central_atendimento_1746.chamado/
+    _manifest.json                      (partições de origem já agregadas)
+    data_particao=2024-11-28/part-0.parquet
+<AGENT_CUBE_DIR>/datario.dados_mestres.bairro.parquet
+
+A construção é incremental por partição (`python scripts/build_cube.py`); aqui
+ficam a agregação de uma partição e a camada de resposta.
+
+Camada de resposta
+------------------
+`answer_from_cube(template)` devolve a tabela no formato do SQL gerado, ou o
+motivo para cair no BigQuery (cubo ausente/desligado, template fora do cubo,
+manifesto sem a lista de partições da origem, algum dia da janela não agregado
+— falha ou recusa de orçamento na construção, versão da origem mais nova que a
+agregada, ou dia lido antes de terminar, como o de hoje — ou janela além da
+data de atualização + AGENT_CUBE_MAX_LAG_DAYS).
+
+Configuração
+------------
+AGENT_CUBE=1 liga o cubo (padrão: desligado, para um cubo parcial ou de teste
+nunca responder perguntas reais); AGENT_CUBE_DIR muda o diretório.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+import datetime as dt
+import json
+import os
+import threading
+
+import pyarrow as pa
+
+from src.agent.index import ChamadoIndex
+from src.agent.nodes import TAB_CHAMADO
+from src.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+CUBE_ENABLED = os.getenv("AGENT_CUBE", "0") == "1"
+CUBE_DIR = os.getenv(
+    "AGENT_CUBE_DIR",
+    str(Path(__file__).resolve().parents[2] / ".cache" / "cube"),
+)
+# Dias que a janela de um template pode passar da última partição do cubo
+CUBE_MAX_LAG_DAYS = int(os.getenv("AGENT_CUBE_MAX_LAG_DAYS", "2"))
+COUNT_COLUMN = "n"
+MANIFEST = "_manifest.json"
+
+
+# Agregação
+
+
+def rollup_sql(day: str, dims: List[str]) -> str:
+    """GROUP BY de uma partição no BigQuery (só agregados trafegam)."""
+    cols = ", ".join(dims)
+    return (
+        f"SELECT {cols}, COUNT(1) AS {COUNT_COLUMN} FROM `{TAB_CHAMADO}` "
+        f"WHERE data_particao = DATE '{day}' GROUP BY {cols}"
+    )
+
+
+def rollup_table(table: pa.Table, dims: List[str]) -> pa.Table:
+    """Mesmo GROUP BY de `rollup_sql`, sobre linhas já locais (espelho)."""
+    out = table.select(dims).group_by(dims).aggregate([([], "count_all")])
+    return out.rename_columns(dims + [COUNT_COLUMN]).cast(
+        pa.schema([*(out.schema.field(d) for d in dims), (COUNT_COLUMN, pa.int64())])
+    )
+
+
+# Carga (memorizada pelo mtime do manifesto)
+
+_LOCK = threading.Lock()
+_LOADED: Dict[str, Any] = {"key": None, "cube": None, "info": None}
+
+
+def partition_complete(day: str, entry: Dict[str, Any]) -> bool:
+    """
+    True se a partição `day` do manifesto foi lida da origem depois do fim do
+    dia (UTC); antes disso (ex.: a de hoje) pode faltar chamados.
+    """
+    as_of = entry.get("as_of") or entry.get("synced_at")
+    if not as_of:
+        return False
+    day_end = dt.datetime.combine(
+        dt.date.fromisoformat(day) + dt.timedelta(days=1),
+        dt.time(),
+        tzinfo=dt.timezone.utc,
+    )
+    return dt.datetime.fromisoformat(as_of) >= day_end
+
+
+def complete_through(partitions: Dict[str, Dict[str, Any]]) -> Optional[str]:
+    """Última partição do manifesto completa (`partition_complete`), ou None."""
+    return max(
+        (day for day, p in partitions.items() if partition_complete(day, p)),
+        default=None,
+    )
+
+
+def cube_info(cube_dir: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """
+    Metadados do cubo a partir do manifesto.
+
+    Returns
+    -------
+    dict | None
+        {"fresh_through": "YYYY-MM-DD", "complete_through": "YYYY-MM-DD"|None
+         (última partição lida depois do fim do dia), "built_at": ISO, "partitions": int,
+         "since": "YYYY-MM-DD"|None, "missing": [dias da origem não agregados,
+         agregados de uma versão anterior ou lidos antes do fim do dia (hoje)]
+         | None (manifesto sem `source_partitions` por dia: cobertura desconhecida)}
+    """
+    try:
+        path = Path(cube_dir or CUBE_DIR) / TAB_CHAMADO / MANIFEST
+        manifest = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+    parts = manifest.get("partitions") or {}
+    if not parts:
+        return None
+    source = manifest.get("source_partitions")
+    missing = None
+    if isinstance(source, dict):
+        covered = {
+            day
+            for day, p in parts.items()
+            if source.get(day) == p.get("last_modified") and partition_complete(day, p)
+        }
+        missing = sorted(set(source) - covered)
+    return {
+        "missing": missing,
+        "fresh_through": max(parts),
+        "complete_through": complete_through(parts),
+        "built_at": max((p.get("synced_at") or "") for p in parts.values()) or None,
+        "partitions": len(parts),
+        "since": manifest.get("since"),
+    }
+
+
+def load_cube(
+    cube_dir: Optional[str] = None,
+) -> Tuple[Optional[ChamadoIndex], Optional[Dict[str, Any]]]:
+    """Cubo em memória (recarregado quando o manifesto muda) e seus metadados."""
+    base = Path(cube_dir or CUBE_DIR)
+    manifest = base / TAB_CHAMADO / MANIFEST
+    try:
+        key = (str(base), manifest.stat().st_mtime_ns)
+    except OSError:
+        return None, None
+    with _LOCK:
+        if _LOADED["key"] != key:
+            info = cube_info(str(base))
+            cube = None
+            if info is not None:
+                since = dt.date.fromisoformat(info["since"]) if info["since"] else None
+                cube = ChamadoIndex.from_mirror(
+                    str(base), since=since, weight_column=COUNT_COLUMN, source="cube"
+                )
+            _LOADED.update(key=key, cube=cube, info=info)
+        return _LOADED["cube"], _LOADED["info"]
+
+
+def clear_cube() -> None:
+    """Descarta o cubo carregado (testes/hot-reload)."""
+    with _LOCK:
+        _LOADED.update(key=None, cube=None, info=None)
+
+
+# Camada de resposta
+
+
+def answer_from_cube(
+    template: Optional[Dict[str, Any]], cube_dir: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Responde um template do gerador pelo cubo.
+
+    Returns
+    -------
+    dict
+        {"ok": bool, "table": pyarrow.Table|None, "fresh_through": str|None,
+         "built_at": str|None, "reason": str|None}
+    """
+    out: Dict[str, Any] = {
+        "ok": False,
+        "table": None,
+        "fresh_through": None,
+        "built_at": None,
+        "reason": None,
+    }
+    if not CUBE_ENABLED:
+        out["reason"] = "cubo desligado (AGENT_CUBE=0)"
+        return out
+    if not template:
+        out["reason"] = "consulta sem template"
+        return out
+    try:
+        cube, info = load_cube(cube_dir)
+    except Exception as e:
+        log.warning("Cubo ilegível; usando BigQuery. err=%r", e)
+        out["reason"] = f"cubo ilegível: {e!r}"
+        return out
+    if cube is None:
+        out["reason"] = "cubo ausente"
+        return out
+    out["fresh_through"] = info["fresh_through"]
+    out["built_at"] = info["built_at"]
+
+    # Janela aberta termina hoje (UTC, como CURRENT_DATE() do BigQuery)
+    end = template.get("end")
+    last_needed = (
+        dt.date.fromisoformat(end) - dt.timedelta(days=1)
+        if end
+        else dt.datetime.now(dt.timezone.utc).date()
+    )
+    if info["missing"] is None:
+        out["reason"] = "manifesto sem partições da origem (reconstrua o cubo)"
+        return out
+    start = template.get("start")
+    gaps = [
+        d
+        for d in info["missing"]
+        if (start is None or d >= start) and d <= last_needed.isoformat()
+    ]
+    if gaps:
+        out["reason"] = (
+            f"cubo incompleto ({len(gaps)} partição(ões) da janela sem agregar, "
+            f"ex.: {gaps[0]})"
+        )
+        return out
+    lag = (last_needed - dt.date.fromisoformat(info["fresh_through"])).days
+    if lag > CUBE_MAX_LAG_DAYS:
+        out["reason"] = (
+            f"cubo desatualizado ({lag} dias além de {info['fresh_through']})"
+        )
+        return out
+
+    table = cube.answer(template)
+    if table is None:
+        out["reason"] = "template fora do cubo"
+        return out
+    out["ok"] = True
+    out["table"] = table
+    return out
@@ -16,6 +16,7 @@ Princípios de projeto
 Dependências
 ------------
 - Funções de negócio em `src.agent.nodes`.
+- Cubo de rollup local em `src.agent.cube` (responde templates sem BigQuery).
 - Logger opcional em `src.utils.logger.get_logger` (com fallback).
 """
 
@@ -52,6 +53,8 @@ from src.agent.nodes import (
     synthesize,
     chitchat,
 )
+from src.agent.cube import answer_from_cube
+from src.utils.bq import ArrowResult
 
 __all__ = [
     "AgentState",
@@ -62,7 +65,7 @@ __all__ = [
     "reset_graph",
 ]
 
-GRAPH_VERSION = "1.3.1"
+GRAPH_VERSION = "1.4.0"
 
 
 class AgentState(TypedDict, total=False):
@@ -77,12 +80,17 @@ class AgentState(TypedDict, total=False):
         Intenção classificada pelo roteador: "data" | "chitchat".
     sql : str
         SQL gerado (quando intent = "data").
+    template : dict
+        Forma estruturada do SQL gerado (ver `nodes._template`), usada pelo cubo.
     validation_ok : bool
         Resultado do dry-run (True se válido).
     validation_error : Optional[str]
         Erro de validação/execução (quando houver).
+    validation_token : Optional[str]
+        Token do dry-run aprovado; permite ao executor não repetir o dry-run.
     df : object
-        Resultado tabular (por ex. pandas.DataFrame) da execução do SQL.
+        Resultado tabular da execução do SQL: `ArrowResult` (pyarrow.Table com
+        `.to_pandas()` sob demanda) no grafo; pandas.DataFrame em chamadas diretas.
     answer : str
         Resposta final em linguagem natural.
     meta : dict
@@ -92,8 +100,10 @@ class AgentState(TypedDict, total=False):
     question: str
     intent: str
     sql: str
+    template: Dict[str, Any]
     validation_ok: bool
     validation_error: Optional[str]
+    validation_token: Optional[str]
     df: object
     answer: str
     meta: Dict[str, Any]
@@ -149,10 +159,12 @@ def _node_sql_gen(state: AgentState) -> AgentState:
     """
     q = (state.get("question") or "").strip()
     sql = ""
+    template = None
 
     try:
         g = generate_sql(q)
         sql = (g or {}).get("sql", "") or ""
+        template = (g or {}).get("template")
     except Exception as e:
         _log.exception("SQL Gen | erro no generate_sql: %r", e)
 
@@ -164,10 +176,50 @@ def _node_sql_gen(state: AgentState) -> AgentState:
         _log.info("SQL Gen | sql=%s", safe_sql_preview)
 
     state["sql"] = sql
+    state["template"] = template
     state.setdefault("meta", {})["sql_preview"] = safe_sql_preview
     return state
 
 
+def _node_cube(state: AgentState) -> AgentState:
+    """
+    Tenta responder pelo cubo de rollup local, antes de qualquer ida ao BigQuery.
+
+    Define:
+        - state["meta"]["cube_fresh_through"] / ["cube_built_at"] (quando há cubo)
+        - Em acerto: state["df"], validation_ok=True, meta["query_path"]="cube"
+        - Em erro/falta: meta["cube_miss"] com o motivo; o fluxo segue para o dry-run
+    """
+    meta = state.setdefault("meta", {})
+    try:
+        out = answer_from_cube(state.get("template"))
+    except Exception as e:
+        _log.exception("Cube | erro: %r", e)
+        out = {"ok": False, "reason": f"exceção: {e!r}"}
+
+    meta["cube_fresh_through"] = out.get("fresh_through")
+    meta["cube_built_at"] = out.get("built_at")
+    if not out.get("ok"):
+        meta["cube_miss"] = out.get("reason")
+        _log.info("Cube | miss | %s", out.get("reason"))
+        return state
+
+    df = ArrowResult(out["table"])
+    state["df"] = df
+    state["validation_ok"] = True
+    state["validation_error"] = None
+    meta["dry_run_bytes"] = None
+    meta["query_path"] = "cube"
+    meta["read_path"] = "local"
+    meta["df_shape"] = df.shape
+    _log.info(
+        "Cube | hit | df_shape=%s | fresh_through=%s",
+        df.shape,
+        out.get("fresh_through"),
+    )
+    return state
+
+
 def _node_sql_validate(state: AgentState) -> AgentState:
     """
     Valida o SQL via dry-run. Se falhar, o fluxo seguirá para síntese
@@ -176,12 +228,17 @@ def _node_sql_validate(state: AgentState) -> AgentState:
     Define:
         - state["validation_ok"] (bool)
         - state["validation_error"] (str | None)
+        - state["validation_token"] (str | None)
         - state["meta"]["dry_run_bytes"] (int | None)
+        - state["meta"]["estimated_bytes"] / ["estimate_drift_pct"] (modelo local
+          de custo e seu desvio em relação ao dry-run)
     """
     sql = state.get("sql") or ""
     ok = False
     err = None
     dry_run_bytes = None
+    token = None
+    v = None
 
     if not sql.strip():
         err = "SQL ausente após geração."
@@ -192,6 +249,7 @@ def _node_sql_validate(state: AgentState) -> AgentState:
             ok = bool((v or {}).get("ok"))
             err = (v or {}).get("error")
             dry_run_bytes = (v or {}).get("dry_run_bytes")
+            token = (v or {}).get("validation_token")
         except Exception as e:
             ok = False
             err = f"Exceção no validate_sql: {e!r}"
@@ -199,7 +257,11 @@ def _node_sql_validate(state: AgentState) -> AgentState:
 
     state["validation_ok"] = ok
     state["validation_error"] = err
-    state.setdefault("meta", {})["dry_run_bytes"] = dry_run_bytes
+    state["validation_token"] = token
+    meta = state.setdefault("meta", {})
+    meta["dry_run_bytes"] = dry_run_bytes
+    meta["estimated_bytes"] = (v or {}).get("estimated_bytes")
+    meta["estimate_drift_pct"] = (v or {}).get("estimate_drift_pct")
 
     _log.info(
         "Validate | ok=%s | dry_run_bytes=%s | err=%s",
@@ -217,6 +279,12 @@ def _node_sql_exec(state: AgentState) -> AgentState:
     Define:
         - state["df"] (objeto tabular) quando sucesso.
         - state["meta"]["df_shape"] (tuple | None)
+        - state["meta"]["read_path"] / ["read_ms"] (leitura REST, Storage ou cache)
+        - state["meta"]["query_path"] ("fast" = jobs.query | "job" = fluxo completo)
+        - state["meta"]["job_id"], ["job_elapsed_ms"], ["job_stats"] (cache_hit,
+          bytes faturados, slot_millis, fila × execução, estágios do plano)
+        - state["meta"]["retries"] / ["backoff_ms"] (retentativas de erros transitórios)
+        - state["meta"]["queue_wait_ms"] (espera no controle de admissão)
         - Em caso de falha, marca validation_ok=False e preenche validation_error.
     """
     if not state.get("validation_ok"):
@@ -231,11 +299,27 @@ def _node_sql_exec(state: AgentState) -> AgentState:
         _log.warning("Execute | SQL vazio; abortando.")
         return state
 
+    # Reaproveita o dry-run do nó de validação (o executor confere o token)
+    validation = {
+        "ok": True,
+        "dry_run_bytes": state.get("meta", {}).get("dry_run_bytes"),
+        "validation_token": state.get("validation_token"),
+    }
+
     try:
-        out = execute_sql(sql) or {}
+        out = execute_sql(sql, validation=validation, result_format="arrow") or {}
         ok = bool(out.get("ok"))
         state["df"] = out.get("df")
 
+        # Estatísticas do job (também em falhas, p.ex. timeout): onde o tempo foi gasto
+        meta = state.setdefault("meta", {})
+        meta["job_id"] = out.get("job_id")
+        meta["job_elapsed_ms"] = out.get("elapsed_ms")
+        meta["job_stats"] = out.get("job_stats")
+        meta["retries"] = out.get("retries", 0)
+        meta["backoff_ms"] = out.get("backoff_ms", 0.0)
+        meta["queue_wait_ms"] = out.get("queue_wait_ms")
+
         if not ok:
             state["validation_ok"] = False
             state["validation_error"] = (
@@ -248,8 +332,18 @@ def _node_sql_exec(state: AgentState) -> AgentState:
             # Evita log gigante
             df = state.get("df")
             shape = getattr(df, "shape", None)
-            state.setdefault("meta", {})["df_shape"] = shape
-            _log.info("Execute | ok | df_shape=%s", shape)
+            meta = state.setdefault("meta", {})
+            meta["df_shape"] = shape
+            meta["read_path"] = out.get("read_path")
+            meta["read_ms"] = out.get("read_ms")
+            meta["query_path"] = out.get("query_path")
+            _log.info(
+                "Execute | ok | df_shape=%s | path=%s | read=%s (%s ms)",
+                shape,
+                out.get("query_path"),
+                out.get("read_path"),
+                None if out.get("read_ms") is None else round(out["read_ms"], 1),
+            )
     except Exception as e:
         state["validation_ok"] = False
         state["validation_error"] = f"Exceção no execute_sql: {e!r}"
@@ -288,7 +382,7 @@ def _node_synth(state: AgentState) -> AgentState:
         except Exception as e:
             _log.exception("Synth | erro em synthesize: %r", e)
             state["answer"] = (
-                "Ocorreu um erro ao sintetizar a resposta. " f"Detalhes: {e!r}"
+                f"Ocorreu um erro ao sintetizar a resposta. Detalhes: {e!r}"
             )
 
     # Fechamento de latência
@@ -354,6 +448,7 @@ def build_graph():
     # Registra nós
     g.add_node("router", _node_router)
     g.add_node("sql_gen", _node_sql_gen)
+    g.add_node("cube", _node_cube)
     g.add_node("sql_validate", _node_sql_validate)
     g.add_node("sql_exec", _node_sql_exec)
     g.add_node("synth", _node_synth)
@@ -370,7 +465,12 @@ def build_graph():
     )
 
     # Branch de dados
-    g.add_edge("sql_gen", "sql_validate")
+    g.add_edge("sql_gen", "cube")
+    g.add_conditional_edges(
+        "cube",
+        lambda s: "hit" if s.get("meta", {}).get("query_path") == "cube" else "miss",
+        {"hit": "synth", "miss": "sql_validate"},
+    )
     g.add_conditional_edges(
         "sql_validate",
         lambda s: "ok" if s.get("validation_ok") else "fail",
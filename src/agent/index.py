@@ -0,0 +1,452 @@
+"""
+src/agent/index.py
+------------------
+
+Índice colunar em memória sobre `chamado`, para responder os templates do
+gerador (`generate_sql(...)["template"]`) sem varrer o BigQuery.
+
+Estrutura
+---------
+- `days`: int32 com o dia (dias desde 1970-01-01) de cada chamado, com as
+  linhas ordenadas por dia → janelas de data viram fatias (`searchsorted`).
+- Colunas textuais (subtipo, tipo, bairro, unidade...) codificadas em
+  dicionário: `codes` (uint8/uint16/int32) + lista de valores distintos.
+- Filtros LIKE são avaliados uma vez por valor distinto do dicionário (não por
+  linha); a seleção de linhas é um lookup vetorizado `match[codes]`.
+- Agregações por `np.bincount` sobre os códigos; JOIN com bairros é um mapa
+  código → nome aplicado antes do bincount.
+- Linhas podem ter peso (`weights`): o cubo de rollup (`src.agent.cube`) usa a
+  mesma estrutura com uma linha por combinação dia × dimensões e peso = COUNT.
+
+Fontes
+------
+- Espelho local (`scripts/sync_mirror.py`, layout Hive em LOCAL_SNAPSHOT_DIR).
+- BigQuery (projeção das colunas do gerador; opcionalmente só a partir de `since`).
+
+Memória
+-------
+AGENT_INDEX_MAX_BYTES limita o tamanho do índice (padrão 512 MiB). A carga é
+recusada antes de ler os dados quando a estimativa (linhas × largura máxima)
+passa do limite, e novamente após a codificação com o tamanho real.
+
+Benchmark contra o BigQuery: `python scripts/bench_index.py`.
+"""
+
+from __future__ import annotations
+
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+import datetime as dt
+import os
+import time
+
+import numpy as np
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.agent.nodes import GENERATOR_COLUMNS, TAB_BAIRRO, TAB_CHAMADO
+from src.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+INDEX_MAX_BYTES = int(os.getenv("AGENT_INDEX_MAX_BYTES", str(512 * 1024**2)))
+
+_EPOCH = dt.date(1970, 1, 1)
+# Linhas sem data: antes de qualquer dia válido (entram só em janelas abertas)
+_NO_DAY = np.iinfo(np.int32).min
+# Largura máxima por linha usada na estimativa prévia: dia + códigos int32
+_ROW_BYTES_UPPER = 4
+
+
+def _day_number(value: Optional[str]) -> Optional[int]:
+    """ "YYYY-MM-DD" → dias desde 1970-01-01."""
+    if value is None:
+        return None
+    return (dt.date.fromisoformat(value) - _EPOCH).days
+
+
+def _code_dtype(n: int) -> np.dtype:
+    """Menor inteiro que comporta `n` códigos."""
+    if n <= np.iinfo(np.uint8).max:
+        return np.dtype(np.uint8)
+    if n <= np.iinfo(np.uint16).max:
+        return np.dtype(np.uint16)
+    return np.dtype(np.int32)
+
+
+# Coluna codificada em dicionário
+
+
+class _Encoded:
+    """
+    Coluna textual codificada: `codes[i]` indexa `values`.
+
+    O último valor é sempre `None` (código dos nulos), para que GROUP BY e LIKE
+    sigam a semântica SQL (nulo forma grupo próprio e nunca casa com LIKE).
+    """
+
+    __slots__ = ("codes", "values", "_lower")
+
+    def __init__(self, codes: np.ndarray, values: List[Optional[str]]):
+        self.codes = codes
+        self.values = values
+        self._lower = [None if v is None else v.lower() for v in values]
+
+    @classmethod
+    def from_arrow(cls, column: pa.ChunkedArray, order: np.ndarray) -> "_Encoded":
+        arr = pc.cast(column, pa.string()).combine_chunks()
+        enc = arr.dictionary_encode()
+        values = enc.dictionary.to_pylist() + [None]
+        codes = enc.indices.fill_null(len(values) - 1).to_numpy(zero_copy_only=False)
+        return cls(codes[order].astype(_code_dtype(len(values))), values)
+
+    @property
+    def nbytes(self) -> int:
+        return int(self.codes.nbytes) + sum(len(v or "") + 49 for v in self.values)
+
+    def like_all(self, terms: Sequence[str]) -> np.ndarray:
+        """Máscara por código: LOWER(col) LIKE '%t%' para todos os termos."""
+        return np.fromiter(
+            (v is not None and all(t in v for t in terms) for v in self._lower),
+            dtype=bool,
+            count=len(self.values),
+        )
+
+
+# Índice
+
+
+class ChamadoIndex:
+    """
+    Índice em memória de `chamado` (ver docstring do módulo).
+
+    Atributos
+    ---------
+    days : np.ndarray[int32]
+        Dia de cada linha, em ordem crescente.
+    columns : dict[str, _Encoded]
+        Colunas textuais codificadas.
+    weights : np.ndarray | None
+        Contagem representada por cada linha (None = 1 por linha).
+    bairro_names : list[str]
+        Nomes da dimensão de bairros (grupo "bairro").
+    first_day, last_day : datetime.date | None
+        Cobertura de dias carregada; `since` marca o corte inferior da carga.
+    """
+
+    def __init__(
+        self,
+        days: np.ndarray,
+        columns: Dict[str, _Encoded],
+        bairro: Optional[Tuple[List[str], np.ndarray]] = None,
+        since: Optional[dt.date] = None,
+        source: str = "memory",
+        weights: Optional[np.ndarray] = None,
+    ):
+        self.days = days
+        self.columns = columns
+        self.weights = weights
+        self.since = since
+        self.source = source
+        self.loaded_at = time.time()
+        # (nomes distintos, mapa código de id_bairro → índice do nome | -1)
+        self.bairro_names, self._bairro_map = bairro or ([], None)
+        valid = days[days != _NO_DAY]
+        self.first_day = (
+            _EPOCH + dt.timedelta(days=int(valid[0])) if valid.size else None
+        )
+        self.last_day = (
+            _EPOCH + dt.timedelta(days=int(valid[-1])) if valid.size else None
+        )
+
+    def __len__(self) -> int:
+        return int(self.days.size)
+
+    @property
+    def nbytes(self) -> int:
+        extra = 0 if self._bairro_map is None else int(self._bairro_map.nbytes)
+        extra += 0 if self.weights is None else int(self.weights.nbytes)
+        return (
+            int(self.days.nbytes) + sum(c.nbytes for c in self.columns.values()) + extra
+        )
+
+    # Construção
+
+    @classmethod
+    def from_arrow(
+        cls,
+        table: pa.Table,
+        bairro: Optional[pa.Table] = None,
+        since: Optional[dt.date] = None,
+        max_bytes: Optional[int] = None,
+        source: str = "memory",
+        weight_column: Optional[str] = None,
+    ) -> "ChamadoIndex":
+        """
+        Constrói o índice a partir das linhas de `chamado` (Arrow).
+
+        O dia vem de `data_particao` (ou `DATE(data_inicio)`); as demais colunas
+        do gerador presentes em `table` são codificadas em dicionário.
+        `bairro` (id_bairro, nome) habilita o grupo "bairro"; `weight_column`
+        (p.ex. "n" de um rollup) dá a contagem de cada linha.
+        """
+        limit = INDEX_MAX_BYTES if max_bytes is None else max_bytes
+        if "data_particao" in table.column_names:
+            day_col = pc.cast(table.column("data_particao"), pa.date32())
+        elif "data_inicio" in table.column_names:
+            day_col = pc.cast(table.column("data_inicio"), pa.timestamp("us"))
+            day_col = pc.cast(day_col, pa.date32())
+        else:
+            raise ValueError("Índice requer data_particao ou data_inicio.")
+        days = (
+            pc.cast(day_col, pa.int32())
+            .fill_null(_NO_DAY)
+            .to_numpy()
+            .astype(np.int32, copy=False)
+        )
+        order = np.argsort(days, kind="stable")
+        columns = {
+            name: _Encoded.from_arrow(table.column(name), order)
+            for name in GENERATOR_COLUMNS
+            if name in table.column_names
+            and name not in ("data_particao", "data_inicio")
+        }
+        join = None
+        if bairro is not None and "id_bairro" in columns:
+            join = _bairro_join(columns["id_bairro"], bairro)
+        weights = None
+        if weight_column is not None:
+            w = table.column(weight_column).fill_null(0).to_numpy()
+            weights = w[order].astype(np.int64)
+        index = cls(
+            days[order],
+            columns,
+            bairro=join,
+            since=since,
+            source=source,
+            weights=weights,
+        )
+        if index.nbytes > limit:
+            raise MemoryError(
+                f"Índice ocupa {index.nbytes:,} bytes (limite AGENT_INDEX_MAX_BYTES={limit:,})."
+            )
+        log.info(
+            "Índice carregado (%s): %d linhas, %d colunas, %.1f MiB",
+            source,
+            len(index),
+            len(columns),
+            index.nbytes / 1024**2,
+        )
+        return index
+
+    @classmethod
+    def from_mirror(
+        cls,
+        snapshot_dir: Optional[str] = None,
+        since: Optional[dt.date] = None,
+        max_bytes: Optional[int] = None,
+        weight_column: Optional[str] = None,
+        source: str = "mirror",
+    ) -> "ChamadoIndex":
+        """Carrega do espelho local Parquet (layout de `scripts/sync_mirror.py`)."""
+        import pyarrow.dataset as ds
+
+        from src.utils.backends import LOCAL_SNAPSHOT_DIR
+
+        base = Path(snapshot_dir or LOCAL_SNAPSHOT_DIR)
+        dataset = ds.dataset(
+            str(base / TAB_CHAMADO),
+            format="parquet",
+            partitioning=ds.partitioning(
+                pa.schema([("data_particao", pa.date32())]), flavor="hive"
+            ),
+            exclude_invalid_files=True,
+        )
+        flt = (
+            ds.field("data_particao") >= pa.scalar(since, pa.date32())
+            if since
+            else None
+        )
+        names = [c for c in GENERATOR_COLUMNS if c in dataset.schema.names]
+        if weight_column:
+            names.append(weight_column)
+        _check_budget(dataset.count_rows(filter=flt), len(names), max_bytes)
+        table = dataset.to_table(columns=names, filter=flt)
+        bairro_path = base / f"{TAB_BAIRRO}.parquet"
+        bairro = None
+        if bairro_path.exists():
+            import pyarrow.parquet as pq
+
+            bairro = pq.read_table(bairro_path, columns=["id_bairro", "nome"])
+        return cls.from_arrow(
+            table, bairro, since, max_bytes, source=source, weight_column=weight_column
+        )
+
+    @classmethod
+    def from_bigquery(
+        cls,
+        since: Optional[dt.date] = None,
+        max_bytes: Optional[int] = None,
+    ) -> "ChamadoIndex":
+        """Carrega do BigQuery (colunas do gerador; partições a partir de `since`)."""
+        from src.agent.nodes import _schema
+        from src.utils import bq
+
+        schema = _schema()
+        names = [c for c in GENERATOR_COLUMNS if c in schema]
+        where = f"WHERE data_particao >= DATE '{since:%Y-%m-%d}'" if since else ""
+        count = bq.execute(f"SELECT COUNT(1) AS n FROM `{TAB_CHAMADO}` {where}")
+        if not count.get("ok"):
+            raise RuntimeError(f"Falha ao contar linhas: {count.get('error')}")
+        _check_budget(int(count["df"]["n"].iloc[0]), len(names), max_bytes)
+
+        out = bq.execute(
+            f"SELECT {', '.join(names)} FROM `{TAB_CHAMADO}` {where}",
+            result_format="arrow",
+            timeout=600,
+        )
+        if not out.get("ok"):
+            raise RuntimeError(f"Falha ao carregar chamado: {out.get('error')}")
+        dim = bq.execute(
+            f"SELECT id_bairro, nome FROM `{TAB_BAIRRO}`", result_format="arrow"
+        )
+        bairro = dim["table"].table if dim.get("ok") else None
+        return cls.from_arrow(
+            out["table"].table, bairro, since, max_bytes, source="bigquery"
+        )
+
+    # Consulta
+
+    def covers(self, template: Dict[str, Any]) -> bool:
+        """True se o índice tem colunas e dias suficientes para o template."""
+        group = template.get("group")
+        if group == "bairro":
+            if self._bairro_map is None:
+                return False
+        elif group is not None and group not in self.columns:
+            return False
+        if template.get("terms") and any(
+            c not in self.columns for c in template.get("text_columns") or []
+        ):
+            return False
+        start = template.get("start")
+        # Corte `since`: janelas abertas ou que começam antes dele ficam incompletas
+        return not self.since or (
+            start is not None and dt.date.fromisoformat(start) >= self.since
+        )
+
+    def _window(self, start: Optional[str], end: Optional[str]) -> slice:
+        # Chave no mesmo dtype: com int Python o numpy converteria `days` inteiro
+        lo = (
+            0 if start is None else self.days.searchsorted(np.int32(_day_number(start)))
+        )
+        hi = (
+            len(self)
+            if end is None
+            else self.days.searchsorted(np.int32(_day_number(end)))
+        )
+        return slice(int(lo), int(hi))
+
+    def _rows(self, template: Dict[str, Any]) -> Tuple[slice, Optional[np.ndarray]]:
+        """Fatia da janela de datas + máscara do filtro LIKE (None = sem filtro)."""
+        window = self._window(template.get("start"), template.get("end"))
+        terms = template.get("terms") or []
+        text_columns = template.get("text_columns") or []
+        if not terms or not text_columns:
+            return window, None
+        mask = None
+        for name in text_columns:
+            col = self.columns[name]
+            hit = col.like_all(terms)
+            if not hit.any():
+                continue
+            rows = hit[col.codes[window]]
+            mask = rows if mask is None else (mask | rows)
+        if mask is None:
+            mask = np.zeros(window.stop - window.start, dtype=bool)
+        return window, mask
+
+    def count(self, template: Dict[str, Any]) -> int:
+        window, mask = self._rows(template)
+        if self.weights is not None:
+            w = self.weights[window]
+            return int(w.sum() if mask is None else w[mask].sum())
+        return int(window.stop - window.start if mask is None else mask.sum())
+
+    def top(self, template: Dict[str, Any]) -> List[Tuple[Optional[str], int]]:
+        """[(valor, total)] em ordem decrescente, até `limit` grupos."""
+        window, mask = self._rows(template)
+        group = template["group"]
+        col = self.columns["id_bairro" if group == "bairro" else group]
+        codes = col.codes[window]
+        w = None if self.weights is None else self.weights[window]
+        if mask is not None:
+            codes = codes[mask]
+            w = None if w is None else w[mask]
+        totals = np.bincount(codes, weights=w, minlength=len(col.values))
+        totals = totals.astype(np.int64, copy=False)
+        labels: List[Optional[str]] = col.values
+        if group == "bairro":
+            # JOIN sobre os totais por id (poucos), não por linha; ids sem bairro
+            # correspondente saem (INNER JOIN)
+            known = self._bairro_map >= 0
+            totals = np.bincount(
+                self._bairro_map[known],
+                weights=totals[known],
+                minlength=len(self.bairro_names),
+            ).astype(np.int64)
+            labels = self.bairro_names
+        order = np.argsort(-totals, kind="stable")[: int(template.get("limit") or 1)]
+        return [(labels[i], int(totals[i])) for i in order if totals[i] > 0]
+
+    def answer(self, template: Optional[Dict[str, Any]]) -> Optional[pa.Table]:
+        """
+        Responde o template com as mesmas colunas do SQL gerado.
+
+        Returns
+        -------
+        pyarrow.Table | None
+            None quando o índice não cobre o template (colunas/dias ausentes).
+        """
+        if not template or not self.covers(template):
+            return None
+        if template["family"] == "count":
+            return pa.table({"n": pa.array([self.count(template)], pa.int64())})
+        rows = self.top(template)
+        return pa.table(
+            {
+                template["label"]: pa.array([r[0] for r in rows], pa.string()),
+                "total": pa.array([r[1] for r in rows], pa.int64()),
+            }
+        )
+
+
+# Helpers de carga
+
+
+def _check_budget(rows: int, ncols: int, max_bytes: Optional[int]) -> None:
+    """Recusa a carga antes de ler os dados se a estimativa passar do limite."""
+    limit = INDEX_MAX_BYTES if max_bytes is None else max_bytes
+    estimate = rows * _ROW_BYTES_UPPER * max(1, ncols)
+    if estimate > limit:
+        raise MemoryError(
+            f"Índice estimado em {estimate:,} bytes para {rows:,} linhas "
+            f"(limite AGENT_INDEX_MAX_BYTES={limit:,}); use `since` para reduzir."
+        )
+
+
+def _bairro_join(id_bairro: _Encoded, bairro: pa.Table) -> Tuple[List[str], np.ndarray]:
+    """Mapa código de `id_bairro` → índice do nome (-1 quando não há bairro)."""
+    ids = pc.cast(bairro.column("id_bairro"), pa.string()).to_pylist()
+    names = bairro.column("nome").to_pylist()
+    distinct = sorted({n for n in names if n is not None})
+    position = {n: i for i, n in enumerate(distinct)}
+    name_of = {
+        i: position[n] for i, n in zip(ids, names) if i is not None and n is not None
+    }
+    mapping = np.fromiter(
+        (name_of.get(v, -1) if v is not None else -1 for v in id_bairro.values),
+        dtype=np.int32,
+        count=len(id_bairro.values),
+    )
+    return distinct, mapping
@@ -7,7 +7,7 @@ Nós de negócio do agente:
 - Roteador de intenção
 - Gerador de SQL (adaptativo ao schema real do 1746)
 - Validador (DRY-RUN)
-- Executor (BigQuery)
+- Executor (BigQuery por padrão; backend plugável em `src.utils.backends`)
 - Sintetizador (LLM opcional com fallback determinístico)
 - Chit-chat (LLM com fallback)
 
@@ -21,14 +21,19 @@ Princípios:
 
 from __future__ import annotations
 
-from typing import Dict, Any, Optional, List, Tuple
+from dataclasses import dataclass, field
+from types import MappingProxyType
+from typing import Dict, Any, Mapping, Optional, List, Sequence, Tuple
 import datetime as dt
 import re
 import os
 
-from src.utils.bq import dry_run, execute
-from src.utils.schema import get_table_schema
+from src.agent import categories
+from src.utils.backends import get_backend
+from src.utils.bq import ArrowResult
+from src.utils.cost import precheck, record_drift, warm as warm_cost_model
 from src.utils.logger import get_logger
+from src.utils.schema import add_schema_listener, prefetch_schemas
 
 # Constantes e configuração
 
@@ -36,15 +41,53 @@ TAB_CHAMADO = "datario.adm_central_atendimento_1746.chamado"
 TAB_BAIRRO = "datario.dados_mestres.bairro"
 DATASET_CHAMADO = "datario.adm_central_atendimento_1746"
 TABLE_CHAMADO = "chamado"
+DATASET_BAIRRO = "datario.dados_mestres"
+TABLE_BAIRRO = "bairro"
+
+# Colunas textuais candidatas para filtros LIKE (usadas só se existirem no schema)
+_TEXT_CANDIDATES = (
+    "subtipo",
+    "tipo",
+    "categoria",
+    "descricao",
+    "titulo",
+    "motivo",
+    "detalhe",
+    "classificacao",
+    "assunto",
+)
+# Todas as colunas de `chamado` que o gerador pode referenciar (projeção de
+# espelhos/snapshots locais; ver scripts/sync_mirror.py)
+GENERATOR_COLUMNS = (
+    "data_particao",
+    "data_inicio",
+    "id_bairro",
+    "id_unidade_organizacional",
+    "nome_unidade_organizacional",
+    *_TEXT_CANDIDATES,
+)
 
 # Datas em PT-BR
 _DATE_PT = re.compile(r"(\d{1,2})/(\d{1,2})/(\d{4})")
 
-# Cache simples do schema
-_SCHEMA_CACHE: Optional[Dict[str, str]] = None
+# Perfil do schema por (backend, versão de `chamado`): o snapshot local pode
+# projetar menos colunas, e uma versão nova da tabela remonta o perfil.
+# Também esvaziado quando o cache persistente de `src.utils.schema` avisa mudança.
+_SCHEMA_CACHE: Dict[Tuple[str, Optional[str]], "SchemaProfile"] = {}
 
 log = get_logger(__name__)
 
+
+def _on_schema_change(dataset: str, table: str, meta: Dict[str, Any]) -> None:
+    if f"{dataset}.{table}" in (TAB_CHAMADO, TAB_BAIRRO) or table in (
+        TABLE_CHAMADO,
+        TABLE_BAIRRO,
+    ):
+        _SCHEMA_CACHE.clear()
+
+
+add_schema_listener(_on_schema_change)
+
 # Roteador
 
 
@@ -112,19 +155,213 @@ def route_intent(question: str) -> Dict[str, Any]:
     return {"intent": intent, "question": question}
 
 
+# Perfil do schema (pré-computado por versão)
+
+
+@dataclass(frozen=True)
+class SchemaProfile:
+    """
+    Tudo o que o gerador precisa saber dos schemas de `chamado` e `bairro`,
+    calculado uma vez por versão (`from_schema`). Com ele, `generate_sql` só
+    monta strings.
+
+    Atributos
+    ---------
+    types : Mapping[str, str]
+        {coluna: tipo} (somente leitura).
+    text_columns : tuple[str, ...]
+        Colunas STRING candidatas a filtro textual.
+    day_expr : str | None
+        Expressão de dia para igualdade com DATE '...' (partição quando existir).
+    year_column : str | None
+        "data_particao" (faixa com partition pruning) ou "data_inicio" (EXTRACT).
+    default_window : str
+        Filtro da janela padrão de 365 dias.
+    join_on : str
+        Condição do JOIN fato × bairro, com CAST conforme os tipos de id_bairro
+        nas duas tabelas.
+    category_column : str
+        Coluna agrupada nas perguntas de categoria (subtipo > tipo > categoria).
+    unidade_column : str
+        Nome (ou id) da unidade organizacional.
+    like_filters : Mapping[tuple[str, ...], str]
+        Filtros LIKE já montados para os termos fixos dos templates.
+    """
+
+    types: Mapping[str, str]
+    text_columns: Tuple[str, ...]
+    day_expr: Optional[str]
+    year_column: Optional[str]
+    default_window: str
+    join_on: str
+    category_column: str
+    unidade_column: str
+    like_filters: Mapping[Tuple[str, ...], str] = field(default_factory=dict)
+
+    @classmethod
+    def from_schema(
+        cls, schema: Mapping[str, str], bairro: Optional[Mapping[str, str]] = None
+    ) -> "SchemaProfile":
+        """
+        Perfil a partir de {coluna: tipo} de `chamado` e, se conhecido, de
+        `bairro` (sem ele, assume id_bairro INT64 na dimensão).
+        """
+        s = {c: str(t).upper() for c, t in schema.items()}
+        b = {c: str(t).upper() for c, t in (bairro or {}).items()}
+        text_columns = tuple(
+            c for c in _TEXT_CANDIDATES if c in s and s[c].startswith("STRING")
+        )
+
+        if "data_particao" in s:
+            day_expr, year_column = "data_particao", "data_particao"
+            default_window = (
+                "data_particao >= DATE_SUB(CURRENT_DATE(), INTERVAL 365 DAY)"
+            )
+        elif "data_inicio" in s:
+            day_expr, year_column = "DATE(data_inicio)", "data_inicio"
+            default_window = (
+                "DATE(data_inicio) >= DATE_SUB(CURRENT_DATE(), INTERVAL 365 DAY)"
+            )
+        else:
+            day_expr, year_column, default_window = None, None, "1=1"
+
+        # Tipos iguais → sem CAST; fato STRING → CAST na dimensão; senão, no fato
+        fact_id = s.get("id_bairro", "STRING")
+        dim_id = b.get("id_bairro", "INT64")
+        if fact_id == dim_id:
+            join_on = "c.id_bairro = b.id_bairro"
+        elif fact_id.startswith("STRING"):
+            join_on = "c.id_bairro = CAST(b.id_bairro AS STRING)"
+        else:
+            join_on = f"CAST(c.id_bairro AS {dim_id}) = b.id_bairro"
+
+        # Preferimos 'subtipo' (quando existir) para atender casos que exigem GROUP BY subtipo
+        category_column = next(
+            (c for c in ("subtipo", "tipo") if s.get(c, "").startswith("STRING")),
+            "categoria",
+        )
+        unidade_column = (
+            "nome_unidade_organizacional"
+            if "nome_unidade_organizacional" in s
+            else "id_unidade_organizacional"
+        )
+        like_filters = {
+            terms: _like_filter(text_columns, terms) for terms in _TEMPLATE_TERMS
+        }
+        profile = cls(
+            types=MappingProxyType(s),
+            text_columns=text_columns,
+            day_expr=day_expr,
+            year_column=year_column,
+            default_window=default_window,
+            join_on=join_on,
+            category_column=category_column,
+            unidade_column=unidade_column,
+            like_filters=MappingProxyType(like_filters),
+        )
+        log.debug("schema_profile=%s", profile)
+        return profile
+
+    def like_filter(self, terms: Sequence[str]) -> str:
+        """Filtro LIKE dos termos (pré-montado para os termos dos templates)."""
+        key = tuple(terms)
+        cached = self.like_filters.get(key)
+        return cached if cached is not None else _like_filter(self.text_columns, key)
+
+    def year_condition(self, target_year: int) -> str:
+        """
+        Condição de ano usando a melhor coluna disponível.
+
+        PRIORIDADE **EFICIENTE**:
+        1) Faixa em data_particao (partition pruning), se existir.
+        2) EXTRACT(YEAR FROM c.data_inicio) = <ano>, se data_inicio existir.
+        3) 1=1 (fallback).
+        """
+        if self.year_column == "data_particao":
+            return (
+                f"(data_particao >= DATE '{target_year}-01-01' "
+                f"AND data_particao < DATE '{target_year + 1}-01-01')"
+            )
+        if self.year_column == "data_inicio":
+            return f"EXTRACT(YEAR FROM c.data_inicio) = {target_year}"
+        return "1=1"
+
+    def day_condition(self, day: dt.date) -> str:
+        return f"{self.day_expr} = DATE '{day:%Y-%m-%d}'" if self.day_expr else "1=1"
+
+
+# Termos fixos dos templates (filtros LIKE pré-montados no perfil)
+_TERMS_ILUMINACAO = ("iluminação", "pública")
+_TERMS_BURACO = ("reparo", "buraco")
+_TERMS_ESTACIONAMENTO = ("fiscalização", "estacionamento", "irregular")
+_TEMPLATE_TERMS = (_TERMS_ILUMINACAO, _TERMS_BURACO, _TERMS_ESTACIONAMENTO)
+
+
 # Helpers de Schema/Text
 
 
-def _schema() -> Dict[str, str]:
+def _profile() -> SchemaProfile:
+    """
+    Perfil dos schemas reais de `chamado` e `bairro`, com cache em memória por
+    backend e versão de `chamado` (recalculado só quando um dos schemas muda).
+
+    A versão vem do cache de `src.utils.schema` a cada chamada (acerto em
+    memória); é essa leitura que agenda a revalidação em segundo plano quando
+    a cópia está vencida.
+    """
+    backend = get_backend()
+    key = (backend.name, backend.schema_version(DATASET_CHAMADO, TABLE_CHAMADO))
+    profile = _SCHEMA_CACHE.get(key)
+    if profile is None:
+        schema = backend.table_schema(DATASET_CHAMADO, TABLE_CHAMADO)
+        try:
+            bairro = backend.table_schema(DATASET_BAIRRO, TABLE_BAIRRO)
+        except Exception as e:
+            log.warning(
+                "Schema de %s indisponível; JOIN com tipos padrão. err=%r",
+                TAB_BAIRRO,
+                e,
+            )
+            bairro = None
+        profile = SchemaProfile.from_schema(schema, bairro)
+        for old in [k for k in _SCHEMA_CACHE if k[0] == backend.name]:
+            del _SCHEMA_CACHE[old]
+        _SCHEMA_CACHE[key] = profile
+        log.info("Schema cache carregado (%s): %d colunas", backend.name, len(schema))
+    return profile
+
+
+def warm_schemas() -> Dict[str, Any]:
+    """
+    Aquecimento: pré-carrega em lote os schemas de BQ_SCHEMA_PREFETCH (no
+    BigQuery) e monta o perfil do gerador, para a primeira pergunta não
+    pagar nenhuma consulta de metadados.
+
+    Returns
+    -------
+    dict
+        Resumo de `prefetch_schemas` (vazio fora do BigQuery), com "profile": bool.
+    """
+    out: Dict[str, Any] = {}
+    if get_backend().name == "bigquery":
+        out = prefetch_schemas()
+    try:
+        p = _profile()
+        out["profile"] = True
+        if categories.CATEGORY_IN_ENABLED:
+            categories.get_dictionary(p.text_columns)
+    except Exception as e:
+        log.warning("Aquecimento do perfil de schema falhou: %r", e)
+        out["profile"] = False
+    return out
+
+
+def _schema() -> Mapping[str, str]:
     """
     Obtém {coluna: tipo} do schema real de `datario.adm_central_atendimento_1746.chamado`,
     com cache em memória para reduzir latência/custos.
     """
-    global _SCHEMA_CACHE
-    if _SCHEMA_CACHE is None:
-        _SCHEMA_CACHE = get_table_schema(DATASET_CHAMADO, TABLE_CHAMADO)
-        log.info("Schema cache carregado: %d colunas", len(_SCHEMA_CACHE))
-    return _SCHEMA_CACHE
+    return _profile().types
 
 
 def _parse_date_pt(text: str) -> Optional[dt.date]:
@@ -144,28 +381,6 @@ def _parse_date_pt(text: str) -> Optional[dt.date]:
     return dt.date(y, mth, d)
 
 
-def _text_columns() -> List[str]:
-    """
-    Retorna colunas STRING candidatas para busca textual
-    (apenas as que de fato existem no schema).
-    """
-    s = _schema()
-    candidates = [
-        "subtipo",
-        "tipo",
-        "categoria",
-        "descricao",
-        "titulo",
-        "motivo",
-        "detalhe",
-        "classificacao",
-        "assunto",
-    ]
-    cols = [c for c in candidates if c in s and s[c].upper().startswith("STRING")]
-    log.debug("text_columns=%s", cols)
-    return cols
-
-
 def _escape_like_term(term: str) -> str:
     """
     Sanitiza termos para uso em LIKE.
@@ -176,12 +391,20 @@ def _escape_like_term(term: str) -> str:
     return term.replace("'", "''")
 
 
-def _build_like_filter(terms: List[str]) -> str:
+def _string_literal(value: str) -> str:
+    """
+    Literal de string do BigQuery: barra invertida e aspas simples escapadas com
+    barra invertida (`O'Neil` → `'O\\'Neil'`). O backend local converte para a
+    forma do DuckDB (`backends.translate_sql`).
+    """
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _like_filter(cols: Sequence[str], terms: Sequence[str]) -> str:
     """
     Constrói expressão de filtro textual tolerante:
     (LOWER(col) LIKE '%t1%' AND LOWER(col) LIKE '%t2%') OR ...  (por coluna textual disponível)
     """
-    cols = _text_columns()
     if not cols or not terms:
         return "1=1"  # fallback seguro
 
@@ -193,27 +416,43 @@ def _build_like_filter(terms: List[str]) -> str:
     for c in cols:
         conj = " AND ".join([f"LOWER({c}) LIKE '%{t}%'" for t in safe_terms])
         per_col.append(f"({conj})")
-    expr = "(" + " OR ".join(per_col) + ")"
-    log.debug("like_filter=%s", expr)
-    return expr
+    return "(" + " OR ".join(per_col) + ")"
 
 
-def _bairro_join_condition() -> str:
+def _text_filter(
+    p: SchemaProfile,
+    terms: Sequence[str],
+    start: Optional[dt.date] = None,
+    end: Optional[dt.date] = None,
+) -> str:
     """
-    Ajusta o JOIN entre fato e dimensão bairro conforme tipos:
-
-    - Se id_bairro no fato é STRING → c.id_bairro = CAST(b.id_bairro AS STRING)
-    - Caso contrário → CAST(c.id_bairro AS INT64) = b.id_bairro
+    Filtro textual do gerador.
+
+    Padrão: LIKE pré-montado no perfil. Com AGENT_CATEGORY_IN=1, as colunas do
+    dicionário de categorias (`src.agent.categories`) viram `col IN (...)` com os
+    valores exatos que casam com os termos; colunas livres seguem com LIKE.
+    Sem dicionário carregado, ou se ele não cobre a janela da consulta
+    ([start, end); start None = sem limite, end None = até hoje), volta ao
+    LIKE — sem esperar pela carga.
     """
-    s = _schema()
-    fato_t = s.get("id_bairro", "STRING").upper()
-    cond = (
-        "c.id_bairro = CAST(b.id_bairro AS STRING)"
-        if fato_t.startswith("STRING")
-        else "CAST(c.id_bairro AS INT64) = b.id_bairro"
-    )
-    log.debug("join_condition=%s (id_bairro tipo=%s)", cond, fato_t)
-    return cond
+    if not categories.CATEGORY_IN_ENABLED:
+        return p.like_filter(terms)
+    resolved = categories.resolve_terms(p.text_columns, terms, start, end)
+    if resolved is None:
+        return p.like_filter(terms)
+
+    parts = []
+    for c in p.text_columns:
+        values = resolved.get(c)
+        if values is None or len(values) > categories.CATEGORY_IN_MAX_VALUES:
+            like = _like_filter([c], terms)
+            if like != "1=1":
+                parts.append(like[1:-1])
+        elif values:
+            quoted = ", ".join(_string_literal(v) for v in values)
+            parts.append(f"{c} IN ({quoted})")
+        # Nenhum valor casou: a coluna não contribui (equivale ao LIKE falso)
+    return "(" + " OR ".join(parts) + ")" if parts else "FALSE"
 
 
 def _one_line(sql: str) -> str:
@@ -221,42 +460,50 @@ def _one_line(sql: str) -> str:
     return re.sub(r"\s+", " ", sql or "").strip()
 
 
-def _year_condition(target_year: int) -> Tuple[str, Optional[str]]:
+def _template(
+    p: SchemaProfile,
+    family: str,
+    label: str,
+    group: Optional[str] = None,
+    terms: Sequence[str] = (),
+    start: Optional[dt.date] = None,
+    end: Optional[dt.date] = None,
+    limit: int = 1,
+) -> Dict[str, Any]:
     """
-    Constrói condição de ano usando a melhor coluna disponível.
-
-    PRIORIDADE **EFICIENTE**:
-    1) Faixa em data_particao (partition pruning), se existir.
-    2) EXTRACT(YEAR FROM c.data_inicio) = <ano>, se data_inicio existir.
-    3) 1=1 (fallback).
-
-    Returns
-    -------
-    (condição_sql, coluna_utilizada|None)
+    Descrição estruturada da consulta gerada, para motores que não executam SQL
+    (índice em memória, `src.agent.index`).
+
+    Campos
+    ------
+    family : "count" | "top"
+        COUNT(1) simples ou COUNT(1) agrupado com ORDER BY total DESC LIMIT.
+    label : str
+        Nome da coluna de saída do grupo ("n" em "count").
+    group : str | None
+        Coluna agrupada; "bairro" = nome via JOIN com a dimensão de bairros.
+    terms, text_columns
+        Filtro LIKE: todos os termos em ao menos uma das colunas textuais.
+    start, end : "YYYY-MM-DD" | None
+        Janela de dias [start, end), equivalente ao filtro de data do SQL.
     """
-    s = _schema()
-    if "data_particao" in s:
-        start = f"DATE '{target_year}-01-01'"
-        end = f"DATE '{target_year+1}-01-01'"
-        cond = f"(data_particao >= {start} AND data_particao < {end})"
-        return cond, "data_particao"
-    if "data_inicio" in s:
-        return f"EXTRACT(YEAR FROM c.data_inicio) = {target_year}", "data_inicio"
-    return "1=1", None
+    return {
+        "family": family,
+        "label": label,
+        "group": group,
+        "terms": [t.lower() for t in terms if t and t.strip()],
+        "text_columns": list(p.text_columns) if terms else [],
+        "start": start.isoformat() if start else None,
+        "end": end.isoformat() if end else None,
+        "limit": limit,
+    }
 
 
-def _default_date_window() -> str:
-    """
-    Janela temporal padrão para perguntas sem data explícita.
-    Prioriza a coluna particionada quando existir.
-    Retorna uma expressão SQL de filtro (string).
-    """
-    s = _schema()
-    if "data_particao" in s:
-        return "data_particao >= DATE_SUB(CURRENT_DATE(), INTERVAL 365 DAY)"
-    if "data_inicio" in s:
-        return "DATE(data_inicio) >= DATE_SUB(CURRENT_DATE(), INTERVAL 365 DAY)"
-    return "1=1"
+def _default_window_start(p: SchemaProfile) -> Optional[dt.date]:
+    """Início (UTC, como CURRENT_DATE() do BigQuery) da janela padrão do perfil."""
+    if p.year_column is None:
+        return None
+    return dt.datetime.now(dt.timezone.utc).date() - dt.timedelta(days=365)
 
 
 # Gerador de SQL
@@ -267,6 +514,12 @@ def generate_sql(question: str) -> Dict[str, Any]:
     Gera SQL BigQuery eficiente (sem SELECT *) com base na pergunta,
     adaptando-se às colunas disponíveis no schema real.
 
+    As decisões dependentes do schema (colunas textuais, JOIN, coluna de data)
+    vêm prontas do `SchemaProfile`; aqui só há montagem de strings.
+
+    Além do SQL, devolve `template` (ver `_template`): a mesma consulta em forma
+    estruturada, para o índice em memória responder sem ir ao BigQuery.
+
     Segurança/eficiência:
     - SELECT com projeções explícitas (nunca SELECT *).
     - Filtros textuais somente em colunas existentes.
@@ -274,103 +527,112 @@ def generate_sql(question: str) -> Dict[str, Any]:
     - Uso de partição (data_particao) quando disponível.
     """
     q = (question or "").strip().lower()
-    s = _schema()
+    p = _profile()
 
     # 1) Contagem por dia — prioriza partição se existir
     day = _parse_date_pt(q)
     if day and "quantos" in q and "chamados" in q:
-        if "data_particao" in s:
-            where_date = f"data_particao = DATE '{day:%Y-%m-%d}'"
-        elif "data_inicio" in s:
-            where_date = f"DATE(data_inicio) = DATE '{day:%Y-%m-%d}'"
-        else:
-            where_date = "1=1"
-        sql = f"SELECT COUNT(1) AS n FROM `{TAB_CHAMADO}` WHERE {where_date}"
+        sql = f"SELECT COUNT(1) AS n FROM `{TAB_CHAMADO}` WHERE {p.day_condition(day)}"
         out = _one_line(sql)
         log.info("SQL G1: %s", out)
-        return {"sql": out}
+        template = _template(
+            p,
+            "count",
+            "n",
+            start=day if p.day_expr else None,
+            end=day + dt.timedelta(days=1) if p.day_expr else None,
+        )
+        return {"sql": out, "template": template}
 
     # 2) Subtipo mais comum relacionado a "Iluminação Pública"
     if "iluminação" in q:
-        # Preferimos 'subtipo' (quando existir) para atender casos que exigem GROUP BY subtipo
-        if "subtipo" in s and s["subtipo"].upper().startswith("STRING"):
-            select_expr = "subtipo"
-            group_expr = "subtipo"
-        elif "tipo" in s and s["tipo"].upper().startswith("STRING"):
-            select_expr = "tipo"
-            group_expr = "tipo"
-        else:
-            select_expr = "categoria"
-            group_expr = "categoria"
-
-        filtro = _build_like_filter(["iluminação", "pública"])
-        date_filter = _default_date_window()  # <- janela padrão para reduzir custo
+        col = p.category_column
+        filtro = _text_filter(p, _TERMS_ILUMINACAO, _default_window_start(p))
         sql = f"""
-            SELECT {select_expr}, COUNT(1) AS total
+            SELECT {col}, COUNT(1) AS total
             FROM `{TAB_CHAMADO}`
-            WHERE ({filtro}) AND ({date_filter})
-            GROUP BY {group_expr}
+            WHERE ({filtro}) AND ({p.default_window})
+            GROUP BY {col}
             ORDER BY total DESC
             LIMIT 1
         """
         out = _one_line(sql)
         log.info("SQL G2: %s", out)
-        return {"sql": out}
+        template = _template(
+            p,
+            "top",
+            col,
+            group=col,
+            terms=_TERMS_ILUMINACAO,
+            start=_default_window_start(p),
+        )
+        return {"sql": out, "template": template}
 
     # 3) Top 3 bairros — "reparo de buraco" em 2023 (JOIN com bairro)
     if "reparo" in q and "buraco" in q and "2023" in q:
-        filtro = _build_like_filter(["reparo", "buraco"])
-        join_on = _bairro_join_condition()
-        year_cond, year_col = _year_condition(2023)
-
+        start = dt.date(2023, 1, 1) if p.year_column else None
+        end = dt.date(2024, 1, 1) if p.year_column else None
         sql = f"""
             SELECT b.nome AS bairro, COUNT(1) AS total
             FROM `{TAB_CHAMADO}` c
             JOIN `{TAB_BAIRRO}` b
-              ON {join_on}
-            WHERE ({year_cond})
-              AND ({filtro})
+              ON {p.join_on}
+            WHERE ({p.year_condition(2023)})
+              AND ({_text_filter(p, _TERMS_BURACO, start, end)})
             GROUP BY bairro
             ORDER BY total DESC
             LIMIT 3
         """
         out = _one_line(sql)
-        log.info("SQL G3 (year_col=%s): %s", year_col, out)
-        return {"sql": out}
+        log.info("SQL G3 (year_col=%s): %s", p.year_column, out)
+        template = _template(
+            p,
+            "top",
+            "bairro",
+            group="bairro",
+            terms=_TERMS_BURACO,
+            start=start,
+            end=end,
+            limit=3,
+        )
+        return {"sql": out, "template": template}
 
     # 4) Unidade organizacional líder — "Fiscalização de estacionamento irregular"
     if "fiscalização" in q and "estacionamento" in q and "irregular" in q:
-        filtro = _build_like_filter(["fiscalização", "estacionamento", "irregular"])
-        unidade_col = (
-            "nome_unidade_organizacional"
-            if "nome_unidade_organizacional" in s
-            else "id_unidade_organizacional"
-        )
-        date_filter = _default_date_window()  # <- janela padrão para reduzir custo
+        filtro = _text_filter(p, _TERMS_ESTACIONAMENTO, _default_window_start(p))
         sql = f"""
-            SELECT {unidade_col} AS unidade, COUNT(1) AS total
+            SELECT {p.unidade_column} AS unidade, COUNT(1) AS total
             FROM `{TAB_CHAMADO}`
-            WHERE ({filtro}) AND ({date_filter})
+            WHERE ({filtro}) AND ({p.default_window})
             GROUP BY unidade
             ORDER BY total DESC
             LIMIT 1
         """
         out = _one_line(sql)
         log.info("SQL G4: %s", out)
-        return {"sql": out}
+        template = _template(
+            p,
+            "top",
+            "unidade",
+            group=p.unidade_column,
+            terms=_TERMS_ESTACIONAMENTO,
+            start=_default_window_start(p),
+        )
+        return {"sql": out, "template": template}
 
     # Fallback seguro
-    base_date = "2024-11-28"
-    where_col = (
-        "data_particao"
-        if "data_particao" in s
-        else ("DATE(data_inicio)" if "data_inicio" in s else None)
-    )
-    where_expr = f"{where_col} = DATE '{base_date}'" if where_col else "1=1"
-    sql = f"SELECT COUNT(1) AS n FROM `{TAB_CHAMADO}` WHERE {where_expr}"
+    base = dt.date(2024, 11, 28)
+    sql = f"SELECT COUNT(1) AS n FROM `{TAB_CHAMADO}` WHERE {p.day_condition(base)}"
     out = _one_line(sql)
     log.info("SQL Fallback: %s", out)
-    return {"sql": out}
+    template = _template(
+        p,
+        "count",
+        "n",
+        start=base if p.day_expr else None,
+        end=base + dt.timedelta(days=1) if p.day_expr else None,
+    )
+    return {"sql": out, "template": template}
 
 
 # Validador / Executor / Síntese
@@ -380,10 +642,16 @@ def validate_sql(sql: str) -> Dict[str, Any]:
     """
     Valida a consulta via DRY-RUN (sem custo).
 
+    Antes do dry-run, o modelo local de custo (`src.utils.cost`) estima os bytes
+    sem rede; candidatos obviamente acima do teto são recusados ali mesmo. Com
+    estimativa e dry-run em mãos, o desvio entre eles é registrado.
+
     Returns
     -------
     dict
-        {"ok": bool, "error": str|None, "dry_run_bytes": int|None}
+        {"ok": bool, "error": str|None, "dry_run_bytes": int|None,
+         "validation_token": str|None, "estimated_bytes": int|None,
+         "estimate_drift_pct": float|None}
     """
     if not (sql or "").strip():
         return {
@@ -392,45 +660,112 @@ def validate_sql(sql: str) -> Dict[str, Any]:
             "dry_run_bytes": None,
         }
 
-    out = dry_run(sql)
+    backend = get_backend()
+    # O modelo local de custo só se aplica ao BigQuery (o backend local não fatura)
+    est, refusal = precheck(sql) if backend.name == "bigquery" else (None, None)
+    if refusal:
+        log.info("validate_sql | recusado pelo modelo local | est=%s", est)
+        return {
+            "ok": False,
+            "error": refusal,
+            "dry_run_bytes": None,
+            "estimated_bytes": est,
+            "estimate_drift_pct": None,
+        }
+
+    out = backend.dry_run(sql)
+    drift = record_drift(est, out.get("dry_run_bytes")) if out.get("ok") else None
+    if est is None and backend.name == "bigquery":
+        # Metadados ainda ausentes: carrega em segundo plano para as próximas
+        warm_cost_model(sql)
     log.debug(
-        "validate_sql | ok=%s | bytes=%s | err=%s",
+        "validate_sql | ok=%s | bytes=%s | est=%s | drift=%s | err=%s",
         out.get("ok"),
         out.get("dry_run_bytes"),
+        est,
+        drift,
         out.get("error"),
     )
     return {
         "ok": bool(out.get("ok")),
         "error": out.get("error"),
         "dry_run_bytes": out.get("dry_run_bytes"),
+        "validation_token": out.get("validation_token"),
+        "estimated_bytes": est,
+        "estimate_drift_pct": drift,
     }
 
 
-def execute_sql(sql: str) -> Dict[str, Any]:
+def execute_sql(
+    sql: str,
+    validation: Optional[Dict[str, Any]] = None,
+    result_format: str = "pandas",
+    timeout: Optional[float] = None,
+) -> Dict[str, Any]:
     """
-    Executa a consulta no BigQuery. Assumimos que já houve DRY-RUN ok.
+    Executa a consulta no backend ativo (BigQuery por padrão).
+    Assumimos que já houve DRY-RUN ok.
+
+    Se `validation` (retorno de `validate_sql`) for informado, o executor
+    reaproveita esse dry-run em vez de repeti-lo; sem ele, valida novamente.
+    Com `result_format="arrow"`, `df` traz um `ArrowResult` (conversão para
+    pandas sob demanda). `timeout` é o prazo da chamada em segundos (padrão:
+    BQ_QUERY_TIMEOUT); ao estourar, o job é cancelado.
 
     Returns
     -------
     dict
-        {"ok": bool, "df": DataFrame|None, "error": str|None}
+        {"ok": bool, "df": DataFrame|ArrowResult|None, "error": str|None,
+         "read_path": str|None, "read_ms": float|None, "query_path": str|None,
+         "job_id": str|None, "elapsed_ms": float|None, "job_stats": dict|None,
+         "retries": int, "backoff_ms": float, "queue_wait_ms": float|None}
     """
     if not (sql or "").strip():
         return {"ok": False, "df": None, "error": "SQL vazio no executor."}
 
-    out = execute(sql)
+    out = get_backend().execute(
+        sql, prevalidated=validation, result_format=result_format, timeout=timeout
+    )
+    data = out.get("table") if result_format == "arrow" else out.get("df")
     log.debug(
         "execute_sql | ok=%s | rows=%s | err=%s",
         out.get("ok"),
-        None if out.get("df") is None else len(out.get("df")),
+        None if data is None else len(data),
         out.get("error"),
     )
-    return {"ok": bool(out.get("ok")), "df": out.get("df"), "error": out.get("error")}
+    return {
+        "ok": bool(out.get("ok")),
+        "df": data,
+        "error": out.get("error"),
+        "read_path": out.get("read_path"),
+        "read_ms": out.get("read_ms"),
+        "query_path": out.get("query_path"),
+        "job_id": out.get("job_id"),
+        "elapsed_ms": out.get("elapsed_ms"),
+        "job_stats": out.get("job_stats"),
+        "retries": out.get("retries", 0),
+        "backoff_ms": out.get("backoff_ms", 0.0),
+        "queue_wait_ms": out.get("queue_wait_ms"),
+    }
+
+
+def _cell(result, row: int, column: str) -> Any:
+    """Lê uma célula de DataFrame ou ArrowResult (sem converter o Arrow)."""
+    if isinstance(result, ArrowResult):
+        return result.value(row, column)
+    return result.iloc[row][column]
+
+
+def _head_records(result, n: int) -> List[Dict[str, Any]]:
+    """Primeiras `n` linhas como registros, para DataFrame ou ArrowResult."""
+    if isinstance(result, ArrowResult):
+        return result.head_records(n)
+    return result.head(n).to_dict(orient="records")
 
 
 def synthesize(answer_df, question: str) -> Dict[str, Any]:
     """
-    Converte DataFrame em resposta textual final.
+    Converte o resultado tabular (DataFrame ou ArrowResult) em resposta textual final.
 
     Política:
     - Se LLM_USE_FOR_SYNTH=1 e OPENAI_API_KEY definido: usa LLM (via utils.llm) com preview de no máx. 10 linhas.
@@ -443,9 +778,11 @@ def synthesize(answer_df, question: str) -> Dict[str, Any]:
     """
     import pandas as pd
 
+    tabular = isinstance(answer_df, (pd.DataFrame, ArrowResult))
+
     if answer_df is None:
         return {"answer": "Não foi possível obter resultados."}
-    if isinstance(answer_df, pd.DataFrame) and answer_df.empty:
+    if tabular and answer_df.empty:
         return {"answer": "Nenhum registro encontrado para o filtro solicitado."}
 
     # Caminho com LLM
@@ -455,7 +792,7 @@ def synthesize(answer_df, question: str) -> Dict[str, Any]:
 
             preview = (
                 answer_df.head(10).to_markdown(index=False)
-                if isinstance(answer_df, pd.DataFrame)
+                if tabular
                 else str(answer_df)[:2000]
             )
             prompt = (
@@ -472,25 +809,28 @@ def synthesize(answer_df, question: str) -> Dict[str, Any]:
 
     # Fallback determinístico
     try:
-        cols = [c.lower() for c in answer_df.columns]
+        columns = list(answer_df.columns)
+        cols = [c.lower() for c in columns]
 
         # Caso clássico
         if "n" in cols and len(answer_df) == 1:
-            n = int(answer_df.iloc[0][answer_df.columns[cols.index("n")]])
+            n = int(_cell(answer_df, 0, columns[cols.index("n")]))
             return {"answer": f"Contagem: {n}."}
 
         # Caso agregação categórica
         if "total" in cols:
             if len(answer_df) == 1:
-                row = answer_df.iloc[0]
-                keys = [c for c in answer_df.columns if c.lower() != "total"]
+                keys = [c for c in columns if c.lower() != "total"]
                 k = keys[0] if keys else "categoria"
-                return {"answer": f"{k}: {row[keys[0]]} (total: {int(row['total'])})."}
-            head = answer_df.head(3).to_dict(orient="records")
+                total = int(_cell(answer_df, 0, "total"))
+                return {
+                    "answer": f"{k}: {_cell(answer_df, 0, keys[0])} (total: {total})."
+                }
+            head = _head_records(answer_df, 3)
             return {"answer": f"Top resultados: {head}"}
 
         # Genérico
-        head = answer_df.head(3).to_dict(orient="records")
+        head = _head_records(answer_df, 3)
         return {"answer": f"Amostra de resultados: {head}"}
     except Exception as e:
         log.error("Erro no fallback de síntese: %r", e)
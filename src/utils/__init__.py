@@ -1,8 +1,32 @@
-"""Utilitários de infraestrutura: BigQuery, schema, logger e LLM."""
+"""Utilitários de infraestrutura: BigQuery, backends de execução, schema, logger e LLM."""
 
-from .bq import dry_run, execute  # BigQuery helpers (SELECT-only)
-from .schema import get_table_schema  # Descoberta de schema via INFORMATION_SCHEMA
+from .bq import (  # BigQuery helpers (SELECT-only)
+    dry_run,
+    execute,
+    execute_many,
+    adry_run,
+    aexecute,
+)
+from .schema import (  # Schema via metadados da tabela
+    get_table_schema,
+    get_table_metadata,
+    prefetch_schemas,
+)
+from .backends import get_backend, set_backend  # Backend de execução (BigQuery/DuckDB)
 from .logger import get_logger  # Logger padronizado
 from .llm import get_llm_response  # Camada fina de LLM (OpenAI)
 
-__all__ = ["dry_run", "execute", "get_table_schema", "get_logger", "get_llm_response"]
+__all__ = [
+    "dry_run",
+    "execute",
+    "execute_many",
+    "adry_run",
+    "aexecute",
+    "get_table_schema",
+    "get_table_metadata",
+    "prefetch_schemas",
+    "get_backend",
+    "set_backend",
+    "get_logger",
+    "get_llm_response",
+]
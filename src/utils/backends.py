@@ -0,0 +1,381 @@
+"""
+Backends de execução plugáveis para o agente (dry-run, execução e schema).
+
+Objetivos
+---------
+- Desacoplar os nós do agente de `src.utils.bq`: validação, execução e
+  descoberta de schema passam por uma interface comum (`Backend`).
+- BigQuery continua sendo o padrão (`BigQueryBackend`, mesmo comportamento de
+  antes: cache, orçamento, admissão, timeout...).
+- `DuckDBBackend` roda o mesmo SQL gerado sobre um snapshot local em Parquet
+  (`chamado`, `bairro`, ...), sem Google Cloud: testes de carga offline e modo
+  de baixa latência para dados quentes.
+
+Snapshot local
+--------------
+<LOCAL_SNAPSHOT_DIR>/<projeto.dataset.tabela>/**/*.parquet  (aceita partições
+no estilo Hive, p.ex. `data_particao=2024-11-28/`) ou
+<LOCAL_SNAPSHOT_DIR>/<projeto.dataset.tabela>.parquet
+
+Seleção
+-------
+AGENT_BACKEND = "bigquery" (padrão) | "duckdb"; `set_backend()` troca em tempo
+de execução (benchmarks/testes).
+"""
+
+from __future__ import annotations
+
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, Dict, Optional
+import os
+import re
+import threading
+import time
+
+from src.utils import bq
+from src.utils.bq import ArrowResult, QueryOutcome
+from src.utils.logger import get_logger
+from src.utils.schema import get_table_metadata, get_table_schema
+
+log = get_logger(__name__)
+
+AGENT_BACKEND = os.getenv("AGENT_BACKEND", "bigquery").strip().lower()
+LOCAL_SNAPSHOT_DIR = os.getenv(
+    "LOCAL_SNAPSHOT_DIR",
+    str(Path(__file__).resolve().parents[2] / ".cache" / "snapshot"),
+)
+
+
+# Interface
+
+
+class Backend(ABC):
+    """
+    Contrato mínimo de um backend de execução.
+
+    Todos os métodos seguem o formato de retorno de `src.utils.bq`
+    (`QueryOutcome`), para que os nós do agente não precisem distinguir o motor.
+    Subclasses incompletas falham já na criação (métodos abstratos).
+    """
+
+    name = "base"
+
+    @abstractmethod
+    def dry_run(self, sql: str) -> QueryOutcome:
+        raise NotImplementedError
+
+    @abstractmethod
+    def execute(
+        self,
+        sql: str,
+        prevalidated: Optional[QueryOutcome] = None,
+        result_format: str = "pandas",
+        timeout: Optional[float] = None,
+    ) -> QueryOutcome:
+        raise NotImplementedError
+
+    @abstractmethod
+    def table_schema(self, dataset: str, table: str) -> Dict[str, str]:
+        """{coluna: tipo BigQuery (UPPERCASE)} de dataset.table."""
+        raise NotImplementedError
+
+    def schema_version(self, dataset: str, table: str) -> Optional[str]:
+        """Versão atual do schema de dataset.table (None se o backend não versiona)."""
+        return None
+
+
+class BigQueryBackend(Backend):
+    """Backend padrão: delega para `src.utils.bq` e `src.utils.schema`."""
+
+    name = "bigquery"
+
+    def dry_run(self, sql: str) -> QueryOutcome:
+        return bq.dry_run(sql)
+
+    def execute(
+        self,
+        sql: str,
+        prevalidated: Optional[QueryOutcome] = None,
+        result_format: str = "pandas",
+        timeout: Optional[float] = None,
+    ) -> QueryOutcome:
+        return bq.execute(
+            sql, prevalidated=prevalidated, result_format=result_format, timeout=timeout
+        )
+
+    def table_schema(self, dataset: str, table: str) -> Dict[str, str]:
+        return get_table_schema(dataset, table)
+
+    def schema_version(self, dataset: str, table: str) -> Optional[str]:
+        # Leitura do cache em memória; vencida, agenda a revalidação (SWR)
+        return get_table_metadata(dataset, table).get("version")
+
+
+# Tradução de dialeto (BigQuery → DuckDB)
+
+# `projeto.dataset.tabela` → "projeto.dataset.tabela" (nome da view local)
+_SQL_BACKTICK_TABLE = re.compile(r"`([A-Za-z0-9_.$-]+)`")
+# DATE_SUB/DATE_ADD(expr, INTERVAL n UNIDADE) → CAST(expr ∓ INTERVAL n UNIDADE AS DATE)
+_SQL_DATE_ARITH = re.compile(
+    r"\bDATE_(SUB|ADD)\(\s*(.+?)\s*,\s*INTERVAL\s+(\d+)\s+(\w+)\s*\)", re.IGNORECASE
+)
+# Tipos do BigQuery sem equivalente de mesmo nome no DuckDB
+_BQ_TYPES = {"INT64": "BIGINT", "FLOAT64": "DOUBLE", "BOOL": "BOOLEAN", "BYTES": "BLOB"}
+_SQL_BQ_TYPES = re.compile(r"\bAS\s+(INT64|FLOAT64|BOOL|BYTES)\b", re.IGNORECASE)
+# Literal de string com escapes de barra invertida ('O\'Neil', 'a\\b')
+_SQL_BQ_STRING = re.compile(r"'((?:[^'\\\n]|\\.)*\\.(?:[^'\\\n]|\\.)*)'")
+_BQ_ESCAPES = {"n": "\n", "t": "\t", "r": "\r"}
+# Tipos do DuckDB → nomes do BigQuery (para o schema exposto ao gerador)
+_DUCK_TYPES = {
+    "VARCHAR": "STRING",
+    "BIGINT": "INT64",
+    "INTEGER": "INT64",
+    "SMALLINT": "INT64",
+    "TINYINT": "INT64",
+    "HUGEINT": "INT64",
+    "DOUBLE": "FLOAT64",
+    "FLOAT": "FLOAT64",
+    "BOOLEAN": "BOOL",
+    "BLOB": "BYTES",
+    "TIMESTAMP WITH TIME ZONE": "TIMESTAMP",
+    "TIMESTAMP": "DATETIME",
+}
+
+
+def translate_sql(sql: str) -> str:
+    """
+    Traduz as diferenças de dialeto usadas pelo gerador de SQL:
+
+    - tabelas entre crases → identificadores entre aspas duplas (views locais);
+    - DATE_SUB/DATE_ADD com INTERVAL → aritmética de datas com CAST para DATE;
+    - CAST(... AS INT64/FLOAT64/BOOL/BYTES) → tipos do DuckDB;
+    - literais com escapes de barra invertida ('O\\'Neil') → aspas duplicadas
+      ('O''Neil'): no DuckDB a barra invertida não escapa nada.
+
+    `DATE 'YYYY-MM-DD'`, `CURRENT_DATE()`, `EXTRACT`, `LOWER/LIKE` e
+    `CAST(... AS STRING)` já são aceitos pelo DuckDB sem mudança.
+    """
+    out = _SQL_BACKTICK_TABLE.sub(lambda m: f'"{m.group(1)}"', sql or "")
+    out = _SQL_DATE_ARITH.sub(
+        lambda m: (
+            f"CAST(({m.group(2)}) {'-' if m.group(1).upper() == 'SUB' else '+'} "
+            f"INTERVAL {m.group(3)} {m.group(4)} AS DATE)"
+        ),
+        out,
+    )
+    out = _SQL_BQ_TYPES.sub(lambda m: f"AS {_BQ_TYPES[m.group(1).upper()]}", out)
+    return _SQL_BQ_STRING.sub(_duck_string, out)
+
+
+def _duck_string(m: "re.Match[str]") -> str:
+    value = re.sub(
+        r"\\(.)", lambda e: _BQ_ESCAPES.get(e.group(1), e.group(1)), m.group(1)
+    )
+    return "'" + value.replace("'", "''") + "'"
+
+
+# DuckDB sobre snapshot Parquet
+
+
+class DuckDBBackend(Backend):
+    """
+    Executa o SQL gerado com DuckDB sobre um snapshot Parquet local.
+
+    Cada tabela do snapshot vira uma view com o nome totalmente qualificado do
+    BigQuery. A conexão é única por backend; cada chamada usa um cursor próprio
+    (seguro entre threads).
+    """
+
+    name = "duckdb"
+
+    def __init__(self, snapshot_dir: Optional[str] = None):
+        try:
+            import duckdb  # dependência opcional
+        except ImportError as e:  # pragma: no cover - depende do ambiente
+            raise RuntimeError(
+                "Backend DuckDB indisponível: instale o pacote opcional `duckdb`."
+            ) from e
+        self.snapshot_dir = Path(snapshot_dir or LOCAL_SNAPSHOT_DIR)
+        self._con = duckdb.connect(database=":memory:")
+        self.tables = self._register_views()
+
+    def _register_views(self) -> Dict[str, str]:
+        """Cria uma view por tabela encontrada no snapshot; retorna {tabela: origem}."""
+        tables: Dict[str, str] = {}
+        if not self.snapshot_dir.is_dir():
+            log.warning("DuckDB | snapshot ausente: %s", self.snapshot_dir)
+            return tables
+        for entry in sorted(self.snapshot_dir.iterdir()):
+            if entry.is_dir() and any(entry.rglob("*.parquet")):
+                name = entry.name
+                source = (
+                    f"read_parquet('{entry.as_posix()}/**/*.parquet', "
+                    f"hive_partitioning = true, union_by_name = true)"
+                )
+            elif entry.suffix == ".parquet":
+                name = entry.stem
+                source = f"read_parquet('{entry.as_posix()}')"
+            else:
+                continue
+            self._con.execute(
+                f'CREATE OR REPLACE VIEW "{name}" AS SELECT * FROM {source}'
+            )
+            tables[name] = source
+        log.info("DuckDB | %d tabela(s) no snapshot %s", len(tables), self.snapshot_dir)
+        return tables
+
+    def _guard(self, sql: str) -> Optional[QueryOutcome]:
+        """Mesmas guardas estáticas do BigQuery (SELECT-only, sem SELECT *)."""
+        if not (sql or "").strip():
+            return {
+                "ok": False,
+                "error": "SQL vazio.",
+                "dry_run_bytes": None,
+                "df": None,
+            }
+        if not bq.is_select_only(sql):
+            return {
+                "ok": False,
+                "error": "Apenas SELECT (ou WITH ... SELECT) é permitido; DML/DDL ou múltiplas sentenças são bloqueadas.",
+                "df": None,
+            }
+        if bq.has_select_star(sql):
+            return {
+                "ok": False,
+                "error": "Uso de 'SELECT *' bloqueado. Projete colunas explicitamente.",
+                "dry_run_bytes": None,
+                "df": None,
+            }
+        return None
+
+    def dry_run(self, sql: str) -> QueryOutcome:
+        """Valida com EXPLAIN (sem ler dados); `dry_run_bytes` = 0 (sem custo local)."""
+        refusal = self._guard(sql)
+        if refusal is not None:
+            return refusal
+        try:
+            cur = self._con.cursor()
+            try:
+                cur.execute("EXPLAIN " + translate_sql(sql))
+            finally:
+                cur.close()
+        except Exception as e:
+            return {"ok": False, "error": f"Erro de validação (DuckDB): {e}"}
+        # Sem `validation_token`: o execute local não o verifica (sempre reaplica
+        # as guardas estáticas), e o token do BigQuery não vale aqui
+        return {"ok": True, "dry_run_bytes": 0, "validation_token": None}
+
+    def execute(
+        self,
+        sql: str,
+        prevalidated: Optional[QueryOutcome] = None,
+        result_format: str = "pandas",
+        timeout: Optional[float] = None,
+    ) -> QueryOutcome:
+        """
+        Executa o SQL traduzido. `prevalidated` é aceito por compatibilidade (as
+        guardas estáticas são sempre reaplicadas); ao estourar `timeout`, a
+        consulta é interrompida.
+        """
+        bq._check_result_format(result_format)
+        refusal = self._guard(sql)
+        if refusal is not None:
+            return refusal
+        timeout = bq.QUERY_TIMEOUT if timeout is None else timeout
+        cur = self._con.cursor()
+        timer = threading.Timer(timeout, cur.interrupt)
+        started = time.monotonic()
+        timer.start()
+        try:
+            rel = cur.execute(translate_sql(sql))
+            t0 = time.perf_counter()
+            if result_format == "arrow":
+                # `to_arrow_table` substitui `fetch_arrow_table` nas versões recentes
+                to_arrow = getattr(rel, "to_arrow_table", None) or rel.fetch_arrow_table
+                data: Any = to_arrow()
+            else:
+                data = rel.df()
+            read_ms = (time.perf_counter() - t0) * 1000.0
+        except Exception as e:
+            elapsed_ms = (time.monotonic() - started) * 1000.0
+            if elapsed_ms >= timeout * 1000.0:
+                return {
+                    "ok": False,
+                    "error": f"Tempo limite de execução excedido ({timeout:g}s) no DuckDB.",
+                    "df": None,
+                    "elapsed_ms": elapsed_ms,
+                    "timed_out": True,
+                    "query_path": self.name,
+                }
+            return {
+                "ok": False,
+                "error": f"Erro de execução (DuckDB): {e}",
+                "df": None,
+                "elapsed_ms": elapsed_ms,
+                "query_path": self.name,
+            }
+        finally:
+            timer.cancel()
+            cur.close()
+
+        out: QueryOutcome = {
+            "ok": True,
+            "dry_run_bytes": 0,
+            "read_path": "local",
+            "read_ms": read_ms,
+            "query_path": self.name,
+            "elapsed_ms": (time.monotonic() - started) * 1000.0,
+        }
+        if result_format == "arrow":
+            out.update(df=None, table=ArrowResult(data))
+        else:
+            out["df"] = data
+        return out
+
+    def table_schema(self, dataset: str, table: str) -> Dict[str, str]:
+        name = f"{dataset}.{table}"
+        if name not in self.tables:
+            raise RuntimeError(
+                f"Tabela {name} ausente do snapshot {self.snapshot_dir}."
+            )
+        cur = self._con.cursor()
+        try:
+            rows = cur.execute(f'DESCRIBE "{name}"').fetchall()
+        finally:
+            cur.close()
+        return {
+            str(col): _DUCK_TYPES.get(str(typ).upper(), str(typ).upper())
+            for col, typ, *_ in rows
+        }
+
+
+# Seleção do backend ativo
+
+_BACKEND: Optional[Backend] = None
+_BACKEND_LOCK = threading.Lock()
+
+
+def _make_backend(kind: str) -> Backend:
+    if kind == "duckdb":
+        return DuckDBBackend()
+    if kind not in {"bigquery", "bq"}:
+        log.warning("AGENT_BACKEND desconhecido (%r); usando BigQuery.", kind)
+    return BigQueryBackend()
+
+
+def get_backend() -> Backend:
+    """Backend ativo do processo (criado na primeira chamada a partir de AGENT_BACKEND)."""
+    global _BACKEND
+    if _BACKEND is None:
+        with _BACKEND_LOCK:
+            if _BACKEND is None:
+                _BACKEND = _make_backend(AGENT_BACKEND)
+    return _BACKEND
+
+
+def set_backend(backend: Optional[Backend]) -> None:
+    """Troca o backend ativo (None volta ao padrão de AGENT_BACKEND na próxima chamada)."""
+    global _BACKEND
+    with _BACKEND_LOCK:
+        _BACKEND = backend
@@ -3,9 +3,38 @@ Utilidades para BigQuery usadas pelo agente.
 
 Objetivos
 ---------
-- Fornecer cliente BigQuery a partir de ADC (Cloud Shell).
-- Validar consultas com DRY-RUN antes de executar.
-- Executar SELECTs com retorno em pandas.DataFrame.
+- Fornecer cliente BigQuery a partir de ADC (Cloud Shell), reaproveitado por
+  processo (registro thread-safe por projeto/localização).
+- Validar consultas com DRY-RUN antes de executar (uma única vez: o executor
+  aceita o veredito de um dry-run anterior via `validation_token`).
+- Memorizar vereditos de dry-run por SQL normalizado (TTL + limite de tamanho).
+- Persistir resultados em disco (Parquet), compartilhados entre processos:
+  faixas de partição fechadas no passado não expiram; consultas que tocam
+  `CURRENT_DATE()` ou a partição de hoje têm TTL curto.
+- Executar SELECTs com retorno em pandas.DataFrame ou, no modo "arrow", em um
+  `ArrowResult` (pyarrow.Table com conversão preguiçosa para pandas).
+- Repetir falhas transitórias (429/5xx, rateLimitExceeded/backendError) com
+  backoff exponencial e jitter, limitado pelo prazo da chamada; o job de
+  execução usa id gerado no cliente, então reenviar não duplica job faturável.
+- Limitar a pressão sobre a cota do projeto (controle de admissão): máximo de
+  consultas simultâneas e baldes de fichas de jobs/s e bytes/min, com fila de
+  espera limitada e recusa rápida quando ela transborda.
+- Contabilizar bytes (estimados e faturados) por sessão e por processo em
+  janela deslizante, recusando consultas quando o orçamento acaba e limitando
+  `maximum_bytes_billed` ao saldo restante.
+- Cancelar o job quando o prazo (`timeout` por chamada ou BQ_QUERY_TIMEOUT)
+  estoura, registrando job id e tempo decorrido no retorno.
+- Coalescer execuções idênticas concorrentes (single-flight) em um único job.
+- Submeter lotes de consultas em paralelo (`execute_many`) com concorrência
+  limitada e orçamento de bytes compartilhado pelo lote.
+- Usar o caminho curto `jobs.query` (`query_and_wait`, job opcional) para
+  consultas pequenas e interativas; o fluxo completo de job fica para as grandes.
+- Registrar estatísticas do job (cache_hit, bytes faturados, slot_millis,
+  fila × execução e resumo dos estágios do plano) no retorno.
+- Oferecer variantes asyncio (`adry_run` / `aexecute`) que consultam o estado
+  do job sem bloquear o event loop e cancelam o job se a tarefa for cancelada.
+- Ler resultados grandes pela BigQuery Storage Read API (cliente gRPC
+  reaproveitado), com escolha automática REST × Storage e fallback para REST.
 - Bloquear comandos perigosos (DML/DDL) e múltiplas sentenças.
 - Tratar erros de forma controlada e com mensagens claras.
 
@@ -19,12 +48,94 @@ Adequação ao desafio
 
 from __future__ import annotations
 
-from typing import Optional, TypedDict
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Sequence, Tuple, TypedDict
+import asyncio
+import concurrent.futures
+import contextlib
+import contextvars
+import datetime as dt
+import hashlib
+import hmac
+import json
 import os
+import random
 import re
+import secrets
+import threading
+import time
+import uuid
 import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
 from google.cloud import bigquery
-from google.api_core.exceptions import GoogleAPIError, BadRequest
+from google.api_core.exceptions import (
+    BadGateway,
+    BadRequest,
+    Conflict,
+    GatewayTimeout,
+    GoogleAPIError,
+    InternalServerError,
+    ServiceUnavailable,
+    TooManyRequests,
+)
+
+
+# Resultado colunar (modo "arrow")
+
+
+class ArrowResult:
+    """
+    Resultado tabular mantido como `pyarrow.Table`.
+
+    Escalares e primeiras linhas são lidos direto dos buffers Arrow; a conversão
+    completa para pandas só acontece em `to_pandas()` (e é memorizada).
+    """
+
+    __slots__ = ("table", "_df")
+
+    def __init__(self, table: pa.Table):
+        self.table = table
+        self._df: Optional[pd.DataFrame] = None
+
+    @property
+    def columns(self) -> List[str]:
+        return list(self.table.column_names)
+
+    @property
+    def shape(self) -> Tuple[int, int]:
+        return (self.table.num_rows, self.table.num_columns)
+
+    @property
+    def empty(self) -> bool:
+        return self.table.num_rows == 0
+
+    def __len__(self) -> int:
+        return self.table.num_rows
+
+    def value(self, row: int, column: str) -> Any:
+        """Valor Python de uma célula (sem materializar a tabela)."""
+        return self.table.column(column)[row].as_py()
+
+    def head_records(self, n: int = 5) -> List[Dict[str, Any]]:
+        """Primeiras `n` linhas como lista de dicionários."""
+        return self.table.slice(0, n).to_pylist()
+
+    def head(self, n: int = 5) -> pd.DataFrame:
+        """Primeiras `n` linhas como DataFrame (converte só a fatia)."""
+        if self._df is not None:
+            return self._df.head(n)
+        return self.table.slice(0, n).to_pandas()
+
+    def to_pandas(self) -> pd.DataFrame:
+        """DataFrame completo (convertido na primeira chamada)."""
+        if self._df is None:
+            self._df = self.table.to_pandas()
+        return self._df
+
+    def __repr__(self) -> str:
+        return f"ArrowResult(shape={self.shape}, columns={self.columns})"
 
 
 # Tipagem do retorno para chamadas utilitárias
@@ -34,7 +145,25 @@ class QueryOutcome(TypedDict, total=False):
     ok: bool  # True se sucesso; False se falha
     dry_run_bytes: int | None  # bytes estimados pelo dry-run
     df: Optional[pd.DataFrame]  # resultado da execução (quando aplicável)
+    table: Optional[ArrowResult]  # resultado colunar (result_format="arrow")
     error: Optional[str]  # mensagem de erro (quando aplicável)
+    validation_token: Optional[str]  # HMAC do dry-run ok para (projeto, SQL, bytes)
+    dry_run_cached: bool  # True se o veredito veio do cache de dry-run
+    result_cached: bool  # True se o resultado veio do cache persistente em disco
+    read_path: str  # caminho de leitura do resultado: "rest" | "storage" | "cache"
+    read_ms: float  # tempo (ms) gasto lendo/convertendo o resultado
+    job_id: Optional[str]  # id do job de execução (quando submetido)
+    elapsed_ms: float  # tempo (ms) desde a submissão do job até o fim/abandono
+    timed_out: bool  # True se o prazo estourou (job cancelado)
+    coalesced: bool  # True se o resultado veio de um job idêntico já em andamento
+    query_ms: float  # tempo total (ms) da consulta dentro de `execute_many`
+    query_path: str  # caminho de execução: "fast" (jobs.query) | "job" (jobs.insert)
+    job_stats: Dict[str, Any]  # estatísticas do job (ver `_job_stats`)
+    retries: int  # novas tentativas após erros transitórios (dry-run + execução)
+    backoff_ms: float  # tempo (ms) total de espera entre tentativas
+    queue_wait_ms: float  # tempo (ms) na fila do controle de admissão
+    throttled: bool  # True se a consulta foi recusada pelo controle de admissão
+    budget_exceeded: bool  # True se recusada pelo orçamento de bytes da sessão/processo
 
 
 # Configuração básica por ambiente
@@ -45,17 +174,78 @@ BQ_LOCATION = os.getenv("BQ_LOCATION", "US")
 # Limite "defensivo" de bytes faturáveis em execução real
 MAX_BYTES_BILLED = int(os.getenv("BQ_MAX_BYTES_BILLED", str(2 * 10**9)))
 
-# Timeout (segundos) para aguardar conclusão de uma query
+# Timeout (segundos) para aguardar conclusão de uma query (padrão de `timeout=`)
 QUERY_TIMEOUT = int(os.getenv("BQ_QUERY_TIMEOUT", "60"))
 
+# Intervalo inicial e máximo (segundos) entre consultas de estado no modo async
+ASYNC_POLL_INTERVAL = float(os.getenv("BQ_ASYNC_POLL_INTERVAL", "0.2"))
+ASYNC_POLL_MAX_INTERVAL = float(os.getenv("BQ_ASYNC_POLL_MAX_INTERVAL", "2.0"))
+
+# Caminho de execução:
+#   "auto" (padrão) → `query_and_wait` (jobs.query) quando o dry-run estima até
+#   BQ_FAST_PATH_MAX_BYTES; acima disso, fluxo completo de job. "fast"/"job" forçam.
+QUERY_MODE = os.getenv("BQ_QUERY_MODE", "auto").strip().lower()
+FAST_PATH_MAX_BYTES = int(os.getenv("BQ_FAST_PATH_MAX_BYTES", str(500 * 1024 * 1024)))
+# Modo de criação de job do caminho curto (JOB_CREATION_OPTIONAL dispensa o job)
+JOB_CREATION_MODE = os.getenv("BQ_JOB_CREATION_MODE", "JOB_CREATION_OPTIONAL")
+
+# Concorrência padrão de `execute_many`
+BATCH_MAX_CONCURRENCY = int(os.getenv("BQ_BATCH_MAX_CONCURRENCY", "8"))
+
+# Single-flight: coalesce execuções idênticas concorrentes em um único job
+SINGLEFLIGHT_ENABLED = os.getenv("BQ_SINGLEFLIGHT", "1") == "1"
+
+# Retentativas de erros transitórios: número máximo de tentativas por chamada e
+# backoff exponencial (segundos) com jitter total, sempre limitado pelo prazo
+RETRY_MAX_ATTEMPTS = int(os.getenv("BQ_RETRY_MAX_ATTEMPTS", "4"))
+RETRY_INITIAL_BACKOFF = float(os.getenv("BQ_RETRY_INITIAL_BACKOFF", "0.5"))
+RETRY_MAX_BACKOFF = float(os.getenv("BQ_RETRY_MAX_BACKOFF", "8.0"))
+# Prefixo dos job ids gerados no cliente (idempotência da submissão)
+JOB_ID_PREFIX = os.getenv("BQ_JOB_ID_PREFIX", "genai_rio_")
+
+# Controle de admissão (por processo; 0 desliga cada limite):
+#   consultas simultâneas, jobs por segundo, bytes estimados por minuto e espera
+#   máxima (segundos) na fila antes de recusar
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("BQ_MAX_IN_FLIGHT", "16"))
+ADMISSION_JOBS_PER_SEC = float(os.getenv("BQ_JOBS_PER_SEC", "10"))
+ADMISSION_BYTES_PER_MIN = float(os.getenv("BQ_BYTES_PER_MIN", str(20 * 10**9)))
+ADMISSION_MAX_WAIT = float(os.getenv("BQ_ADMISSION_MAX_WAIT", "5"))
+
+# Orçamento de bytes em janela deslizante (0 desliga): por sessão e por processo.
+# Soma bytes estimados (dry-run) e, quando conhecidos, os bytes faturados.
+BUDGET_WINDOW = float(os.getenv("BQ_BUDGET_WINDOW", "3600"))
+SESSION_BUDGET_BYTES = int(os.getenv("BQ_SESSION_BUDGET_BYTES", str(20 * 10**9)))
+PROCESS_BUDGET_BYTES = int(os.getenv("BQ_PROCESS_BUDGET_BYTES", str(200 * 10**9)))
+
 # Rótulos de auditoria (visíveis no Job do BigQuery)
 JOB_LABELS = {
     "app": os.getenv("APP_LABEL", "genai-rio-agent"),
     "env": os.getenv("ENV_LABEL", "dev"),
 }
 
-# Permite usar BigQuery Storage API para to_dataframe
-USE_BQSTORAGE = os.getenv("BQ_USE_BQSTORAGE", "0") == "1"
+# Cache de dry-run: validade (segundos) e número máximo de entradas (0 desliga)
+DRY_RUN_CACHE_TTL = float(os.getenv("BQ_DRY_RUN_CACHE_TTL", "300"))
+DRY_RUN_CACHE_SIZE = int(os.getenv("BQ_DRY_RUN_CACHE_SIZE", "256"))
+
+# Cache persistente de resultados (Parquet em disco, compartilhado entre processos)
+RESULT_CACHE_ENABLED = os.getenv("BQ_RESULT_CACHE", "1") == "1"
+RESULT_CACHE_DIR = os.getenv(
+    "BQ_RESULT_CACHE_DIR",
+    str(Path(__file__).resolve().parents[2] / ".cache" / "bq_results"),
+)
+# TTL (segundos) de resultados "vivos" (CURRENT_DATE, partição de hoje, sem faixa fechada)
+RESULT_CACHE_TTL = float(os.getenv("BQ_RESULT_CACHE_TTL", "600"))
+# Partições dos últimos N dias ainda podem receber dados (tratadas como vivas)
+RESULT_CACHE_OPEN_DAYS = int(os.getenv("BQ_RESULT_CACHE_OPEN_DAYS", "1"))
+# Teto de espaço em disco (MB); os arquivos mais antigos são removidos primeiro
+RESULT_CACHE_MAX_MB = float(os.getenv("BQ_RESULT_CACHE_MAX_MB", "512"))
+
+# Leitura via BigQuery Storage Read API:
+#   "auto" (padrão) → usa Storage acima dos limiares abaixo; "1" → sempre; "0" → nunca.
+USE_BQSTORAGE = os.getenv("BQ_USE_BQSTORAGE", "auto").strip().lower()
+# Limiares da escolha automática (linhas do resultado / bytes estimados do resultado)
+BQSTORAGE_MIN_ROWS = int(os.getenv("BQ_STORAGE_MIN_ROWS", "20000"))
+BQSTORAGE_MIN_BYTES = int(os.getenv("BQ_STORAGE_MIN_BYTES", str(16 * 1024 * 1024)))
 
 # Comandos DML/DDL/administrativos proibidos por segurança
 _FORBIDDEN_PAT = re.compile(
@@ -69,6 +259,26 @@ _SQL_LINE_COMMENTS = re.compile(r"(^|\n)\s*--.*")
 # Qualquer ponto-e-vírgula (;) fora de comentários indica múltiplas sentenças.
 _SQL_ANY_SEMICOLON = re.compile(r";")
 
+# Funções de data/hora "vivas" (resultado muda com o relógio)
+_SQL_VOLATILE = re.compile(
+    r"\b(CURRENT_DATE|CURRENT_DATETIME|CURRENT_TIMESTAMP|CURRENT_TIME)\b",
+    re.IGNORECASE,
+)
+# Literais de data (DATE 'YYYY-MM-DD')
+_SQL_DATE_LITERAL = re.compile(r"\bDATE\s*'(\d{4})-(\d{2})-(\d{2})'", re.IGNORECASE)
+# Comparações sobre a coluna de partição ou o dia de abertura (DATE(data_inicio))
+_SQL_PARTITION_CMP = re.compile(
+    r"(?:\bdata_particao|\bDATE\(\s*(?:\w+\.)?data_inicio\s*\))\s*"
+    r"(<=|>=|<|>|=|BETWEEN\b)",
+    re.IGNORECASE,
+)
+# Ano de abertura/partição: EXTRACT(YEAR FROM c.data_inicio) = 2023
+_SQL_YEAR_CMP = re.compile(
+    r"\bEXTRACT\(\s*YEAR\s+FROM\s+(?:\w+\.)?(?:data_inicio|data_particao)\s*\)"
+    r"\s*(<=|>=|<|>|=|BETWEEN\b)\s*(\d{4})\b",
+    re.IGNORECASE,
+)
+
 # SELECT * (checagem leve; removidos comentários)
 _SQL_SELECT_STAR = re.compile(
     r"^\s*(WITH\b.*?\bSELECT\b|SELECT\b).*?\*\s", re.IGNORECASE | re.DOTALL
@@ -76,22 +286,200 @@ _SQL_SELECT_STAR = re.compile(
 
 
 # Cliente
+#   Um único `bigquery.Client` por (projeto, localização) no processo: evita
+#   refazer a busca de credenciais (ADC), o handshake TLS e o pool HTTP a cada
+#   dry-run/execução. As credenciais ADC também são resolvidas uma única vez.
+
+_CLIENTS: Dict[Tuple[str, str], bigquery.Client] = {}
+_CLIENTS_LOCK = threading.Lock()
+_CREDENTIALS = None
+# Cliente da Storage Read API (None = ainda não criado; False = lib indisponível)
+_BQSTORAGE_CLIENT: Any = None
+
 
+def _default_credentials():
+    """Resolve (e memoriza) as credenciais ADC compartilhadas entre os clientes."""
+    global _CREDENTIALS
+    if _CREDENTIALS is None:
+        import google.auth
 
-def get_bq_client(project_id: Optional[str] = None) -> bigquery.Client:
+        _CREDENTIALS, _ = google.auth.default(scopes=bigquery.Client.SCOPE)
+    return _CREDENTIALS
+
+
+def get_bq_client(
+    project_id: Optional[str] = None, location: Optional[str] = None
+) -> bigquery.Client:
     """
-    Cria um cliente BigQuery usando Application Default Credentials (ADC).
+    Retorna o cliente BigQuery do processo para (projeto, localização).
+
+    O cliente é criado na primeira chamada usando Application Default Credentials
+    (ADC) e reutilizado nas seguintes (mesmas credenciais e pool de conexões HTTP).
 
     Parameters
     ----------
     project_id : str | None
         ID do projeto GCP. Se None, usa PROJECT_ID (ou 'genai-rio' como fallback).
+    location : str | None
+        Localização dos jobs. Se None, usa BQ_LOCATION.
 
     Returns
     -------
     google.cloud.bigquery.Client
     """
-    return bigquery.Client(project=project_id or DEFAULT_PROJECT, location=BQ_LOCATION)
+    key = (project_id or DEFAULT_PROJECT, location or BQ_LOCATION)
+    client = _CLIENTS.get(key)
+    if client is not None:
+        return client
+    with _CLIENTS_LOCK:
+        client = _CLIENTS.get(key)
+        if client is None:
+            kwargs = {
+                "project": key[0],
+                "location": key[1],
+                "credentials": _default_credentials(),
+            }
+            try:
+                client = bigquery.Client(
+                    default_job_creation_mode=JOB_CREATION_MODE or None, **kwargs
+                )
+            except TypeError:
+                # Versões antigas da lib não aceitam default_job_creation_mode
+                client = bigquery.Client(**kwargs)
+            _CLIENTS[key] = client
+    return client
+
+
+def get_bqstorage_client():
+    """
+    Retorna o `BigQueryReadClient` do processo, ou None se a biblioteca
+    `google-cloud-bigquery-storage` não estiver disponível.
+
+    O cliente (canal gRPC) é criado uma vez e compartilhado entre as leituras.
+    """
+    global _BQSTORAGE_CLIENT
+    if _BQSTORAGE_CLIENT is None:
+        with _CLIENTS_LOCK:
+            if _BQSTORAGE_CLIENT is None:
+                try:
+                    from google.cloud import bigquery_storage
+
+                    _BQSTORAGE_CLIENT = bigquery_storage.BigQueryReadClient(
+                        credentials=_default_credentials()
+                    )
+                except Exception:
+                    _BQSTORAGE_CLIENT = False
+    return _BQSTORAGE_CLIENT or None
+
+
+def close_all() -> None:
+    """
+    Fecha e descarta todos os clientes do registro (e as credenciais memorizadas).
+
+    Útil em testes e no encerramento do processo; a próxima chamada a
+    `get_bq_client` cria um cliente novo.
+    """
+    global _CREDENTIALS, _BQSTORAGE_CLIENT
+    with _CLIENTS_LOCK:
+        clients = list(_CLIENTS.values())
+        _CLIENTS.clear()
+        _CREDENTIALS = None
+        storage, _BQSTORAGE_CLIENT = _BQSTORAGE_CLIENT, None
+    for client in clients:
+        try:
+            client.close()
+        except Exception:
+            pass
+    if storage:
+        # API pública do cliente da Storage Read API (`transport` + `close()`)
+        close = getattr(getattr(storage, "transport", None), "close", None)
+        if callable(close):
+            try:
+                close()
+            except Exception:
+                pass
+
+
+def _reset_after_fork() -> None:
+    """
+    Descarta o registro no processo filho após `fork()` sem fechar as conexões,
+    que continuam pertencendo ao processo pai.
+    """
+    global _CLIENTS_LOCK, _CREDENTIALS, _BQSTORAGE_CLIENT
+    _CLIENTS_LOCK = threading.Lock()
+    _CLIENTS.clear()
+    _CREDENTIALS = None
+    _BQSTORAGE_CLIENT = None
+
+
+if hasattr(os, "register_at_fork"):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+# Cache em memória com TTL
+
+
+class _TTLCache:
+    """
+    Cache LRU thread-safe com expiração por entrada e contadores de hit/miss.
+
+    Os valores são dicionários; `get` devolve uma cópia rasa para que o chamador
+    possa anotá-la sem alterar a entrada memorizada.
+    """
+
+    def __init__(self, ttl: float, maxsize: int):
+        self.ttl = ttl
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._data: "OrderedDict[Any, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Any) -> Optional[Dict[str, Any]]:
+        now = time.monotonic()
+        with self._lock:
+            item = self._data.get(key)
+            if item is not None and item[0] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return dict(item[1])
+            if item is not None:
+                del self._data[key]
+            self.misses += 1
+            return None
+
+    def put(self, key: Any, value: Dict[str, Any], ttl: Optional[float] = None) -> None:
+        if self.maxsize <= 0:
+            return
+        expires = time.monotonic() + (self.ttl if ttl is None else ttl)
+        with self._lock:
+            self._data[key] = (expires, dict(value))
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hits": self.hits, "misses": self.misses, "size": len(self._data)}
+
+
+_DRY_RUN_CACHE = _TTLCache(ttl=DRY_RUN_CACHE_TTL, maxsize=DRY_RUN_CACHE_SIZE)
+
+
+def dry_run_cache_stats() -> Dict[str, int]:
+    """Contadores do cache de dry-run: {"hits", "misses", "size"}."""
+    return _DRY_RUN_CACHE.stats()
+
+
+def clear_dry_run_cache() -> None:
+    """Esvazia o cache de dry-run e zera os contadores."""
+    _DRY_RUN_CACHE.clear()
 
 
 # Helpers
@@ -109,6 +497,25 @@ def _normalize_sql(sql: str) -> str:
     return s.strip()
 
 
+# Chave do processo para assinar vereditos de dry-run (não sai do processo)
+_TOKEN_KEY = secrets.token_bytes(32)
+
+
+def _validation_token(
+    sql: str, project_id: Optional[str] = None, dry_run_bytes: Optional[int] = None
+) -> str:
+    """
+    HMAC que amarra um dry-run aprovado a (projeto, SQL normalizado, bytes estimados).
+
+    Só este processo emite tokens válidos, e os bytes entram na assinatura: o
+    executor só dispensa um novo dry-run quando o veredito recebido foi emitido
+    aqui, para o SQL que está prestes a rodar, com a estimativa intacta (ela
+    alimenta orçamento, admissão e teto de bytes).
+    """
+    key = f"{project_id or DEFAULT_PROJECT}|{dry_run_bytes}|{_normalize_sql(sql)}"
+    return hmac.new(_TOKEN_KEY, key.encode("utf-8"), hashlib.sha256).hexdigest()
+
+
 def _err_from_badrequest(e: BadRequest) -> str:
     """Extrai mensagens detalhadas de BadRequest (quando disponíveis)."""
     # Alguns BadRequest têm .errors
@@ -172,13 +579,131 @@ def has_select_star(sql: str) -> bool:
     return bool(_SQL_SELECT_STAR.search(stripped))
 
 
+# Retentativas
+#   Só erros transitórios são repetidos (cota/limite de taxa, 5xx, falha de
+#   backend). O atraso antes da tentativa n é uniforme em
+#   [0, min(BQ_RETRY_MAX_BACKOFF, BQ_RETRY_INITIAL_BACKOFF · 2^n)] ("full
+#   jitter"), e nunca se espera além do prazo da chamada.
+
+_RETRYABLE_ERRORS = (
+    TooManyRequests,
+    InternalServerError,
+    BadGateway,
+    ServiceUnavailable,
+    GatewayTimeout,
+    ConnectionError,
+)
+# Motivos transitórios que o BigQuery também devolve como 400/403
+_RETRYABLE_REASONS = {
+    "rateLimitExceeded",
+    "backendError",
+    "internalError",
+    "jobBackendError",
+    "jobInternalError",
+}
+
+
+def _is_retryable(e: BaseException) -> bool:
+    if isinstance(e, _RETRYABLE_ERRORS):
+        return True
+    if isinstance(e, GoogleAPIError):
+        for err in getattr(e, "errors", None) or []:
+            if isinstance(err, dict) and err.get("reason") in _RETRYABLE_REASONS:
+                return True
+    return False
+
+
+class _Retries:
+    """Contabiliza as novas tentativas de uma chamada e decide o próximo atraso."""
+
+    __slots__ = ("count", "backoff_ms")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.backoff_ms = 0.0
+
+    def next_delay(
+        self, e: BaseException, attempt: int, deadline: Optional[float]
+    ) -> Optional[float]:
+        """
+        Atraso (segundos) antes de repetir após a falha `e` na tentativa `attempt`
+        (0 = primeira), ou None se o erro não é transitório, as tentativas
+        acabaram ou o atraso não cabe no prazo.
+        """
+        if not _is_retryable(e) or attempt + 1 >= RETRY_MAX_ATTEMPTS:
+            return None
+        delay = random.uniform(
+            0.0, min(RETRY_MAX_BACKOFF, RETRY_INITIAL_BACKOFF * (2**attempt))
+        )
+        if deadline is not None and delay >= _remaining(deadline):
+            return None
+        self.count += 1
+        self.backoff_ms += delay * 1000.0
+        return delay
+
+    def absorb(self, out: QueryOutcome) -> None:
+        """Soma as retentativas já registradas em outro outcome (ex.: do dry-run)."""
+        self.count += out.get("retries", 0)
+        self.backoff_ms += out.get("backoff_ms", 0.0)
+
+    def annotate(self, out: QueryOutcome) -> QueryOutcome:
+        out["retries"] = out.get("retries", 0) + self.count
+        out["backoff_ms"] = out.get("backoff_ms", 0.0) + self.backoff_ms
+        return out
+
+
+def _new_job_id() -> str:
+    return f"{JOB_ID_PREFIX}{uuid.uuid4().hex}"
+
+
+# Rótulo com o id da requisição do caminho curto (`jobs.query` não aceita job id)
+_REQUEST_LABEL = "request_id"
+
+
+def _submit_job(client, sql: str, job_id: str):
+    """
+    Submete o job de execução com id gerado no cliente.
+
+    Se uma tentativa anterior chegou ao BigQuery mas a resposta se perdeu, o
+    reenvio com o mesmo id recebe 409 (Conflict): o job existente é recuperado
+    em vez de criar (e faturar) um segundo.
+    """
+    try:
+        return client.query(sql, job_config=_execution_job_config(), job_id=job_id)
+    except Conflict:
+        return client.get_job(job_id, location=BQ_LOCATION)
+
+
+def _next_attempt(job, job_id: str) -> Tuple[Any, str]:
+    """
+    (job, job_id) da próxima tentativa: um job que falhou de fato é substituído
+    por um novo (novo id); senão a mesma submissão é reaproveitada.
+    """
+    if job is not None and getattr(job, "error_result", None):
+        return None, _new_job_id()
+    return job, job_id
+
+
 # DRY-RUN
 
 
-def dry_run(sql: str, project_id: Optional[str] = None) -> QueryOutcome:
+def dry_run(
+    sql: str, project_id: Optional[str] = None, timeout: Optional[float] = None
+) -> QueryOutcome:
     """
     Executa um DRY-RUN no BigQuery para validar sintaxe e estimar bytes processados.
 
+    Vereditos determinísticos (aprovação ou BadRequest de SQL) ficam em cache por
+    `BQ_DRY_RUN_CACHE_TTL` segundos, chaveados por (SQL normalizado, projeto,
+    localização). Erros transitórios da API nunca são memorizados.
+
+    Parameters
+    ----------
+    timeout : float | None
+        Prazo (segundos) para a validação inteira, retentativas incluídas
+        (`execute` passa o que resta do prazo dele). Se None, BQ_QUERY_TIMEOUT.
+        Ao estourar, o outcome traz `timed_out=True`.
+
     Returns
     -------
     QueryOutcome
@@ -205,6 +730,12 @@ def dry_run(sql: str, project_id: Optional[str] = None) -> QueryOutcome:
             "dry_run_bytes": None,
         }
 
+    cache_key = (_normalize_sql(sql), project_id or DEFAULT_PROJECT, BQ_LOCATION)
+    cached = _DRY_RUN_CACHE.get(cache_key)
+    if cached is not None:
+        cached["dry_run_cached"] = True
+        return cached  # type: ignore[return-value]
+
     client = get_bq_client(project_id)
     job_config = bigquery.QueryJobConfig(
         dry_run=True,
@@ -212,53 +743,336 @@ def dry_run(sql: str, project_id: Optional[str] = None) -> QueryOutcome:
         labels=JOB_LABELS,
     )
 
-    try:
-        job = client.query(sql, job_config=job_config)
-        # job.result() dispara a validação no modo dry-run
-        job.result()
-        return {"ok": True, "dry_run_bytes": job.total_bytes_processed}
-    except BadRequest as e:
-        # Erros SQL
-        return {
+    retries = _Retries()
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    attempt = 0
+    while True:
+        try:
+            if _remaining(deadline) <= 0:
+                raise TimeoutError("prazo esgotado antes do dry-run")
+            job = client.query(sql, job_config=job_config, timeout=_remaining(deadline))
+            # job.result() dispara a validação no modo dry-run
+            job.result(timeout=_remaining(deadline))
+            out: QueryOutcome = {
+                "ok": True,
+                "dry_run_bytes": job.total_bytes_processed,
+                "validation_token": _validation_token(
+                    sql, project_id, job.total_bytes_processed
+                ),
+            }
+            _DRY_RUN_CACHE.put(cache_key, out)
+            return retries.annotate(out)
+        except _TIMEOUT_ERRORS:
+            return retries.annotate(
+                {
+                    "ok": False,
+                    "error": f"Tempo limite excedido no dry-run ({timeout:g}s).",
+                    "dry_run_bytes": None,
+                    "timed_out": True,
+                }
+            )
+        except Exception as e:
+            # Dry-run não cria job faturável: repetir é sempre seguro
+            delay = retries.next_delay(e, attempt, deadline)
+            if delay is None:
+                return retries.annotate(_dry_run_error(e, cache_key))
+            time.sleep(delay)
+            attempt += 1
+
+
+def _dry_run_error(e: Exception, cache_key: Tuple[str, ...]) -> QueryOutcome:
+    if isinstance(e, BadRequest) and not _is_retryable(e):
+        # Erros SQL (determinísticos: podem ir para o cache)
+        out: QueryOutcome = {
             "ok": False,
             "error": f"Erro de validação (BadRequest): {_err_from_badrequest(e)}",
         }
-    except GoogleAPIError as e:
+        _DRY_RUN_CACHE.put(cache_key, out)
+        return out
+    if isinstance(e, GoogleAPIError):
         return {"ok": False, "error": f"Erro na API do BigQuery: {repr(e)}"}
-    except Exception as e:
-        return {"ok": False, "error": f"Erro inesperado no dry-run: {repr(e)}"}
+    return {"ok": False, "error": f"Erro inesperado no dry-run: {repr(e)}"}
+
+
+# Cache persistente de resultados
+
+
+def _result_cache_ttl(sql: str) -> Optional[float]:
+    """
+    Política de expiração de um resultado em cache.
+
+    Returns
+    -------
+    float | None
+        None  → resultado imutável (janela fechada e toda no passado: faixa de
+                `data_particao`/`DATE(data_inicio)` ou ano via `EXTRACT(YEAR ...)`).
+        float → TTL curto (`RESULT_CACHE_TTL`) para tudo que pode mudar: funções de
+                data corrente, literais em partições recentes/futuras, faixas abertas
+                ou consultas sem filtro de data.
+    """
+    s = _normalize_sql(sql)
+    if _SQL_VOLATILE.search(s):
+        return RESULT_CACHE_TTL
+
+    years = _SQL_YEAR_CMP.findall(s)
+    ops = {m.group(1).upper() for m in _SQL_PARTITION_CMP.finditer(s)}
+    ops |= {op.upper() for op, _ in years}
+    if not ops & {"=", "<", "<=", "BETWEEN"}:
+        # Sem limite superior de data: o conjunto de dados ainda cresce
+        return RESULT_CACHE_TTL
+
+    # Hoje em UTC, como CURRENT_DATE() do BigQuery (não a data local do host)
+    today = dt.datetime.now(dt.timezone.utc).date()
+    open_from = today - dt.timedelta(days=RESULT_CACHE_OPEN_DAYS)
+    # Um ano cobre até 31/12: o limite é o primeiro dia do ano seguinte
+    bounds = [(int(y) + 1, 1, 1) for _, y in years]
+    for y, m, d in _SQL_DATE_LITERAL.findall(s) + bounds:
+        try:
+            if dt.date(int(y), int(m), int(d)) > open_from:
+                return RESULT_CACHE_TTL
+        except ValueError:
+            return RESULT_CACHE_TTL
+    return None
+
+
+def _result_cache_paths(sql: str, project_id: Optional[str]) -> Tuple[Path, Path]:
+    """Caminhos (dados .parquet, metadados .json) da entrada de cache do SQL."""
+    key = f"{project_id or DEFAULT_PROJECT}|{BQ_LOCATION}|{_normalize_sql(sql)}"
+    digest = hashlib.sha256(key.encode("utf-8")).hexdigest()
+    base = Path(RESULT_CACHE_DIR)
+    return base / f"{digest}.parquet", base / f"{digest}.json"
+
+
+def _result_cache_get(
+    sql: str, project_id: Optional[str], result_format: str = "pandas"
+) -> Optional[QueryOutcome]:
+    """Lê um resultado válido do cache em disco (None se ausente/expirado/corrompido)."""
+    if not RESULT_CACHE_ENABLED:
+        return None
+    data_path, meta_path = _result_cache_paths(sql, project_id)
+    try:
+        meta = json.loads(meta_path.read_text(encoding="utf-8"))
+        expires_at = meta.get("expires_at")
+        if expires_at is not None and expires_at <= time.time():
+            data_path.unlink(missing_ok=True)
+            meta_path.unlink(missing_ok=True)
+            return None
+        t0 = time.perf_counter()
+        table = pq.read_table(data_path)
+    except Exception:
+        return None
+    out: QueryOutcome = {
+        "ok": True,
+        "dry_run_bytes": meta.get("dry_run_bytes"),
+        "result_cached": True,
+        "read_path": "cache",
+    }
+    if result_format == "arrow":
+        out.update(df=None, table=ArrowResult(table))
+    else:
+        out["df"] = table.to_pandas()
+    out["read_ms"] = (time.perf_counter() - t0) * 1000.0
+    return out
+
+
+def _result_cache_put(
+    sql: str,
+    project_id: Optional[str],
+    data: "pd.DataFrame | pa.Table | None",
+    dry_run_bytes: Optional[int],
+) -> None:
+    """
+    Grava o resultado em disco de forma atômica (arquivo temporário + rename),
+    para que leitores concorrentes nunca vejam uma entrada pela metade.
+    """
+    if not RESULT_CACHE_ENABLED or data is None:
+        return
+    data_path, meta_path = _result_cache_paths(sql, project_id)
+    ttl = _result_cache_ttl(sql)
+    meta = {
+        "sql": _normalize_sql(sql),
+        "created_at": time.time(),
+        "expires_at": None if ttl is None else time.time() + ttl,
+        "dry_run_bytes": dry_run_bytes,
+    }
+    suffix = f".{os.getpid()}.{threading.get_ident()}.tmp"
+    try:
+        data_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_data = data_path.with_name(data_path.name + suffix)
+        tmp_meta = meta_path.with_name(meta_path.name + suffix)
+        table = (
+            data
+            if isinstance(data, pa.Table)
+            else pa.Table.from_pandas(data, preserve_index=False)
+        )
+        pq.write_table(table, tmp_data)
+        tmp_meta.write_text(json.dumps(meta), encoding="utf-8")
+        # Dados antes dos metadados: a entrada só "existe" quando o .json aparece
+        os.replace(tmp_data, data_path)
+        os.replace(tmp_meta, meta_path)
+    except Exception:
+        return
+    _result_cache_prune()
+
+
+def _result_cache_prune() -> None:
+    """Remove as entradas mais antigas quando o diretório passa de `RESULT_CACHE_MAX_MB`."""
+    if RESULT_CACHE_MAX_MB <= 0:
+        return
+    try:
+        files = [p for p in Path(RESULT_CACHE_DIR).glob("*.parquet") if p.is_file()]
+        stats = [(p, p.stat()) for p in files]
+    except OSError:
+        return
+    budget = RESULT_CACHE_MAX_MB * 1024 * 1024
+    total = sum(st.st_size for _, st in stats)
+    for path, st in sorted(stats, key=lambda x: x[1].st_mtime):
+        if total <= budget:
+            break
+        try:
+            path.with_suffix(".json").unlink(missing_ok=True)
+            path.unlink(missing_ok=True)
+        except OSError:
+            continue
+        total -= st.st_size
+
+
+def clear_result_cache() -> None:
+    """Apaga todas as entradas do cache persistente de resultados."""
+    base = Path(RESULT_CACHE_DIR)
+    if not base.is_dir():
+        return
+    for path in base.iterdir():
+        if path.suffix in {".parquet", ".json", ".tmp"}:
+            path.unlink(missing_ok=True)
 
 
 # Execução
 
 
-def execute(sql: str, project_id: Optional[str] = None) -> QueryOutcome:
+def _accept_prevalidated(
+    sql: str, project_id: Optional[str], prevalidated: Optional[QueryOutcome]
+) -> Optional[QueryOutcome]:
     """
-    Executa uma consulta SELECT no BigQuery e retorna um DataFrame.
+    Retorna `prevalidated` se ele for um dry-run aprovado para este mesmo SQL.
+
+    As guardas estáticas (SELECT-only, sem SELECT *) são sempre reaplicadas; só
+    a chamada de rede do dry-run é dispensada.
+    """
+    if not prevalidated or not prevalidated.get("ok"):
+        return None
+    token = prevalidated.get("validation_token")
+    expected = _validation_token(sql, project_id, prevalidated.get("dry_run_bytes"))
+    if not token or not hmac.compare_digest(str(token), expected):
+        return None
+    if not is_select_only(sql) or has_select_star(sql):
+        return None
+    return prevalidated
+
+
+def _wants_bqstorage(result) -> bool:
+    """
+    Decide se o resultado deve ser lido pela Storage Read API.
+
+    No modo "auto", usa Storage quando o número de linhas passa de
+    `BQ_STORAGE_MIN_ROWS` ou o tamanho estimado (linhas × colunas × 8 bytes)
+    passa de `BQ_STORAGE_MIN_BYTES`. Resultados pequenos ficam no REST, que
+    evita abrir uma sessão de leitura.
+    """
+    if USE_BQSTORAGE in {"0", "false", "off"}:
+        return False
+    if USE_BQSTORAGE in {"1", "true", "on"}:
+        return True
+    rows = getattr(result, "total_rows", None) or 0
+    ncols = len(getattr(result, "schema", None) or []) or 1
+    return rows >= BQSTORAGE_MIN_ROWS or rows * ncols * 8 >= BQSTORAGE_MIN_BYTES
+
+
+def _storage_applies(result, storage) -> bool:
+    """
+    Mesma decisão de `RowIterator.to_arrow/to_dataframe`: com a primeira página
+    já cobrindo quase todo o resultado, sem tabela de destino ou com paginação
+    iniciada, a biblioteca lê por REST mesmo recebendo o cliente do Storage.
+    """
+    check = getattr(result, "_should_use_bqstorage", None)
+    if not callable(check):
+        return True
+    try:
+        return bool(check(storage, False))
+    except Exception:
+        return True
 
-    Fluxo
-    -----
-    1) Dry-run para validação/custo.
-    2) Execução real se dry-run passar e se `maximum_bytes_billed` permitir.
+
+def _read_result(job, result, result_format: str, deadline: Optional[float] = None):
+    """
+    Lê o resultado do job como DataFrame ou pyarrow.Table.
 
     Returns
     -------
-    QueryOutcome
-        ok=True e `df` preenchido em sucesso; caso contrário, `error` preenchido.
+    (dados, read_path, read_ms)
+        read_path = "storage" | "rest", o caminho que a leitura de fato usou.
+        Se a leitura via Storage falhar, refaz pelo REST (o resultado do job
+        continua disponível na tabela temporária) dentro do que resta do prazo
+        da chamada (`deadline`, monotônico; None = QUERY_TIMEOUT). Prazo
+        esgotado levanta TimeoutError, tratado pelo chamador como nos demais
+        estouros. `job` é None no caminho curto (`query_and_wait`), sempre lido
+        por REST.
     """
-    if not (sql or "").strip():
-        return {"ok": False, "error": "SQL vazio no executor.", "df": None}
-
-    # 1) validação (dry-run)
-    dv = dry_run(sql, project_id=project_id)
+    read = "to_arrow" if result_format == "arrow" else "to_dataframe"
+    t0 = time.perf_counter()
+    # Caminho curto: o RowIterator do `query_and_wait` não tem tabela de destino
+    # (a biblioteca leria por REST de todo jeito) nem job para refazer a leitura
+    # se o Storage falhar com o iterador já consumido em parte
+    storage = None
+    if job is not None and _wants_bqstorage(result):
+        storage = get_bqstorage_client()
+    if storage is not None and not _storage_applies(result, storage):
+        storage = None
+    if storage is not None:
+        try:
+            data = getattr(result, read)(bqstorage_client=storage)
+            return data, "storage", (time.perf_counter() - t0) * 1000.0
+        except Exception:
+            timeout = QUERY_TIMEOUT if deadline is None else _remaining(deadline)
+            if timeout <= 0:
+                raise TimeoutError("prazo esgotado antes da leitura via REST")
+            result = job.result(timeout=timeout)
+    data = getattr(result, read)(create_bqstorage_client=False)
+    return data, "rest", (time.perf_counter() - t0) * 1000.0
+
+
+def _check_result_format(result_format: str) -> None:
+    if result_format not in {"pandas", "arrow"}:
+        raise ValueError(f"result_format inválido: {result_format!r}")
+
+
+def _cached_result(
+    sql: str, project_id: Optional[str], result_format: str
+) -> Optional[QueryOutcome]:
+    """Hit do cache persistente, se o SQL passa nas guardas e no teto de custo."""
+    if not is_select_only(sql) or has_select_star(sql):
+        return None
+    hit = _result_cache_get(sql, project_id, result_format)
+    cached_bytes = (hit or {}).get("dry_run_bytes") or 0
+    if hit is None or (MAX_BYTES_BILLED and cached_bytes > MAX_BYTES_BILLED):
+        return None
+    return hit
+
+
+def _dry_run_refusal(dv: QueryOutcome) -> Optional[QueryOutcome]:
+    """Outcome de erro se o dry-run falhou ou se o custo estimado passa do teto."""
     if not dv.get("ok"):
         # Propaga o erro do dry-run
-        return {
+        out: QueryOutcome = {
             "ok": False,
             "error": dv.get("error"),
             "df": None,
             "dry_run_bytes": dv.get("dry_run_bytes"),
         }
+        if dv.get("timed_out"):
+            out["timed_out"] = True
+        return out
 
     # Bloqueio por custo estimado
     est_bytes = dv.get("dry_run_bytes") or 0
@@ -272,45 +1086,1316 @@ def execute(sql: str, project_id: Optional[str] = None) -> QueryOutcome:
             "df": None,
             "dry_run_bytes": est_bytes,
         }
-
-    client = get_bq_client(project_id)
-    job_config = bigquery.QueryJobConfig(
+    return None
+
+
+def _execution_job_config(request_id: Optional[str] = None) -> bigquery.QueryJobConfig:
+    # Teto de bytes faturáveis: o menor entre o limite por consulta e o saldo do
+    # orçamento da sessão/processo (quando houver)
+    caps = [c for c in (MAX_BYTES_BILLED, _BYTES_CAP.get()) if c]
+    labels = {**JOB_LABELS, "session": _label_value(_BUDGET_SESSION.get())}
+    if request_id:
+        # Caminho curto: o id do job é do servidor; o rótulo permite achá-lo
+        labels[_REQUEST_LABEL] = _label_value(request_id)
+    return bigquery.QueryJobConfig(
         dry_run=False,
         use_query_cache=True,
         # Limita o job a um teto de bytes faturáveis
-        maximum_bytes_billed=MAX_BYTES_BILLED if MAX_BYTES_BILLED else None,
+        maximum_bytes_billed=min(caps) if caps else None,
         priority=bigquery.QueryPriority.INTERACTIVE,
-        labels=JOB_LABELS,
+        labels=labels,
     )
 
+
+def _success_outcome(
+    sql: str,
+    project_id: Optional[str],
+    data: Any,
+    read_path: str,
+    read_ms: float,
+    est_bytes: int,
+    result_format: str,
+) -> QueryOutcome:
+    """Grava no cache persistente e monta o outcome de sucesso."""
+    _result_cache_put(sql, project_id, data, est_bytes)
+    out: QueryOutcome = {
+        "ok": True,
+        "dry_run_bytes": est_bytes,
+        "read_path": read_path,
+        "read_ms": read_ms,
+    }
+    if result_format == "arrow":
+        out.update(df=None, table=ArrowResult(data))
+    else:
+        out["df"] = data
+    return out
+
+
+_TIMEOUT_ERRORS = (TimeoutError, concurrent.futures.TimeoutError)
+
+
+def _remaining(deadline: float) -> float:
+    """Segundos restantes até `deadline` (monotônico), nunca negativo."""
+    return max(0.0, deadline - time.monotonic())
+
+
+def _job_id(job) -> Optional[str]:
+    return getattr(job, "job_id", None) if job is not None else None
+
+
+def _cancel_quietly(job) -> None:
+    """Pede o cancelamento do job no BigQuery (melhor esforço)."""
     try:
-        job = client.query(sql, job_config=job_config)
-        # Aguarda com timeout defensivo para não travar o agente
-        result = job.result(timeout=QUERY_TIMEOUT)
+        job.cancel()
+    except Exception:
+        pass
+
+
+# Máximo de estágios do plano incluídos no resumo
+_MAX_PLAN_STAGES = 20
 
-        # Converte para DataFrame
-        create_bqstorage = False
-        if USE_BQSTORAGE:
-            try:
-                # Se a lib estiver instalada, este import funciona.
-                create_bqstorage = True
-            except Exception:
-                create_bqstorage = False
 
-        df = result.to_dataframe(create_bqstorage_client=create_bqstorage)
-        return {"ok": True, "dry_run_bytes": est_bytes, "df": df}
-    except BadRequest as e:
+def _iso(value: Any) -> Optional[str]:
+    return value.isoformat() if isinstance(value, dt.datetime) else None
+
+
+def _span_ms(start: Any, end: Any) -> Optional[float]:
+    if isinstance(start, dt.datetime) and isinstance(end, dt.datetime):
+        return (end - start).total_seconds() * 1000.0
+    return None
+
+
+def _job_stats(source: Any) -> Dict[str, Any]:
+    """
+    Estatísticas de um QueryJob (ou do RowIterator do caminho curto), em tipos
+    serializáveis em JSON.
+
+    - queue_ms: created → started (fila/espera por slots)
+    - run_ms:   started → ended (execução)
+    - plan:     resumo por estágio (slot_ms, espera/compute médios, registros)
+
+    Campos indisponíveis na origem ficam None (o RowIterator do caminho curto
+    não traz `cache_hit`, bytes faturados nem o plano).
+    """
+    created = getattr(source, "created", None)
+    started = getattr(source, "started", None)
+    ended = getattr(source, "ended", None)
+    plan = []
+    for stage in (getattr(source, "query_plan", None) or [])[:_MAX_PLAN_STAGES]:
+        plan.append(
+            {
+                "name": getattr(stage, "name", None),
+                "status": getattr(stage, "status", None),
+                "slot_ms": getattr(stage, "slot_ms", None),
+                "wait_ms_avg": getattr(stage, "wait_ms_avg", None),
+                "compute_ms_avg": getattr(stage, "compute_ms_avg", None),
+                "records_read": getattr(stage, "records_read", None),
+                "records_written": getattr(stage, "records_written", None),
+                "shuffle_output_bytes_spilled": getattr(
+                    stage, "shuffle_output_bytes_spilled", None
+                ),
+            }
+        )
+    return {
+        "job_id": getattr(source, "job_id", None),
+        "cache_hit": getattr(source, "cache_hit", None),
+        "total_bytes_processed": getattr(source, "total_bytes_processed", None),
+        "total_bytes_billed": getattr(source, "total_bytes_billed", None),
+        "slot_millis": getattr(source, "slot_millis", None),
+        "created": _iso(created),
+        "started": _iso(started),
+        "ended": _iso(ended),
+        "queue_ms": _span_ms(created, started),
+        "run_ms": _span_ms(started, ended),
+        "plan": plan,
+    }
+
+
+def _timeout_outcome(
+    job, started: float, timeout: float, est_bytes: int
+) -> QueryOutcome:
+    """Outcome de prazo estourado (o chamador já pediu o cancelamento do job)."""
+    elapsed_ms = (time.monotonic() - started) * 1000.0
+    return {
+        "ok": False,
+        "error": (
+            f"Tempo limite de execução excedido ({timeout:g}s); "
+            f"job {_job_id(job) or 'n/a'} cancelado após {elapsed_ms:.0f} ms."
+        ),
+        "df": None,
+        "dry_run_bytes": est_bytes,
+        "job_id": _job_id(job),
+        "elapsed_ms": elapsed_ms,
+        "timed_out": True,
+    }
+
+
+def _execution_error(e: Exception) -> QueryOutcome:
+    """Converte exceções da execução em outcome de erro."""
+    if isinstance(e, BadRequest):
         return {
             "ok": False,
             "error": f"Erro de execução (BadRequest): {_err_from_badrequest(e)}",
             "df": None,
         }
-    except GoogleAPIError as e:
+    if isinstance(e, GoogleAPIError):
         return {"ok": False, "error": f"Erro na API do BigQuery: {repr(e)}", "df": None}
+    # Inclui possibilidade de Timeout
+    return {
+        "ok": False,
+        "error": f"Erro inesperado na execução: {repr(e)}",
+        "df": None,
+    }
+
+
+# Controle de admissão
+#   Antes de submeter a execução, cada consulta precisa de uma vaga entre as
+#   BQ_MAX_IN_FLIGHT em andamento no processo e de fichas em dois baldes
+#   (jobs/segundo e bytes estimados/minuto). A espera é limitada por
+#   BQ_ADMISSION_MAX_WAIT (e pelo prazo da chamada); se a fila passar disso,
+#   a consulta é recusada na hora, sem chegar ao BigQuery.
+
+
+class _TokenBucket:
+    """Balde de fichas com reabastecimento contínuo (`rate` fichas/segundo)."""
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.stamp = time.monotonic()
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.stamp) * self.rate)
+        self.stamp = now
+
+    def wait_for(self, n: float) -> float:
+        """Segundos até haver `n` fichas (considerando as já reservadas)."""
+        return max(0.0, (n - self.tokens) / self.rate)
+
+
+class _Admission:
+    """Semáforo de consultas em andamento + baldes de jobs/s e bytes/min (thread-safe)."""
+
+    def __init__(self, max_in_flight: int, jobs_per_sec: float, bytes_per_min: float):
+        self.max_in_flight = max_in_flight
+        self._slots = (
+            threading.BoundedSemaphore(max_in_flight) if max_in_flight > 0 else None
+        )
+        self._jobs = (
+            _TokenBucket(jobs_per_sec, max(1.0, jobs_per_sec))
+            if jobs_per_sec > 0
+            else None
+        )
+        self._bytes = (
+            _TokenBucket(bytes_per_min / 60.0, bytes_per_min)
+            if bytes_per_min > 0
+            else None
+        )
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.admitted = 0
+        self.rejected = 0
+
+    def reserve(self, est_bytes: int, max_wait: float) -> Optional[float]:
+        """
+        Reserva uma ficha de job e `est_bytes` fichas de bytes. Retorna a espera
+        (segundos) até a reserva valer, ou None (sem reservar) se passar de `max_wait`.
+
+        As fichas podem ficar "negativas": quem chega depois espera também pelas
+        reservas anteriores, o que mantém a ordem de chegada.
+        """
+        now = time.monotonic()
+        with self._lock:
+            wait = 0.0
+            for bucket, n in ((self._jobs, 1), (self._bytes, est_bytes)):
+                if bucket is not None:
+                    bucket.refill(now)
+                    wait = max(wait, bucket.wait_for(n))
+            if wait > max_wait:
+                self.rejected += 1
+                return None
+            for bucket, n in ((self._jobs, 1), (self._bytes, est_bytes)):
+                if bucket is not None:
+                    bucket.tokens -= n
+            return wait
+
+    def refund(self, est_bytes: int) -> None:
+        """Devolve uma reserva que não chegou a ser usada."""
+        with self._lock:
+            for bucket, n in ((self._jobs, 1), (self._bytes, est_bytes)):
+                if bucket is not None:
+                    bucket.tokens = min(bucket.capacity, bucket.tokens + n)
+            self.rejected += 1
+
+    def try_slot(self, timeout: Optional[float] = None) -> bool:
+        if self._slots is None:
+            acquired = True
+        elif timeout is None:
+            acquired = self._slots.acquire(blocking=False)
+        else:
+            acquired = self._slots.acquire(timeout=max(0.0, timeout))
+        if acquired:
+            with self._lock:
+                self.in_flight += 1
+                self.admitted += 1
+        return acquired
+
+    def release(self) -> None:
+        with self._lock:
+            self.in_flight -= 1
+        if self._slots is not None:
+            self._slots.release()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "in_flight": self.in_flight,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+            }
+
+
+_ADMISSION = _Admission(
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_JOBS_PER_SEC, ADMISSION_BYTES_PER_MIN
+)
+
+
+def admission_stats() -> Dict[str, int]:
+    """{"in_flight", "admitted", "rejected"} do controle de admissão do processo."""
+    return _ADMISSION.stats()
+
+
+def _admission_refusal(est_bytes: int, waited: float, reason: str) -> QueryOutcome:
+    return {
+        "ok": False,
+        "error": (
+            f"BigQuery sobrecarregado neste processo ({reason}); consulta recusada "
+            f"após {waited * 1000.0:.0f} ms na fila. Tente novamente em instantes."
+        ),
+        "df": None,
+        "dry_run_bytes": est_bytes,
+        "queue_wait_ms": waited * 1000.0,
+        "throttled": True,
+    }
+
+
+def _admit(est_bytes: int, deadline: float) -> Tuple[Optional[QueryOutcome], float]:
+    """
+    Espera a admissão da consulta (bloqueante).
+
+    Returns
+    -------
+    (recusa, espera_ms)
+        recusa=None quando admitida; o chamador deve então chamar
+        `_ADMISSION.release()` ao terminar.
+    """
+    started = time.monotonic()
+    max_wait = min(ADMISSION_MAX_WAIT, _remaining(deadline))
+    wait = _ADMISSION.reserve(est_bytes, max_wait)
+    if wait is None:
+        return _admission_refusal(est_bytes, 0.0, "limite de taxa de jobs/bytes"), 0.0
+    time.sleep(wait)
+    if not _ADMISSION.try_slot(max_wait - (time.monotonic() - started)):
+        _ADMISSION.refund(est_bytes)
+        waited = time.monotonic() - started
+        refusal = _admission_refusal(
+            est_bytes, waited, "consultas simultâneas no limite"
+        )
+        return refusal, waited * 1000.0
+    return None, (time.monotonic() - started) * 1000.0
+
+
+async def _aadmit(
+    est_bytes: int, deadline: float
+) -> Tuple[Optional[QueryOutcome], float]:
+    """Versão assíncrona de `_admit`: espera com `asyncio.sleep`, sem prender threads."""
+    started = time.monotonic()
+    max_wait = min(ADMISSION_MAX_WAIT, _remaining(deadline))
+    wait = _ADMISSION.reserve(est_bytes, max_wait)
+    if wait is None:
+        return _admission_refusal(est_bytes, 0.0, "limite de taxa de jobs/bytes"), 0.0
+    try:
+        await asyncio.sleep(wait)
+        delay = 0.005
+        while not _ADMISSION.try_slot():
+            if time.monotonic() - started + delay > max_wait:
+                _ADMISSION.refund(est_bytes)
+                waited = time.monotonic() - started
+                refusal = _admission_refusal(
+                    est_bytes, waited, "consultas simultâneas no limite"
+                )
+                return refusal, waited * 1000.0
+            await asyncio.sleep(delay)
+            delay = min(delay * 2, 0.1)
+    except asyncio.CancelledError:
+        # Tarefa cancelada na fila: as fichas reservadas voltam ao balde
+        _ADMISSION.refund(est_bytes)
+        raise
+    return None, (time.monotonic() - started) * 1000.0
+
+
+# Orçamento de bytes
+#   Cada execução reserva os bytes estimados pelo dry-run no razão da sessão
+#   (ver `budget_session`) e no do processo; ao terminar, a reserva é acertada
+#   com os bytes faturados (quando o job os informa). Só entram na conta os
+#   lançamentos dos últimos BQ_BUDGET_WINDOW segundos. Hits de cache são grátis.
+
+_BUDGET_SESSION: contextvars.ContextVar[str] = contextvars.ContextVar(
+    "bq_budget_session", default="default"
+)
+# Saldo do orçamento aplicado como `maximum_bytes_billed` da execução corrente
+_BYTES_CAP: contextvars.ContextVar[Optional[int]] = contextvars.ContextVar(
+    "bq_bytes_cap", default=None
+)
+_PROCESS_KEY = "*"
+
+
+def _label_value(value: str) -> str:
+    """Valor válido de rótulo do BigQuery (minúsculas, [a-z0-9_-], até 63 chars)."""
+    return re.sub(r"[^a-z0-9_-]", "_", (value or "").lower())[:63] or "default"
+
+
+@contextlib.contextmanager
+def budget_session(session_id: str):
+    """
+    Atribui as consultas executadas dentro do bloco à sessão `session_id`.
+
+    Vale para a thread/tarefa corrente (e para as que herdam o contexto, como
+    `asyncio.to_thread` e `execute_many`).
+    """
+    token = _BUDGET_SESSION.set(session_id)
+    try:
+        yield
+    finally:
+        _BUDGET_SESSION.reset(token)
+
+
+class _BudgetLedger:
+    """Razão de bytes por chave em janela deslizante (thread-safe)."""
+
+    def __init__(self, window: float):
+        self.window = window
+        # chave → lançamentos [instante, bytes estimados, bytes faturados | None]
+        self._entries: Dict[str, deque] = {}
+        self._lock = threading.Lock()
+        self._swept_at = time.monotonic()
+
+    def _used(self, key: str, now: float) -> int:
+        q = self._entries.get(key)
+        if not q:
+            return 0
+        while q and q[0][0] <= now - self.window:
+            q.popleft()
+        if not q:
+            # Sessão sem lançamentos na janela: libera a chave
+            del self._entries[key]
+            return 0
+        return sum(e[1] if e[2] is None else e[2] for e in q)
+
+    def _sweep(self, now: float) -> None:
+        """Descarta chaves sem lançamentos na janela (no máximo uma vez por janela)."""
+        if now - self._swept_at < self.window:
+            return
+        self._swept_at = now
+        for key in list(self._entries):
+            self._used(key, now)
+
+    def reserve(
+        self, session: str, est_bytes: int
+    ) -> Tuple[Optional[list], Optional[int], Optional[str]]:
+        """
+        Reserva `est_bytes` na sessão e no processo.
+
+        Returns
+        -------
+        (lançamento, saldo, motivo)
+            lançamento=None e `motivo` preenchido se algum orçamento não comporta
+            a consulta; `saldo` é o menor saldo antes da reserva (None = sem limite).
+        """
+        now = time.monotonic()
+        limits = ((session, SESSION_BUDGET_BYTES), (_PROCESS_KEY, PROCESS_BUDGET_BYTES))
+        with self._lock:
+            self._sweep(now)
+            headroom: Optional[int] = None
+            for key, limit in limits:
+                if not limit:
+                    continue
+                left = limit - self._used(key, now)
+                if est_bytes > left:
+                    scope = "do processo" if key == _PROCESS_KEY else "da sessão"
+                    return None, max(0, left), scope
+                headroom = left if headroom is None else min(headroom, left)
+            entry = [now, est_bytes, None]
+            for key in (session, _PROCESS_KEY):
+                self._entries.setdefault(key, deque()).append(entry)
+            return entry, headroom, None
+
+    def settle(self, entry: list, billed: Optional[int]) -> None:
+        """Acerta a reserva com os bytes faturados (None mantém a estimativa)."""
+        with self._lock:
+            entry[2] = billed
+
+    def usage(self, session: str) -> Dict[str, Any]:
+        now = time.monotonic()
+        with self._lock:
+            return {
+                "session": session,
+                "window_s": self.window,
+                "session_bytes": self._used(session, now),
+                "session_limit": SESSION_BUDGET_BYTES or None,
+                "process_bytes": self._used(_PROCESS_KEY, now),
+                "process_limit": PROCESS_BUDGET_BYTES or None,
+                "queries": len(self._entries.get(session) or ()),
+            }
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+
+_LEDGER = _BudgetLedger(BUDGET_WINDOW)
+
+
+def budget_usage(session_id: Optional[str] = None) -> Dict[str, Any]:
+    """
+    Uso do orçamento na janela corrente, para a sessão informada (ou a do contexto).
+
+    Returns
+    -------
+    dict
+        {"session", "window_s", "session_bytes", "session_limit", "process_bytes",
+         "process_limit", "queries"} — limites None quando desligados.
+    """
+    return _LEDGER.usage(session_id or _BUDGET_SESSION.get())
+
+
+def reset_budget() -> None:
+    """Zera o razão de bytes (sessões e processo)."""
+    _LEDGER.clear()
+
+
+def _budget_reserve(
+    est_bytes: int,
+) -> Tuple[Optional[list], Optional[int], Optional[QueryOutcome]]:
+    """Reserva no orçamento; devolve (lançamento, saldo, None) ou (None, saldo, recusa)."""
+    session = _BUDGET_SESSION.get()
+    entry, headroom, scope = _LEDGER.reserve(session, est_bytes)
+    if entry is None:
+        return (
+            None,
+            headroom,
+            {
+                "ok": False,
+                "error": (
+                    f"Orçamento de bytes {scope} esgotado na última(s) "
+                    f"{BUDGET_WINDOW / 3600:g} h (saldo {headroom} bytes; consulta "
+                    f"estimada em {est_bytes} bytes). Refine filtros ou aguarde."
+                ),
+                "df": None,
+                "dry_run_bytes": est_bytes,
+                "budget_exceeded": True,
+            },
+        )
+    return entry, headroom, None
+
+
+def _billed_bytes(out: QueryOutcome, est_bytes: int) -> Optional[int]:
+    """Bytes a lançar no razão após a execução (None = manter a estimativa)."""
+    billed = (out.get("job_stats") or {}).get("total_bytes_billed")
+    if billed is not None:
+        return int(billed)
+    if out.get("ok") or out.get("job_id"):
+        return None
+    # Falhou antes de existir job: nada foi faturado
+    return 0
+
+
+# Single-flight
+#   Chamadas concorrentes com o mesmo SQL normalizado (mesmo projeto, localização
+#   e formato, de qualquer sessão de orçamento) compartilham um único job: a
+#   primeira executa ("líder", cobrado na sessão dela) e as demais esperam o
+#   `QueryOutcome` dela, sem lançamento no próprio orçamento. Funciona entre threads e
+#   entre tarefas asyncio (de qualquer event loop) no mesmo processo.
+#   Se o líder não produz um resultado compartilhável (cancelado, estourou o
+#   próprio prazo ou foi recusado pela fila/orçamento), os seguidores são
+#   acordados e um deles assume como novo líder, dentro do prazo de cada um.
+
+
+class _Flight:
+    __slots__ = ("done", "outcome", "waiters")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.outcome: Optional[QueryOutcome] = None
+        self.waiters: List[Tuple[asyncio.AbstractEventLoop, asyncio.Future]] = []
+
+
+_FLIGHTS: Dict[Tuple[str, ...], _Flight] = {}
+_FLIGHTS_LOCK = threading.Lock()
+_COALESCED = 0
+
+
+def _flight_key(
+    sql: str, project_id: Optional[str], result_format: str
+) -> Tuple[str, ...]:
+    # Sem a sessão de orçamento: sessões diferentes (uma por aba do app) com o
+    # mesmo SQL compartilham o job; paga a sessão do líder, seguidores custam 0
+    return (
+        project_id or DEFAULT_PROJECT,
+        BQ_LOCATION,
+        result_format,
+        _normalize_sql(sql),
+    )
+
+
+def _flight_join(key: Tuple[str, ...], rejoin: bool = False) -> Tuple[_Flight, bool]:
+    """Entra no voo da chave; retorna (voo, True) se o chamador for o líder."""
+    global _COALESCED
+    with _FLIGHTS_LOCK:
+        flight = _FLIGHTS.get(key)
+        if flight is not None:
+            if not rejoin:
+                _COALESCED += 1
+            return flight, False
+        flight = _FLIGHTS[key] = _Flight()
+        return flight, True
+
+
+def _shareable(outcome: Optional[QueryOutcome]) -> bool:
+    """
+    Outcome que vale para qualquer seguidor. Prazo estourado e recusas da fila
+    ou do orçamento dependem do prazo/saldo do líder: os seguidores refazem.
+    """
+    return outcome is not None and not any(
+        outcome.get(k) for k in ("timed_out", "throttled", "budget_exceeded")
+    )
+
+
+def _flight_finish(
+    key: Tuple[str, ...], flight: _Flight, outcome: Optional[QueryOutcome]
+) -> None:
+    """
+    Publica o resultado do líder e acorda seguidores (threads e futures).
+    Sem resultado compartilhável, publica None: cada seguidor volta a
+    `_flight_join` e o primeiro assume como líder.
+    """
+    if not _shareable(outcome):
+        outcome = None
+    with _FLIGHTS_LOCK:
+        if _FLIGHTS.get(key) is flight:
+            del _FLIGHTS[key]
+        flight.outcome = outcome
+        waiters, flight.waiters = flight.waiters, []
+        flight.done.set()
+    for loop, fut in waiters:
+        try:
+            loop.call_soon_threadsafe(_resolve_future, fut, outcome)
+        except RuntimeError:
+            pass  # loop já encerrado
+
+
+def _resolve_future(fut: asyncio.Future, outcome: Optional[QueryOutcome]) -> None:
+    if not fut.done():
+        fut.set_result(outcome)
+
+
+def _flight_future(flight: _Flight) -> asyncio.Future:
+    """Future do event loop corrente resolvida quando o líder terminar."""
+    loop = asyncio.get_running_loop()
+    fut = loop.create_future()
+    with _FLIGHTS_LOCK:
+        if flight.done.is_set():
+            fut.set_result(flight.outcome)
+        else:
+            flight.waiters.append((loop, fut))
+    return fut
+
+
+def _follower_outcome(outcome: Optional[QueryOutcome], timeout: float) -> QueryOutcome:
+    """Cópia do outcome do líder marcada como coalescida (ou erro de prazo)."""
+    if outcome is None:
+        return {
+            "ok": False,
+            "error": (
+                f"Tempo limite de execução excedido ({timeout:g}s) aguardando "
+                "consulta idêntica em andamento."
+            ),
+            "df": None,
+            "timed_out": True,
+            "coalesced": True,
+        }
+    out = _copy_outcome(outcome)
+    out["coalesced"] = True
+    return out
+
+
+def _copy_outcome(outcome: QueryOutcome) -> QueryOutcome:
+    """Cópia do outcome com DataFrame (mutável) e ArrowResult próprios."""
+    out: QueryOutcome = dict(outcome)  # type: ignore[assignment]
+    if out.get("df") is not None:
+        out["df"] = out["df"].copy()
+    if isinstance(out.get("table"), ArrowResult):
+        out["table"] = ArrowResult(out["table"].table)
+    return out
+
+
+def singleflight_stats() -> Dict[str, int]:
+    """{"coalesced": chamadas atendidas por um job já em andamento, "in_flight": voos ativos}."""
+    with _FLIGHTS_LOCK:
+        return {"coalesced": _COALESCED, "in_flight": len(_FLIGHTS)}
+
+
+def reset_singleflight_stats() -> None:
+    global _COALESCED
+    with _FLIGHTS_LOCK:
+        _COALESCED = 0
+
+
+def execute(
+    sql: str,
+    project_id: Optional[str] = None,
+    prevalidated: Optional[QueryOutcome] = None,
+    result_format: str = "pandas",
+    timeout: Optional[float] = None,
+) -> QueryOutcome:
+    """
+    Executa uma consulta SELECT no BigQuery e retorna um DataFrame (ou ArrowResult).
+
+    Fluxo
+    -----
+    0) Cache persistente em disco (`BQ_RESULT_CACHE`): se houver resultado válido
+       para o SQL normalizado, retorna sem ir ao BigQuery (guardas estáticas e
+       teto de custo continuam valendo).
+    1) Single-flight (`BQ_SINGLEFLIGHT`): se um SQL idêntico já está em execução
+       no processo (de qualquer sessão de orçamento), espera e devolve uma cópia
+       do outcome dele (`coalesced=True`, sem lançamento no orçamento do
+       seguidor: paga a sessão do líder); se o líder falhar por prazo,
+       cancelamento ou recusa própria, um seguidor assume a execução.
+    2) Dry-run para validação/custo — reaproveitado de `prevalidated` quando este
+       traz um `validation_token` válido para o mesmo SQL (sem nova ida à API).
+    3) Execução real se dry-run passar e se `maximum_bytes_billed` permitir.
+
+    Parameters
+    ----------
+    prevalidated : QueryOutcome | None
+        Resultado de `dry_run(sql)` já obtido pelo chamador. Se ausente, inválido
+        ou de outro SQL, o dry-run é refeito normalmente.
+    result_format : {"pandas", "arrow"}
+        "pandas" (padrão) preenche `df`; "arrow" preenche `table` com um
+        `ArrowResult` e adia a conversão para pandas até alguém pedir.
+    timeout : float | None
+        Prazo (segundos) da chamada, contado a partir da entrada em `execute`.
+        Se None, usa BQ_QUERY_TIMEOUT. Ao estourar, o job é cancelado e o
+        outcome traz `timed_out=True`, `job_id` e `elapsed_ms`.
+
+    Returns
+    -------
+    QueryOutcome
+        ok=True e `df` (ou `table`) preenchido em sucesso; caso contrário, `error`.
+    """
+    _check_result_format(result_format)
+    if not (sql or "").strip():
+        return {"ok": False, "error": "SQL vazio no executor.", "df": None}
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+
+    # 0) cache persistente (só para SQL que passaria nas guardas estáticas)
+    hit = _cached_result(sql, project_id, result_format)
+    if hit is not None:
+        return hit
+
+    # Single-flight: chamadas idênticas concorrentes esperam o mesmo job
+    if not SINGLEFLIGHT_ENABLED:
+        return _run_query(
+            sql, project_id, prevalidated, result_format, timeout, deadline
+        )
+    key = _flight_key(sql, project_id, result_format)
+    flight, leader = _flight_join(key)
+    while not leader:
+        ready = flight.done.wait(_remaining(deadline))
+        if not ready or flight.outcome is not None:
+            return _follower_outcome(flight.outcome if ready else None, timeout)
+        if _remaining(deadline) <= 0:
+            return _follower_outcome(None, timeout)
+        # Líder terminou sem resultado compartilhável: reentra (ou assume)
+        flight, leader = _flight_join(key, rejoin=True)
+
+    out: Optional[QueryOutcome] = None
+    try:
+        out = _run_query(
+            sql, project_id, prevalidated, result_format, timeout, deadline
+        )
+        return out
+    finally:
+        _flight_finish(key, flight, out)
+
+
+def _run_query(
+    sql: str,
+    project_id: Optional[str],
+    prevalidated: Optional[QueryOutcome],
+    result_format: str,
+    timeout: float,
+    deadline: float,
+) -> QueryOutcome:
+    """Dry-run (ou veredito reaproveitado) + job de execução + leitura do resultado."""
+    # 1) validação (dry-run), reaproveitando um veredito anterior quando possível
+    retries = _Retries()
+    dv = _accept_prevalidated(sql, project_id, prevalidated)
+    if dv is None:
+        dv = dry_run(sql, project_id=project_id, timeout=_remaining(deadline))
+        retries.absorb(dv)
+    refusal = _dry_run_refusal(dv)
+    if refusal is not None:
+        return retries.annotate(refusal)
+    est_bytes = dv.get("dry_run_bytes") or 0
+
+    # 2) orçamento de bytes da sessão/processo e admissão (vaga + fichas)
+    entry, headroom, over_budget = _budget_reserve(est_bytes)
+    if over_budget is not None:
+        return retries.annotate(over_budget)
+    # Recusa, exceção ou cancelamento liberam a reserva (nada a acertar)
+    billed: Optional[int] = 0
+    try:
+        rejected, queue_ms = _admit(est_bytes, deadline)
+        if rejected is not None:
+            return retries.annotate(rejected)
+        cap = _BYTES_CAP.set(headroom)
+        try:
+            out = _run_admitted(
+                sql, project_id, result_format, timeout, deadline, est_bytes, retries
+            )
+        finally:
+            _BYTES_CAP.reset(cap)
+            _ADMISSION.release()
+        billed = _billed_bytes(out, est_bytes)
+    finally:
+        _LEDGER.settle(entry, billed)
+    out["queue_wait_ms"] = queue_ms
+    return out
+
+
+def _run_admitted(
+    sql: str,
+    project_id: Optional[str],
+    result_format: str,
+    timeout: float,
+    deadline: float,
+    est_bytes: int,
+    retries: _Retries,
+) -> QueryOutcome:
+    """Execução já admitida: caminho curto ou job (com retentativas) + leitura."""
+    job = None
+    job_id = _new_job_id()
+    if _use_fast_path(est_bytes):
+        out, job = _run_fast(
+            sql,
+            project_id,
+            result_format,
+            timeout,
+            deadline,
+            est_bytes,
+            retries,
+            job_id,
+        )
+        if out is not None:
+            return retries.annotate(out)
+
+    client = get_bq_client(project_id)
+    attempt = 0
+    started = time.monotonic()
+    try:
+        while True:
+            try:
+                if job is None:
+                    job = _submit_job(client, sql, job_id)
+                # Aguarda até o prazo da chamada para não travar o agente
+                result = job.result(timeout=_remaining(deadline))
+                break
+            except _TIMEOUT_ERRORS:
+                raise
+            except Exception as e:
+                delay = retries.next_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                job, job_id = _next_attempt(job, job_id)
+                time.sleep(delay)
+                attempt += 1
+
+        # Converte para DataFrame / Arrow (REST ou Storage Read API)
+        data, read_path, read_ms = _read_result(job, result, result_format, deadline)
+        out = _success_outcome(
+            sql, project_id, data, read_path, read_ms, est_bytes, result_format
+        )
+    except _TIMEOUT_ERRORS:
+        # O job continuaria consumindo slots/cota: cancela antes de desistir
+        if job is not None:
+            _cancel_quietly(job)
+        out = _timeout_outcome(job, started, timeout, est_bytes)
+        out["query_path"] = "job"
+        return retries.annotate(out)
+    except Exception as e:
+        out = _execution_error(e)
+    out["query_path"] = "job"
+    if job is not None:
+        out["job_id"] = _job_id(job)
+        out["elapsed_ms"] = (time.monotonic() - started) * 1000.0
+        out["job_stats"] = _job_stats(job)
+    return retries.annotate(out)
+
+
+def _use_fast_path(est_bytes: int) -> bool:
+    """Escolhe `query_and_wait` (jobs.query) para consultas pequenas/interativas."""
+    if QUERY_MODE == "job":
+        return False
+    if QUERY_MODE == "fast":
+        return True
+    return est_bytes <= FAST_PATH_MAX_BYTES
+
+
+def _run_fast(
+    sql: str,
+    project_id: Optional[str],
+    result_format: str,
+    timeout: float,
+    deadline: float,
+    est_bytes: int,
+    retries: _Retries,
+    request_id: str,
+) -> Tuple[Optional[QueryOutcome], Any]:
+    """
+    Caminho curto: uma chamada `jobs.query` devolve as linhas (sem inserir job,
+    fazer polling e buscar resultados em separado quando o BigQuery permite).
+
+    Se a consulta não couber no caminho curto, a própria lib cria um job e
+    pagina os resultados; ao estourar `wait_timeout`, ela cancela esse job.
+
+    `jobs.query` não aceita job id: a requisição leva `request_id` num rótulo.
+    Em erro transitório (após as retentativas internas da lib, que reaproveitam
+    o `requestId`), procura o job com esse rótulo antes de desistir do caminho
+    curto, para o chamador esperar por ele em vez de submeter (e faturar) a
+    consulta de novo.
+
+    Returns
+    -------
+    (outcome, None) quando o caminho curto decidiu a consulta, ou (None, job)
+    para o chamador seguir pelo fluxo de job — job=None: ainda não há job, e o
+    chamador submete com `request_id` como id.
+    """
+    rows = None
+    started = time.monotonic()
+    since = dt.datetime.now(dt.timezone.utc)
+    try:
+        client = get_bq_client(project_id)
+        rows = client.query_and_wait(
+            sql,
+            job_config=_execution_job_config(request_id),
+            wait_timeout=_remaining(deadline),
+            api_timeout=max(_remaining(deadline), 1.0),
+        )
+        data, read_path, read_ms = _read_result(None, rows, result_format, deadline)
+        out = _success_outcome(
+            sql, project_id, data, read_path, read_ms, est_bytes, result_format
+        )
+    except _TIMEOUT_ERRORS:
+        out = _timeout_outcome(None, started, timeout, est_bytes)
     except Exception as e:
-        # Inclui possibilidade de Timeout
+        delay = retries.next_delay(e, 0, deadline)
+        if delay is not None:
+            job = _find_request_job(project_id, request_id, since)
+            time.sleep(delay)
+            return None, job
+        out = _execution_error(e)
+    out["query_path"] = "fast"
+    out["job_id"] = getattr(rows, "job_id", None)
+    if out["job_id"] is None and rows is None:
+        # Erro ou prazo depois de a lib criar um job: informa o id dele
+        out["job_id"] = _job_id(_find_request_job(project_id, request_id, since))
+    out["elapsed_ms"] = (time.monotonic() - started) * 1000.0
+    if rows is not None:
+        out["job_stats"] = _job_stats(rows)
+    return out, None
+
+
+def _find_request_job(project_id: Optional[str], request_id: str, since: dt.datetime):
+    """
+    Job criado por uma requisição do caminho curto (pelo rótulo `request_id`),
+    ou None se ela não chegou a criar job. Melhor esforço: erros viram None.
+    """
+    label = _label_value(request_id)
+    try:
+        client = get_bq_client(project_id)
+        jobs = client.list_jobs(
+            min_creation_time=since - dt.timedelta(seconds=60),
+            max_results=100,
+            timeout=10.0,
+        )
+        for job in jobs:
+            if (getattr(job, "labels", None) or {}).get(_REQUEST_LABEL) == label:
+                return job
+    except Exception:
+        pass
+    return None
+
+
+# Execução em lote
+
+
+class _ByteBudget:
+    """Orçamento de bytes (thread-safe) consumido pelas consultas de um lote."""
+
+    def __init__(self, limit: Optional[int]):
+        self.limit = limit
+        self.used = 0
+        self._lock = threading.Lock()
+
+    def reserve(self, n: int) -> bool:
+        if not self.limit:
+            return True
+        with self._lock:
+            if self.used + n > self.limit:
+                return False
+            self.used += n
+            return True
+
+
+def _batch_one(
+    sql: str,
+    project_id: Optional[str],
+    result_format: str,
+    timeout: Optional[float],
+    budget: _ByteBudget,
+) -> QueryOutcome:
+    """Executa uma consulta do lote: cache → dry-run → reserva de bytes → execução."""
+    t0 = time.perf_counter()
+    out = _batch_run(sql, project_id, result_format, timeout, budget)
+    out["query_ms"] = (time.perf_counter() - t0) * 1000.0
+    return out
+
+
+def _batch_run(
+    sql: str,
+    project_id: Optional[str],
+    result_format: str,
+    timeout: Optional[float],
+    budget: _ByteBudget,
+) -> QueryOutcome:
+    if not (sql or "").strip():
+        return {"ok": False, "error": "SQL vazio no executor.", "df": None}
+    hit = _cached_result(sql, project_id, result_format)
+    if hit is not None:
+        return hit
+
+    # Um prazo só para dry-run + execução, como em `execute`
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+    dv = dry_run(sql, project_id=project_id, timeout=_remaining(deadline))
+    refusal = _dry_run_refusal(dv)
+    if refusal is not None:
+        return refusal
+    est_bytes = dv.get("dry_run_bytes") or 0
+    if not budget.reserve(est_bytes):
         return {
             "ok": False,
-            "error": f"Erro inesperado na execução: {repr(e)}",
+            "error": (
+                f"Orçamento de bytes do lote esgotado ({budget.used} de "
+                f"{budget.limit} bytes); consulta de {est_bytes} bytes recusada."
+            ),
             "df": None,
+            "dry_run_bytes": est_bytes,
+        }
+    out = execute(
+        sql,
+        project_id=project_id,
+        prevalidated=dv,
+        result_format=result_format,
+        timeout=_remaining(deadline),
+    )
+    # As retentativas do dry-run do lote também contam para esta consulta
+    retries = _Retries()
+    retries.absorb(dv)
+    return retries.annotate(out)
+
+
+def execute_many(
+    sqls: Sequence[str],
+    max_concurrency: Optional[int] = None,
+    project_id: Optional[str] = None,
+    result_format: str = "pandas",
+    timeout: Optional[float] = None,
+    max_total_bytes: Optional[int] = None,
+) -> List[QueryOutcome]:
+    """
+    Executa um lote de consultas em paralelo, com concorrência limitada.
+
+    - No máximo `max_concurrency` jobs em andamento (padrão BQ_BATCH_MAX_CONCURRENCY).
+    - O lote inteiro respeita um orçamento de bytes (`max_total_bytes`, padrão
+      MAX_BYTES_BILLED): cada consulta reserva os bytes do seu dry-run antes de
+      executar; as que não cabem são recusadas sem ir ao BigQuery.
+    - SQLs idênticos (após normalização) são executados uma única vez.
+    - Cada consulta continua sujeita às guardas, ao teto por consulta e ao prazo
+      (`timeout`) de `execute`.
+
+    Returns
+    -------
+    list[QueryOutcome]
+        Um outcome por SQL, na mesma ordem da entrada, com `query_ms` (tempo
+        total da consulta no lote).
+    """
+    _check_result_format(result_format)
+    sqls = list(sqls)
+    if not sqls:
+        return []
+    workers = max(1, int(max_concurrency or BATCH_MAX_CONCURRENCY))
+    budget = _ByteBudget(
+        MAX_BYTES_BILLED if max_total_bytes is None else max_total_bytes
+    )
+
+    # Deduplica por SQL normalizado, preservando a primeira ocorrência
+    unique: Dict[str, str] = {}
+    for sql in sqls:
+        unique.setdefault(_normalize_sql(sql), sql)
+
+    with concurrent.futures.ThreadPoolExecutor(
+        max_workers=min(workers, len(unique)), thread_name_prefix="bq-batch"
+    ) as pool:
+        futures = {
+            # Cada tarefa herda a sessão de orçamento do chamador
+            key: pool.submit(
+                contextvars.copy_context().run,
+                _batch_one,
+                sql,
+                project_id,
+                result_format,
+                timeout,
+                budget,
+            )
+            for key, sql in unique.items()
         }
+        by_key = {key: fut.result() for key, fut in futures.items()}
+
+    # Duplicatas recebem cópias próprias (DataFrame/ArrowResult não compartilhados)
+    results: List[QueryOutcome] = []
+    served: set = set()
+    for sql in sqls:
+        key = _normalize_sql(sql)
+        out: QueryOutcome = by_key[key]  # type: ignore[assignment]
+        results.append(_copy_outcome(out) if key in served else dict(out))
+        served.add(key)
+    return results
+
+
+# Execução assíncrona (asyncio)
+#   O job é submetido e seu estado é consultado periodicamente (`job.done()`),
+#   com `asyncio.sleep` entre as consultas: nenhuma thread fica presa durante a
+#   execução da query. Só as chamadas HTTP curtas rodam em `asyncio.to_thread`.
+
+
+async def adry_run(
+    sql: str, project_id: Optional[str] = None, timeout: Optional[float] = None
+) -> QueryOutcome:
+    """
+    Versão assíncrona de `dry_run` (mesmo contrato de retorno e mesmo cache).
+
+    O dry-run é uma única chamada curta à API; roda em thread auxiliar para não
+    bloquear o event loop.
+    """
+    return await asyncio.to_thread(dry_run, sql, project_id, timeout)
+
+
+async def _await_job(job, timeout: float) -> None:
+    """Espera o job terminar consultando `job.done()` com backoff, sem bloquear o loop."""
+    deadline = time.monotonic() + timeout
+    delay = ASYNC_POLL_INTERVAL
+    while not await asyncio.to_thread(job.done):
+        if time.monotonic() >= deadline:
+            raise TimeoutError(f"job não terminou em {timeout:.0f}s")
+        await asyncio.sleep(min(delay, _remaining(deadline)))
+        delay = min(delay * 1.5, ASYNC_POLL_MAX_INTERVAL)
+
+
+async def aexecute(
+    sql: str,
+    project_id: Optional[str] = None,
+    prevalidated: Optional[QueryOutcome] = None,
+    result_format: str = "pandas",
+    timeout: Optional[float] = None,
+) -> QueryOutcome:
+    """
+    Versão assíncrona de `execute`, com o mesmo fluxo, prazo e `QueryOutcome`.
+
+    Se a tarefa for cancelada (`asyncio.CancelledError`) com o job em andamento,
+    o job é cancelado no BigQuery antes de propagar o cancelamento.
+    """
+    _check_result_format(result_format)
+    if not (sql or "").strip():
+        return {"ok": False, "error": "SQL vazio no executor.", "df": None}
+    timeout = QUERY_TIMEOUT if timeout is None else timeout
+    deadline = time.monotonic() + timeout
+
+    hit = await asyncio.to_thread(_cached_result, sql, project_id, result_format)
+    if hit is not None:
+        return hit
+
+    if not SINGLEFLIGHT_ENABLED:
+        return await _arun_query(
+            sql, project_id, prevalidated, result_format, timeout, deadline
+        )
+    key = _flight_key(sql, project_id, result_format)
+    flight, leader = _flight_join(key)
+    while not leader:
+        try:
+            outcome = await asyncio.wait_for(
+                asyncio.shield(_flight_future(flight)), _remaining(deadline)
+            )
+        except asyncio.TimeoutError:
+            return _follower_outcome(None, timeout)
+        if outcome is not None or _remaining(deadline) <= 0:
+            return _follower_outcome(outcome, timeout)
+        # Líder terminou sem resultado compartilhável: reentra (ou assume)
+        flight, leader = _flight_join(key, rejoin=True)
+
+    out: Optional[QueryOutcome] = None
+    try:
+        out = await _arun_query(
+            sql, project_id, prevalidated, result_format, timeout, deadline
+        )
+        return out
+    finally:
+        _flight_finish(key, flight, out)
+
+
+async def _arun_query(
+    sql: str,
+    project_id: Optional[str],
+    prevalidated: Optional[QueryOutcome],
+    result_format: str,
+    timeout: float,
+    deadline: float,
+) -> QueryOutcome:
+    """Versão assíncrona de `_run_query` (cancela o job se a tarefa for cancelada)."""
+    retries = _Retries()
+    dv = _accept_prevalidated(sql, project_id, prevalidated)
+    if dv is None:
+        dv = await adry_run(sql, project_id=project_id, timeout=_remaining(deadline))
+        retries.absorb(dv)
+    refusal = _dry_run_refusal(dv)
+    if refusal is not None:
+        return retries.annotate(refusal)
+    est_bytes = dv.get("dry_run_bytes") or 0
+
+    entry, headroom, over_budget = _budget_reserve(est_bytes)
+    if over_budget is not None:
+        return retries.annotate(over_budget)
+    billed: Optional[int] = 0
+    try:
+        rejected, queue_ms = await _aadmit(est_bytes, deadline)
+        if rejected is not None:
+            return retries.annotate(rejected)
+        cap = _BYTES_CAP.set(headroom)
+        try:
+            out = await _arun_admitted(
+                sql, project_id, result_format, timeout, deadline, est_bytes, retries
+            )
+        finally:
+            _BYTES_CAP.reset(cap)
+            _ADMISSION.release()
+        billed = _billed_bytes(out, est_bytes)
+    finally:
+        _LEDGER.settle(entry, billed)
+    out["queue_wait_ms"] = queue_ms
+    return out
+
+
+async def _arun_admitted(
+    sql: str,
+    project_id: Optional[str],
+    result_format: str,
+    timeout: float,
+    deadline: float,
+    est_bytes: int,
+    retries: _Retries,
+) -> QueryOutcome:
+    """Versão assíncrona de `_run_admitted`."""
+    job = None
+    submit = None
+    job_id = _new_job_id()
+    if _use_fast_path(est_bytes):
+        # Consultas curtas: uma chamada `jobs.query` em thread auxiliar
+        out, job = await asyncio.to_thread(
+            _run_fast,
+            sql,
+            project_id,
+            result_format,
+            timeout,
+            deadline,
+            est_bytes,
+            retries,
+            job_id,
+        )
+        if out is not None:
+            return retries.annotate(out)
+
+    attempt = 0
+    started = time.monotonic()
+    try:
+        client = await asyncio.to_thread(get_bq_client, project_id)
+        while True:
+            try:
+                if job is None:
+                    # `shield`: um cancelamento durante a submissão não perde a
+                    # referência ao job
+                    submit = asyncio.ensure_future(
+                        asyncio.to_thread(_submit_job, client, sql, job_id)
+                    )
+                    job = await asyncio.shield(submit)
+                await _await_job(job, _remaining(deadline))
+                result = await asyncio.to_thread(job.result)
+                break
+            except (asyncio.CancelledError, *_TIMEOUT_ERRORS):
+                raise
+            except Exception as e:
+                delay = retries.next_delay(e, attempt, deadline)
+                if delay is None:
+                    raise
+                job, job_id = _next_attempt(job, job_id)
+                submit = None
+                await asyncio.sleep(delay)
+                attempt += 1
+        data, read_path, read_ms = await asyncio.to_thread(
+            _read_result, job, result, result_format, deadline
+        )
+        out = await asyncio.to_thread(
+            _success_outcome,
+            sql,
+            project_id,
+            data,
+            read_path,
+            read_ms,
+            est_bytes,
+            result_format,
+        )
+    except asyncio.CancelledError:
+        if job is None and submit is not None:
+            try:
+                job = await submit
+            except Exception:
+                job = None
+        if job is not None:
+            await asyncio.to_thread(_cancel_quietly, job)
+        raise
+    except _TIMEOUT_ERRORS:
+        if job is not None:
+            await asyncio.to_thread(_cancel_quietly, job)
+        out = _timeout_outcome(job, started, timeout, est_bytes)
+        out["query_path"] = "job"
+        return retries.annotate(out)
+    except Exception as e:
+        out = _execution_error(e)
+    out["query_path"] = "job"
+    if job is not None:
+        out["job_id"] = _job_id(job)
+        out["elapsed_ms"] = (time.monotonic() - started) * 1000.0
+        out["job_stats"] = _job_stats(job)
+    return retries.annotate(out)
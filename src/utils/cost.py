@@ -0,0 +1,450 @@
+"""
+Modelo local de custo (bytes processados) para o SQL gerado pelo agente.
+
+Objetivos
+---------
+- Estimar `total_bytes_processed` sem ida ao BigQuery: nos templates do agente o
+  custo depende só das colunas referenciadas e da faixa de `data_particao`.
+- Manter em cache (memória + JSON em disco, com TTL) os metadados usados:
+  - bytes lógicos por partição (`INFORMATION_SCHEMA.PARTITIONS`);
+  - bytes por coluna na tabela inteira (dry-run de `SELECT <coluna>`, sem custo).
+- Recusar, antes de qualquer I/O de rede, candidatos obviamente acima do teto
+  (menor valor entre `BQ_MAX_BYTES_BILLED` e o saldo do orçamento de bytes).
+- Medir o desvio (drift) entre a estimativa local e o dry-run real.
+
+Modelo
+------
+bytes(tabela) = Σ bytes(coluna referenciada) × fração dos bytes da tabela que
+está nas partições da faixa filtrada (1.0 sem filtro reconhecível ou sem
+metadados de partição — estimativa conservadora).
+"""
+
+from __future__ import annotations
+
+from collections import deque
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple
+import datetime as dt
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+
+import src.utils.bq as bq
+from src.utils.logger import get_logger
+from src.utils.schema import get_table_schema
+
+log = get_logger(__name__)
+
+
+# Configuração por ambiente
+
+COST_MODEL_ENABLED = os.getenv("BQ_COST_MODEL", "1") == "1"
+COST_MODEL_DIR = os.getenv(
+    "BQ_COST_MODEL_DIR",
+    str(Path(__file__).resolve().parents[2] / ".cache" / "bq_cost"),
+)
+# Validade (segundos) dos metadados de partição/coluna em cache
+COST_MODEL_TTL = float(os.getenv("BQ_COST_MODEL_TTL", str(24 * 3600)))
+# Só recusa sem dry-run quando a estimativa passa do teto por esta margem
+COST_REJECT_FACTOR = float(os.getenv("BQ_COST_REJECT_FACTOR", "1.5"))
+# Amostras mantidas para as estatísticas de drift
+COST_DRIFT_SAMPLES = int(os.getenv("BQ_COST_DRIFT_SAMPLES", "500"))
+
+# Tabelas referenciadas (FROM/JOIN `projeto.dataset.tabela` [AS] alias)
+_SQL_TABLE_REF = re.compile(
+    r"\b(?:FROM|JOIN)\s+`([^`]+)`"
+    r"(?:\s+(?:AS\s+)?(?!(?:WHERE|JOIN|ON|GROUP|ORDER|LIMIT|LEFT|RIGHT|INNER|"
+    r"FULL|CROSS|USING)\b)(\w+))?",
+    re.IGNORECASE,
+)
+_SQL_STRING_LITERAL = re.compile(r"'(?:[^'\\]|\\.|'')*'")
+_SQL_BACKTICKED = re.compile(r"`[^`]*`")
+_SQL_QUALIFIED = re.compile(r"\b(\w+)\.(\w+)\b")
+_SQL_BARE = re.compile(r"(?<![\w.])(\w+)(?!\s*\.)\b")
+
+# Predicados sobre a coluna de partição
+_DATE_EXPR = (
+    r"(?:DATE\s*'(?P<lit>\d{4}-\d{2}-\d{2})'"
+    r"|DATE_SUB\(\s*CURRENT_DATE\(\)\s*,\s*INTERVAL\s+(?P<days>\d+)\s+DAY\s*\)"
+    r"|(?P<today>CURRENT_DATE\(\)))"
+)
+_SQL_PARTITION_PRED = re.compile(
+    r"\b(?:\w+\.)?data_particao\s*(?P<op><=|>=|<|>|=)\s*" + _DATE_EXPR,
+    re.IGNORECASE,
+)
+
+
+# Metadados por tabela
+
+
+class _TableStats:
+    """Bytes por partição (dia) e por coluna de uma tabela, persistidos em JSON."""
+
+    __slots__ = (
+        "table",
+        "fetched_at",
+        "schema",
+        "partitions",
+        "total_bytes",
+        "columns",
+    )
+
+    def __init__(
+        self,
+        table: str,
+        fetched_at: float,
+        schema: List[str],
+        partitions: Optional[Dict[str, int]],
+        total_bytes: Optional[int],
+        columns: Optional[Dict[str, int]] = None,
+    ):
+        self.table = table
+        self.fetched_at = fetched_at
+        # Nomes das colunas (para reconhecer as referências no SQL sem rede)
+        self.schema = list(schema)
+        # "YYYY-MM-DD" → bytes lógicos (None = tabela sem partição diária conhecida)
+        self.partitions = partitions
+        self.total_bytes = total_bytes
+        # coluna → bytes na tabela inteira
+        self.columns: Dict[str, int] = dict(columns or {})
+
+    def fresh(self) -> bool:
+        return time.time() - self.fetched_at < COST_MODEL_TTL
+
+    def fraction(self, lo: Optional[dt.date], hi: Optional[dt.date]) -> float:
+        """Fração dos bytes da tabela nas partições em [lo, hi] (limites opcionais)."""
+        if not self.partitions or not self.total_bytes or (lo is None and hi is None):
+            return 1.0
+        lo_s = lo.isoformat() if lo else ""
+        hi_s = hi.isoformat() if hi else "9999-12-31"
+        inside = sum(b for day, b in self.partitions.items() if lo_s <= day <= hi_s)
+        return min(1.0, inside / self.total_bytes)
+
+    def to_json(self) -> Dict[str, Any]:
+        return {
+            "table": self.table,
+            "fetched_at": self.fetched_at,
+            "schema": self.schema,
+            "partitions": self.partitions,
+            "total_bytes": self.total_bytes,
+            "columns": self.columns,
+        }
+
+    @classmethod
+    def from_json(cls, data: Dict[str, Any]) -> "_TableStats":
+        return cls(
+            data["table"],
+            float(data["fetched_at"]),
+            data["schema"],
+            data.get("partitions"),
+            data.get("total_bytes"),
+            data.get("columns"),
+        )
+
+
+_STATS: Dict[str, _TableStats] = {}
+_STATS_LOCK = threading.Lock()
+# Tabelas com aquecimento de metadados em andamento (thread de fundo)
+_WARMING: Set[str] = set()
+
+
+def _stats_path(table: str) -> Path:
+    name = hashlib.sha256(table.encode("utf-8")).hexdigest()[:16]
+    return Path(COST_MODEL_DIR) / f"{name}.json"
+
+
+def _save_stats(stats: _TableStats) -> None:
+    """Grava os metadados de forma atômica (tmp + os.replace)."""
+    path = _stats_path(stats.table)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(json.dumps(stats.to_json()), encoding="utf-8")
+        os.replace(tmp, path)
+    except OSError as e:
+        log.debug("cost | falha ao gravar metadados de %s: %r", stats.table, e)
+
+
+def _load_stats(table: str) -> Optional[_TableStats]:
+    """Metadados válidos da memória ou do disco (None se ausentes/expirados)."""
+    with _STATS_LOCK:
+        stats = _STATS.get(table)
+    if stats is not None and stats.fresh():
+        return stats
+    try:
+        data = json.loads(_stats_path(table).read_text(encoding="utf-8"))
+        stats = _TableStats.from_json(data)
+    except (OSError, ValueError, KeyError):
+        return None
+    if not stats.fresh():
+        return None
+    with _STATS_LOCK:
+        _STATS[table] = stats
+    return stats
+
+
+def _fetch_partitions(table: str) -> Tuple[Optional[Dict[str, int]], Optional[int]]:
+    """Bytes lógicos por partição diária via INFORMATION_SCHEMA.PARTITIONS."""
+    dataset, _, name = table.rpartition(".")
+    out = bq.execute(
+        f"""
+        SELECT partition_id, total_logical_bytes
+        FROM `{dataset}.INFORMATION_SCHEMA.PARTITIONS`
+        WHERE table_name = '{name}'
+        """
+    )
+    df = out.get("df")
+    if not out.get("ok") or df is None or df.empty:
+        log.info("cost | PARTITIONS indisponível para %s: %s", table, out.get("error"))
+        return None, None
+
+    partitions: Dict[str, int] = {}
+    total = 0
+    for pid, nbytes in zip(df["partition_id"], df["total_logical_bytes"]):
+        nbytes = int(nbytes or 0)
+        total += nbytes
+        pid = str(pid or "")
+        if len(pid) == 8 and pid.isdigit():
+            partitions[f"{pid[:4]}-{pid[4:6]}-{pid[6:]}"] = nbytes
+    return (partitions or None), (total or None)
+
+
+def _table_stats(table: str, fetch: bool) -> Optional[_TableStats]:
+    stats = _load_stats(table)
+    if stats is not None or not fetch:
+        return stats
+    dataset, _, name = table.rpartition(".")
+    schema = list(get_table_schema(dataset, name))
+    partitions, total = _fetch_partitions(table)
+    stats = _TableStats(table, time.time(), schema, partitions, total)
+    with _STATS_LOCK:
+        _STATS[table] = stats
+    _save_stats(stats)
+    return stats
+
+
+def _column_bytes(stats: _TableStats, column: str, fetch: bool) -> Optional[int]:
+    """Bytes da coluna na tabela inteira (dry-run gratuito na primeira vez)."""
+    if column in stats.columns:
+        return stats.columns[column]
+    if not fetch:
+        return None
+    dv = bq.dry_run(f"SELECT {column} FROM `{stats.table}`")
+    if not dv.get("ok") or dv.get("dry_run_bytes") is None:
+        return None
+    with _STATS_LOCK:
+        stats.columns[column] = int(dv["dry_run_bytes"])
+    _save_stats(stats)
+    return stats.columns[column]
+
+
+# Análise do SQL
+
+
+def _table_refs(sql: str) -> List[Tuple[str, Optional[str]]]:
+    """[(tabela totalmente qualificada, alias | None)] na ordem de aparição."""
+    return [(t.strip(), a) for t, a in _SQL_TABLE_REF.findall(sql)]
+
+
+def _referenced_columns(
+    sql: str, columns: Set[str], alias: Optional[str], aliases: Set[str]
+) -> Set[str]:
+    """
+    Colunas de `columns` citadas no SQL: qualificadas pelo `alias` desta tabela
+    ou sem qualificador (atribuídas a todas as tabelas que as possuem).
+    """
+    body = _SQL_BACKTICKED.sub(" ", _SQL_STRING_LITERAL.sub("''", sql))
+    found = set()
+    for qual, col in _SQL_QUALIFIED.findall(body):
+        if col in columns and (qual == alias or qual not in aliases):
+            found.add(col)
+    for tok in _SQL_BARE.findall(body):
+        if tok in columns:
+            found.add(tok)
+    return found
+
+
+def _partition_range(
+    sql: str, today: Optional[dt.date] = None
+) -> Tuple[Optional[dt.date], Optional[dt.date]]:
+    """
+    Faixa [lo, hi] de `data_particao` implicada pelos predicados (AND).
+    `CURRENT_DATE()` é resolvido em UTC, como no BigQuery.
+    """
+    today = today or dt.datetime.now(dt.timezone.utc).date()
+    lo: Optional[dt.date] = None
+    hi: Optional[dt.date] = None
+    for m in _SQL_PARTITION_PRED.finditer(sql):
+        if m.group("lit"):
+            day = dt.date.fromisoformat(m.group("lit"))
+        elif m.group("days"):
+            day = today - dt.timedelta(days=int(m.group("days")))
+        else:
+            day = today
+        op = m.group("op")
+        if op in {">", ">="}:
+            day = day + dt.timedelta(days=1) if op == ">" else day
+            lo = day if lo is None else max(lo, day)
+        if op in {"<", "<="}:
+            day = day - dt.timedelta(days=1) if op == "<" else day
+            hi = day if hi is None else min(hi, day)
+        if op == "=":
+            lo = day if lo is None else max(lo, day)
+            hi = day if hi is None else min(hi, day)
+    return lo, hi
+
+
+# API
+
+
+def estimate_bytes(sql: str, fetch: bool = True) -> Optional[int]:
+    """
+    Estima localmente os bytes processados por `sql`.
+
+    Parameters
+    ----------
+    fetch : bool
+        Se False, usa apenas metadados já em cache (nenhuma chamada de rede) e
+        retorna None quando falta algum.
+
+    Returns
+    -------
+    int | None
+        Estimativa em bytes, ou None se o modelo está desligado, o SQL não cita
+        tabelas conhecidas ou faltam metadados.
+    """
+    if not COST_MODEL_ENABLED or not (sql or "").strip():
+        return None
+    refs = _table_refs(sql)
+    if not refs:
+        return None
+    aliases = {a for _, a in refs if a}
+    lo, hi = _partition_range(sql)
+
+    total = 0.0
+    for table, alias in refs:
+        try:
+            stats = _table_stats(table, fetch)
+            if stats is None:
+                return None
+            cols = _referenced_columns(sql, set(stats.schema), alias, aliases)
+            col_bytes = 0
+            for col in cols:
+                nbytes = _column_bytes(stats, col, fetch)
+                if nbytes is None:
+                    return None
+                col_bytes += nbytes
+        except Exception as e:
+            log.debug("cost | sem metadados para %s: %r", table, e)
+            return None
+        partitioned = "data_particao" in stats.schema
+        total += col_bytes * (stats.fraction(lo, hi) if partitioned else 1.0)
+    return int(round(total))
+
+
+def cost_ceiling() -> Optional[int]:
+    """Teto efetivo: menor entre BQ_MAX_BYTES_BILLED e o saldo do orçamento de bytes."""
+    usage = bq.budget_usage()
+    caps = [bq.MAX_BYTES_BILLED] if bq.MAX_BYTES_BILLED else []
+    for used, limit in (
+        (usage["session_bytes"], usage["session_limit"]),
+        (usage["process_bytes"], usage["process_limit"]),
+    ):
+        if limit:
+            caps.append(max(0, limit - used))
+    return min(caps) if caps else None
+
+
+def precheck(sql: str) -> Tuple[Optional[int], Optional[str]]:
+    """
+    Estimativa local (sem rede) e, se ela passar do teto por mais de
+    `BQ_COST_REJECT_FACTOR`, a mensagem de recusa.
+
+    Returns
+    -------
+    (estimativa | None, erro | None)
+    """
+    est = estimate_bytes(sql, fetch=False)
+    ceiling = cost_ceiling()
+    if est is not None and ceiling is not None and est > ceiling * COST_REJECT_FACTOR:
+        return est, (
+            f"Custo estimado localmente alto ({est} bytes; teto {ceiling} bytes). "
+            f"Consulta recusada sem dry-run: refine filtros (datas/colunas)."
+        )
+    return est, None
+
+
+def warm(sql: str) -> None:
+    """Carrega em segundo plano os metadados que faltam para estimar `sql`."""
+    if not COST_MODEL_ENABLED:
+        return
+    tables = {t for t, _ in _table_refs(sql)}
+    with _STATS_LOCK:
+        tables -= _WARMING
+        if not tables:
+            return
+        _WARMING.update(tables)
+
+    def _run() -> None:
+        try:
+            estimate_bytes(sql, fetch=True)
+        except Exception as e:
+            log.debug("cost | aquecimento falhou: %r", e)
+        finally:
+            with _STATS_LOCK:
+                _WARMING.difference_update(tables)
+
+    threading.Thread(target=_run, name="bq-cost-warm", daemon=True).start()
+
+
+# Drift estimativa × dry-run
+
+_DRIFT: deque = deque(maxlen=COST_DRIFT_SAMPLES)
+_DRIFT_LOCK = threading.Lock()
+
+
+def record_drift(estimated: Optional[int], actual: Optional[int]) -> Optional[float]:
+    """
+    Registra o par (estimativa, dry-run) e retorna o desvio percentual
+    (estimativa − real) / real × 100, ou None se não há como comparar.
+    """
+    if estimated is None or not actual:
+        return None
+    pct = (estimated - actual) / actual * 100.0
+    with _DRIFT_LOCK:
+        _DRIFT.append(pct)
+    return pct
+
+
+def drift_stats() -> Dict[str, Any]:
+    """
+    Resumo do desvio estimativa × dry-run nas últimas amostras.
+
+    Returns
+    -------
+    dict
+        {"samples", "mean_pct" (com sinal), "mean_abs_pct", "p90_abs_pct", "max_abs_pct"}
+    """
+    with _DRIFT_LOCK:
+        values = list(_DRIFT)
+    if not values:
+        return {"samples": 0}
+    abs_sorted = sorted(abs(v) for v in values)
+    return {
+        "samples": len(values),
+        "mean_pct": sum(values) / len(values),
+        "mean_abs_pct": sum(abs_sorted) / len(abs_sorted),
+        "p90_abs_pct": abs_sorted[min(len(abs_sorted) - 1, int(0.9 * len(abs_sorted)))],
+        "max_abs_pct": abs_sorted[-1],
+    }
+
+
+def clear_cost_model() -> None:
+    """Esvazia metadados em memória e amostras de drift (o cache em disco fica)."""
+    with _STATS_LOCK:
+        _STATS.clear()
+    with _DRIFT_LOCK:
+        _DRIFT.clear()
@@ -1,10 +1,40 @@
 """
 Descoberta de schema no BigQuery (tipos por coluna).
 
-Função principal
-----------------
+Funções principais
+------------------
 - get_table_schema(dataset: str, table: str) -> Dict[str, str]
-  Retorna um dicionário {coluna: tipo} consultando INFORMATION_SCHEMA.COLUMNS.
+  Retorna um dicionário {coluna: tipo}.
+- get_table_metadata(dataset: str, table: str) -> Dict[str, Any]
+  Schema completo: campos aninhados, particionamento, clustering e versão
+  (last_modified/etag) da tabela.
+
+Caminhos
+--------
+1) Metadados da tabela (`client.get_table`): uma chamada leve à API de
+   tabelas, sem dry-run nem job.
+2) INFORMATION_SCHEMA.COLUMNS (fallback, p.ex. sem permissão de leitura dos
+   metadados): consulta via `bq.execute`.
+
+Cache persistente (stale-while-revalidate)
+------------------------------------------
+Os metadados ficam em memória e em disco (BQ_SCHEMA_CACHE_DIR, um JSON por
+tabela), então um processo novo responde sem ir ao BigQuery:
+- idade < BQ_SCHEMA_CACHE_TTL: usado direto;
+- idade < BQ_SCHEMA_CACHE_MAX_STALE: usado direto e revalidado por uma thread
+  em segundo plano;
+- ausente ou mais velho que isso: busca síncrona.
+Quando a revalidação encontra outra versão da tabela (`etag`/`last_modified`),
+o cache é substituído e os ouvintes (`add_schema_listener`) são avisados —
+p.ex. o cache de schema dos nós do agente.
+
+Pré-carga em lote
+-----------------
+`prefetch_schemas()` carrega de uma vez as tabelas de BQ_SCHEMA_PREFETCH
+(fato + dimensões): `get_table` em paralelo e, para as que falharem, uma
+única consulta a INFORMATION_SCHEMA por dataset. O resultado vai para o mesmo
+cache lido por `get_table_schema`, então o custo de partida não cresce com o
+número de tabelas.
 
 Exemplo:
     get_table_schema("datario.adm_central_atendimento_1746", "chamado")
@@ -12,15 +42,53 @@ Exemplo:
 
 from __future__ import annotations
 
-from typing import Dict
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+import hashlib
+import json
+import os
 import re
-from functools import lru_cache
+import threading
+import time
+
+import pandas as pd
 
+from src.utils import bq
 from src.utils.bq import execute
+from src.utils.logger import get_logger
+
+log = get_logger(__name__)
+
+SCHEMA_CACHE_ENABLED = os.getenv("BQ_SCHEMA_CACHE", "1") == "1"
+SCHEMA_CACHE_DIR = os.getenv(
+    "BQ_SCHEMA_CACHE_DIR",
+    str(Path(__file__).resolve().parents[2] / ".cache" / "schema"),
+)
+SCHEMA_CACHE_TTL = float(os.getenv("BQ_SCHEMA_CACHE_TTL", "3600"))
+SCHEMA_CACHE_MAX_STALE = float(os.getenv("BQ_SCHEMA_CACHE_MAX_STALE", str(7 * 86400)))
+# Tabelas pré-carregadas no aquecimento ("projeto.dataset.tabela", separadas por vírgula)
+SCHEMA_PREFETCH_TABLES = [
+    t.strip()
+    for t in os.getenv(
+        "BQ_SCHEMA_PREFETCH",
+        "datario.adm_central_atendimento_1746.chamado,datario.dados_mestres.bairro",
+    ).split(",")
+    if t.strip()
+]
+SCHEMA_PREFETCH_WORKERS = int(os.getenv("BQ_SCHEMA_PREFETCH_WORKERS", "8"))
 
 # Permitimos apenas caracteres seguros em identificadores de BQ
 _SAFE_ID = re.compile(r"^[A-Za-z0-9_.$]+$")
 
+# Nomes legados da API de tabelas → nomes do Standard SQL (INFORMATION_SCHEMA)
+_LEGACY_TYPES = {
+    "INTEGER": "INT64",
+    "FLOAT": "FLOAT64",
+    "BOOLEAN": "BOOL",
+    "RECORD": "STRUCT",
+}
+
 
 def _strip_backticks(name: str) -> str:
     """Remove acentos graves (backticks) de um identificador, se existirem."""
@@ -40,10 +108,328 @@ def _validate_identifier(name: str, kind: str) -> str:
     return n
 
 
-@lru_cache(maxsize=64)
+# Caminho 1: metadados da tabela
+
+
+def _field_type(field) -> str:
+    """
+    Tipo Standard SQL de um `SchemaField`, no mesmo formato de
+    INFORMATION_SCHEMA.COLUMNS.data_type (p.ex. STRUCT<a STRING>, ARRAY<INT64>).
+    """
+    base = str(field.field_type or "").upper()
+    base = _LEGACY_TYPES.get(base, base)
+    if base == "STRUCT":
+        inner = ", ".join(f"{f.name} {_field_type(f)}" for f in field.fields)
+        base = f"STRUCT<{inner}>"
+    elif getattr(field, "max_length", None):
+        base = f"{base}({field.max_length})"
+    elif getattr(field, "precision", None):
+        scale = getattr(field, "scale", None)
+        base = f"{base}({field.precision}{'' if scale is None else f', {scale}'})"
+    return f"ARRAY<{base}>" if (field.mode or "").upper() == "REPEATED" else base
+
+
+def _field_tree(fields) -> List[Dict[str, Any]]:
+    """Campos (inclusive aninhados) como lista de dicts serializáveis."""
+    return [
+        {
+            "name": f.name,
+            "type": _field_type(f),
+            "mode": (f.mode or "NULLABLE").upper(),
+            "fields": _field_tree(f.fields) if f.fields else [],
+        }
+        for f in fields
+    ]
+
+
+def _metadata_from_table(ds: str, tb: str) -> Dict[str, Any]:
+    t = bq.get_bq_client().get_table(f"{ds}.{tb}", timeout=bq.QUERY_TIMEOUT)
+    partitioning = None
+    if t.time_partitioning is not None:
+        partitioning = {
+            "type": t.time_partitioning.type_,
+            "field": t.time_partitioning.field or "_PARTITIONTIME",
+            "require_filter": bool(t.require_partition_filter),
+        }
+    elif t.range_partitioning is not None:
+        rp = t.range_partitioning
+        partitioning = {
+            "type": "RANGE",
+            "field": rp.field,
+            "range": {
+                "start": rp.range_.start,
+                "end": rp.range_.end,
+                "interval": rp.range_.interval,
+            },
+            "require_filter": bool(t.require_partition_filter),
+        }
+    return {
+        "columns": {f.name: _field_type(f) for f in t.schema},
+        "fields": _field_tree(t.schema),
+        "partitioning": partitioning,
+        "clustering": list(t.clustering_fields or []),
+        "last_modified": t.modified.isoformat() if t.modified else None,
+        "etag": t.etag,
+        "num_rows": t.num_rows,
+        "num_bytes": t.num_bytes,
+        "source": "metadata",
+    }
+
+
+# Caminho 2: INFORMATION_SCHEMA (fallback)
+
+
+def _metadata_from_information_schema_many(
+    ds: str, tables: List[str]
+) -> Dict[str, Dict[str, Any]]:
+    """Metadados de várias tabelas do mesmo dataset em uma única consulta."""
+    # INFORMATION_SCHEMA é resolvido por dataset
+    names = ", ".join(f"'{tb}'" for tb in tables)
+    sql = f"""
+        SELECT table_name, column_name, data_type, is_partitioning_column,
+               clustering_ordinal_position
+        FROM `{ds}.INFORMATION_SCHEMA.COLUMNS`
+        WHERE table_name IN ({names})
+        ORDER BY table_name, ordinal_position
+    """
+
+    out = execute(sql)
+    if not out.get("ok"):
+        raise RuntimeError(f"Falha ao obter schema de {ds}: {out.get('error')}")
+
+    df = out.get("df")
+    if df is None or df.empty:
+        return {}
+    return {
+        str(tb): _metadata_from_columns(group)
+        for tb, group in df.groupby("table_name", sort=False)
+    }
+
+
+def _metadata_from_information_schema(ds: str, tb: str) -> Dict[str, Any]:
+    meta = _metadata_from_information_schema_many(ds, [tb]).get(tb)
+    if meta is None:
+        raise RuntimeError(
+            f"Nenhuma coluna encontrada em {ds}.{tb}. Verifique se a tabela existe."
+        )
+    return meta
+
+
+def _metadata_from_columns(df: pd.DataFrame) -> Dict[str, Any]:
+    """Linhas de INFORMATION_SCHEMA.COLUMNS de uma tabela → metadados."""
+    names = [str(c) for c in df["column_name"]]
+    types = [str(t).upper() for t in df["data_type"]]
+    partition_cols = [
+        n
+        for n, p in zip(names, df["is_partitioning_column"])
+        if str(p).upper() == "YES"
+    ]
+    clustering = sorted(
+        (int(pos), n)
+        for n, pos in zip(names, df["clustering_ordinal_position"])
+        if not pd.isna(pos)  # nulo quando a coluna não é de clustering
+    )
+    return {
+        "columns": dict(zip(names, types)),
+        "fields": [
+            {
+                "name": n,
+                "type": t,
+                "mode": "REPEATED" if t.startswith("ARRAY<") else "NULLABLE",
+                "fields": [],
+            }
+            for n, t in zip(names, types)
+        ],
+        "partitioning": (
+            {"type": None, "field": partition_cols[0]} if partition_cols else None
+        ),
+        "clustering": [n for _, n in clustering],
+        "last_modified": None,
+        "etag": None,
+        "num_rows": None,
+        "num_bytes": None,
+        "source": "information_schema",
+    }
+
+
+def _table_version(meta: Dict[str, Any]) -> str:
+    """Versão da tabela: etag/last_modified (ou hash das colunas no fallback)."""
+    if meta.get("etag") or meta.get("last_modified"):
+        return f"{meta.get('etag')}|{meta.get('last_modified')}"
+    raw = json.dumps(meta.get("columns"), sort_keys=True).encode("utf-8")
+    return "columns:" + hashlib.sha1(raw).hexdigest()[:16]
+
+
+def _fetch_metadata(ds: str, tb: str) -> Dict[str, Any]:
+    """Busca no BigQuery: metadados da tabela, com INFORMATION_SCHEMA de fallback."""
+    try:
+        meta = _metadata_from_table(ds, tb)
+    except Exception as e:
+        log.info(
+            "get_table falhou para %s.%s (%r); usando INFORMATION_SCHEMA", ds, tb, e
+        )
+        meta = _metadata_from_information_schema(ds, tb)
+    meta["version"] = _table_version(meta)
+    return meta
+
+
+# Cache em memória + disco
+
+_CACHE: Dict[Tuple[str, str], Tuple[float, Dict[str, Any]]] = {}
+_CACHE_LOCK = threading.Lock()
+_REFRESHING: set = set()
+_LISTENERS: List[Callable[[str, str, Dict[str, Any]], None]] = []
+
+
+def _cache_path(ds: str, tb: str) -> Path:
+    return Path(SCHEMA_CACHE_DIR) / f"{ds}.{tb}.json"
+
+
+def _disk_get(ds: str, tb: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+    if not SCHEMA_CACHE_ENABLED:
+        return None
+    try:
+        data = json.loads(_cache_path(ds, tb).read_text(encoding="utf-8"))
+        return float(data["fetched_at"]), data["meta"]
+    except (OSError, ValueError, KeyError, TypeError):
+        return None
+
+
+def _disk_put(ds: str, tb: str, fetched_at: float, meta: Dict[str, Any]) -> None:
+    """Grava de forma atômica (tmp + os.replace); falhas de disco só são logadas."""
+    if not SCHEMA_CACHE_ENABLED:
+        return
+    path = _cache_path(ds, tb)
+    try:
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(f".{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_text(
+            json.dumps({"fetched_at": fetched_at, "meta": meta}), encoding="utf-8"
+        )
+        os.replace(tmp, path)
+    except OSError as e:
+        log.debug("schema | falha ao gravar cache de %s.%s: %r", ds, tb, e)
+
+
+def _store(ds: str, tb: str, meta: Dict[str, Any]) -> None:
+    """Guarda metadados recém-buscados e avisa os ouvintes se a versão mudou."""
+    now = time.time()
+    with _CACHE_LOCK:
+        previous = _CACHE.get((ds, tb))
+        _CACHE[(ds, tb)] = (now, meta)
+        listeners = list(_LISTENERS)
+    _disk_put(ds, tb, now, meta)
+    if previous is not None and previous[1].get("version") != meta.get("version"):
+        log.info(
+            "Schema de %s.%s mudou (%s → %s)",
+            ds,
+            tb,
+            previous[1].get("version"),
+            meta.get("version"),
+        )
+        for fn in listeners:
+            try:
+                fn(ds, tb, meta)
+            except Exception as e:
+                log.warning("schema | ouvinte falhou: %r", e)
+
+
+def _revalidate(ds: str, tb: str) -> None:
+    try:
+        _store(ds, tb, _fetch_metadata(ds, tb))
+    except Exception as e:
+        # Mantém a cópia antiga; nova tentativa no próximo acesso
+        log.warning("schema | revalidação de %s.%s falhou: %r", ds, tb, e)
+    finally:
+        with _CACHE_LOCK:
+            _REFRESHING.discard((ds, tb))
+
+
+def _schedule_revalidation(ds: str, tb: str) -> None:
+    with _CACHE_LOCK:
+        if (ds, tb) in _REFRESHING:
+            return
+        _REFRESHING.add((ds, tb))
+    threading.Thread(
+        target=_revalidate, args=(ds, tb), name=f"schema-refresh-{tb}", daemon=True
+    ).start()
+
+
+def add_schema_listener(fn: Callable[[str, str, Dict[str, Any]], None]) -> None:
+    """Registra `fn(dataset, table, meta)`, chamado quando a versão de uma tabela muda."""
+    with _CACHE_LOCK:
+        if fn not in _LISTENERS:
+            _LISTENERS.append(fn)
+
+
+def clear_schema_cache(disk: bool = False) -> None:
+    """Limpa o cache em memória (e, com `disk=True`, os arquivos persistidos)."""
+    with _CACHE_LOCK:
+        _CACHE.clear()
+    if disk:
+        for path in Path(SCHEMA_CACHE_DIR).glob("*.json"):
+            path.unlink(missing_ok=True)
+
+
+def _cached_entry(ds: str, tb: str) -> Optional[Tuple[float, Dict[str, Any]]]:
+    """Entrada do cache (memória, senão disco) de ds.tb, sem ir ao BigQuery."""
+    with _CACHE_LOCK:
+        entry = _CACHE.get((ds, tb))
+    if entry is None:
+        entry = _disk_get(ds, tb)
+        if entry is not None:
+            with _CACHE_LOCK:
+                entry = _CACHE.setdefault((ds, tb), entry)
+    return entry
+
+
+def _usable(ds: str, tb: str, entry: Optional[Tuple[float, Dict[str, Any]]]) -> bool:
+    """True se a entrada pode ser servida (agenda revalidação quando velha)."""
+    if entry is None:
+        return False
+    age = time.time() - entry[0]
+    if age < SCHEMA_CACHE_TTL:
+        return True
+    if age < SCHEMA_CACHE_MAX_STALE:
+        _schedule_revalidation(ds, tb)
+        return True
+    return False
+
+
+def get_table_metadata(dataset: str, table: str) -> Dict[str, Any]:
+    """
+    Schema completo de dataset.table.
+
+    Usa os metadados da tabela (`get_table`); se falharem, cai para
+    INFORMATION_SCHEMA.COLUMNS (sem versão nem campos aninhados detalhados).
+    Resultado servido do cache persistente (ver docstring do módulo).
+
+    Returns
+    -------
+    dict
+        {"columns": {coluna: tipo}, "fields": [{"name", "type", "mode", "fields"}],
+         "partitioning": {"type", "field", "require_filter"?}|None,
+         "clustering": [colunas], "last_modified": str|None, "etag": str|None,
+         "num_rows": int|None, "num_bytes": int|None,
+         "source": "metadata"|"information_schema", "version": str}
+        Lança ValueError para identificadores inválidos e RuntimeError se
+        nenhum dos caminhos funcionar.
+    """
+    ds = _validate_identifier(dataset, "dataset")
+    tb = _validate_identifier(table, "table")
+
+    entry = _cached_entry(ds, tb)
+    if _usable(ds, tb, entry):
+        return entry[1]
+
+    meta = _fetch_metadata(ds, tb)
+    _store(ds, tb, meta)
+    return meta
+
+
 def get_table_schema(dataset: str, table: str) -> Dict[str, str]:
     """
-    Retorna {coluna: tipo} de dataset.table via INFORMATION_SCHEMA.
+    Retorna {coluna: tipo} de dataset.table (colunas de primeiro nível).
 
     Parameters
     ----------
@@ -56,31 +442,110 @@ def get_table_schema(dataset: str, table: str) -> Dict[str, str]:
     Returns
     -------
     Dict[str, str]
-        Mapeamento coluna -> tipo BigQuery (UPPERCASE).
+        Mapeamento coluna -> tipo BigQuery (UPPERCASE; STRUCT<...>/ARRAY<...> para
+        campos aninhados/repetidos, como em INFORMATION_SCHEMA).
         Lança ValueError para identificadores inválidos e RuntimeError em falha de consulta.
     """
-    ds = _validate_identifier(dataset, "dataset")
-    tb = _validate_identifier(table, "table")
+    return dict(get_table_metadata(dataset, table)["columns"])
 
-    # INFORMATION_SCHEMA é resolvido por dataset
-    sql = f"""
-        SELECT column_name, data_type
-        FROM `{ds}.INFORMATION_SCHEMA.COLUMNS`
-        WHERE table_name = '{tb}'
+
+# Pré-carga em lote
+
+
+def _split_table(name: str) -> Tuple[str, str]:
+    """ "projeto.dataset.tabela" → ("projeto.dataset", "tabela"), validados."""
+    ds, _, tb = _strip_backticks(name).rpartition(".")
+    return _validate_identifier(ds, "dataset"), _validate_identifier(tb, "table")
+
+
+def prefetch_schemas(
+    tables: Optional[List[str]] = None, workers: Optional[int] = None
+) -> Dict[str, Any]:
     """
+    Carrega no cache os schemas de várias tabelas de uma vez.
 
-    out = execute(sql)
-    if not out.get("ok"):
-        raise RuntimeError(f"Falha ao obter schema de {ds}.{tb}: {out.get('error')}")
+    Tabelas já em cache (memória/disco) não são buscadas; as demais vêm de
+    `get_table` em paralelo, e as que falharem caem para uma consulta a
+    INFORMATION_SCHEMA por dataset.
 
-    df = out.get("df")
-    if df is None or df.empty:
-        raise RuntimeError(
-            f"Nenhuma coluna encontrada em {ds}.{tb}. Verifique se a tabela existe."
-        )
+    Parameters
+    ----------
+    tables : list[str] | None
+        Nomes "projeto.dataset.tabela" (padrão: BQ_SCHEMA_PREFETCH).
+    workers : int | None
+        Chamadas `get_table` simultâneas (padrão: BQ_SCHEMA_PREFETCH_WORKERS).
 
-    # Normaliza para dict coluna
-    return {
-        str(row["column_name"]): str(row["data_type"]).upper()
-        for _, row in df.iterrows()
-    }
+    Returns
+    -------
+    dict
+        {"ok": bool, "fetched": [tabelas], "cached": [tabelas],
+         "failed": {tabela: erro}, "seconds": float}
+    """
+    t0 = time.monotonic()
+    names = SCHEMA_PREFETCH_TABLES if tables is None else tables
+    out: Dict[str, Any] = {"ok": True, "fetched": [], "cached": [], "failed": {}}
+
+    pending: List[Tuple[str, str]] = []
+    for name in names:
+        try:
+            ds, tb = _split_table(name)
+        except ValueError as e:
+            out["failed"][name] = str(e)
+            continue
+        if _usable(ds, tb, _cached_entry(ds, tb)):
+            out["cached"].append(f"{ds}.{tb}")
+        elif (ds, tb) not in pending:
+            pending.append((ds, tb))
+
+    def _from_table(ref: Tuple[str, str]) -> Optional[Dict[str, Any]]:
+        try:
+            return _metadata_from_table(*ref)
+        except Exception as e:
+            log.info(
+                "get_table falhou para %s.%s (%r); usando INFORMATION_SCHEMA", *ref, e
+            )
+            return None
+
+    metas: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    if pending:
+        n = max(1, min(workers or SCHEMA_PREFETCH_WORKERS, len(pending)))
+        with ThreadPoolExecutor(
+            max_workers=n, thread_name_prefix="schema-prefetch"
+        ) as pool:
+            for ref, meta in zip(pending, pool.map(_from_table, pending)):
+                if meta is not None:
+                    metas[ref] = meta
+
+    # Fallback agrupado: uma consulta por dataset para o que `get_table` não trouxe
+    missing: Dict[str, List[str]] = {}
+    for ds, tb in pending:
+        if (ds, tb) not in metas:
+            missing.setdefault(ds, []).append(tb)
+    for ds, tbs in missing.items():
+        try:
+            found = _metadata_from_information_schema_many(ds, tbs)
+        except Exception as e:
+            found = {}
+            for tb in tbs:
+                out["failed"][f"{ds}.{tb}"] = repr(e)
+        for tb in tbs:
+            if tb in found:
+                metas[(ds, tb)] = found[tb]
+            else:
+                out["failed"].setdefault(f"{ds}.{tb}", "tabela sem colunas/inexistente")
+
+    for (ds, tb), meta in metas.items():
+        meta["version"] = _table_version(meta)
+        _store(ds, tb, meta)
+        out["fetched"].append(f"{ds}.{tb}")
+
+    out["ok"] = not out["failed"]
+    out["seconds"] = time.monotonic() - t0
+    log.info(
+        "schema | pré-carga: %d buscada(s), %d em cache, %d falha(s) em %.2fs",
+        len(out["fetched"]),
+        len(out["cached"]),
+        len(out["failed"]),
+        out["seconds"],
+    )
+    return out
@@ -9,11 +9,14 @@ Interface web profissional para o agente em LangGraph que consulta o BigQuery (d
 - Resposta sintetizada (LLM on/off), SQL gerado e validação (dry-run)
 - Preview do DataFrame, download de CSV e gráfico automático quando aplicável
 - Métricas de observabilidade: intent, bytes estimados, latência, versão do grafo
+- Uso do orçamento de bytes do BigQuery (sessão e processo) na barra lateral
 
 Boas práticas aplicadas
 -----------------------
 - Configuração para GCP Cloud Shell (porta 8501, headless)
-- Cache de resultados por 10 minutos (evita refazer consultas idênticas)
+- Schemas de todas as tabelas pré-carregados em lote na partida do processo
+- Cache de resultados por 10 minutos (evita refazer consultas idênticas), sobre o
+  cache persistente em disco de `src/utils/bq.py` (compartilhado com CLI/acceptance)
 - Toggle "LLM on/off" que sobrepõe LLM_USE_FOR_SYNTH somente nesta execução
 - Tolerância a falhas (erros aparecem em mensagens claras; nunca quebra a UI)
 - Documentação e comentários para manutenção futura
@@ -23,6 +26,7 @@ Boas práticas aplicadas
 from __future__ import annotations
 
 import os
+import uuid
 from typing import Any, Dict, Optional
 
 import pandas as pd
@@ -34,6 +38,8 @@ import streamlit as st
     # - run_debug() retorna o estado completo do grafo 
     # - GRAPH_VERSION ajuda no rastreio de mudanças
 from src.agent.graph import run_debug, GRAPH_VERSION
+from src.agent.nodes import warm_schemas
+from src.utils.bq import ArrowResult, budget_session, budget_usage
 
 
 
@@ -81,12 +87,14 @@ def _ptbr_number(n: Any) -> str:
 
 
 @st.cache_data(show_spinner=False, ttl=600)
-def ask_agent_cached(question: str, llm_on: bool) -> Dict[str, Any]:
+def ask_agent_cached(question: str, llm_on: bool, _session: str = "default") -> Dict[str, Any]:
     """
     Invoca o agente e cacheia o resultado por 10 minutos (chave = pergunta + modo LLM).
 
     - Sobrepõe temporariamente LLM_USE_FOR_SYNTH com base no toggle da UI.
     - Restaura a variável ao final, evitando efeitos colaterais no processo.
+    - Atribui os bytes consultados ao orçamento da sessão `_session` (fora da
+      chave do cache: um hit não consome orçamento de ninguém).
 
     Returns
     -------
@@ -95,7 +103,8 @@ def ask_agent_cached(question: str, llm_on: bool) -> Dict[str, Any]:
     prev = os.getenv("LLM_USE_FOR_SYNTH")
     try:
         os.environ["LLM_USE_FOR_SYNTH"] = "1" if llm_on else "0"
-        state = run_debug(question or "")
+        with budget_session(_session):
+            state = run_debug(question or "")
         return state or {}
     finally:
         if prev is None:
@@ -134,9 +143,26 @@ def _bar_with_value_labels(df: pd.DataFrame, cat_col: str, value_col: str) -> go
     return fig
 
 
-def _viz_suggestion(df: pd.DataFrame) -> Optional[Dict[str, Any]]:
+def _is_tabular(df: Any) -> bool:
+    """True para DataFrame ou ArrowResult (resultado colunar do grafo)."""
+    return isinstance(df, (pd.DataFrame, ArrowResult))
+
+
+def _as_pandas(df: Any) -> pd.DataFrame:
+    """Converte para pandas apenas quando a UI realmente precisa da tabela inteira."""
+    return df.to_pandas() if isinstance(df, ArrowResult) else df
+
+
+def _cell(df: Any, row: int, column: str) -> Any:
+    """Lê uma célula sem materializar o Arrow em pandas."""
+    if isinstance(df, ArrowResult):
+        return df.value(row, column)
+    return df.iloc[row][column]
+
+
+def _viz_suggestion(df: Any) -> Optional[Dict[str, Any]]:
     """
-    Decide automaticamente como visualizar o resultado:
+    Decide automaticamente como visualizar o resultado (DataFrame ou ArrowResult):
 
     - Se existir coluna 'total' e exatamente 1 coluna categórica:
         * len(df) == 1  → metric card (label=cat, value=total)
@@ -145,36 +171,37 @@ def _viz_suggestion(df: pd.DataFrame) -> Optional[Dict[str, Any]]:
         * metric card (label="Contagem", value=n)
     - Caso contrário: None
     """
-    if not isinstance(df, pd.DataFrame) or df.empty:
+    if not _is_tabular(df) or df.empty:
         return None
 
-    cols_lower = [c.lower() for c in df.columns]
+    columns = list(df.columns)
+    cols_lower = [c.lower() for c in columns]
 
     # 1) Ranking categórico
     if "total" in cols_lower:
-        cat_cols = [c for c in df.columns if c.lower() != "total"]
+        cat_cols = [c for c in columns if c.lower() != "total"]
         if len(cat_cols) == 1:
             key = cat_cols[0]
-            tmp = df[[key, "total"]].copy()
-            tmp["total"] = pd.to_numeric(tmp["total"], errors="coerce").fillna(0)
 
-            if len(tmp) == 1:
-                label = str(tmp.iloc[0][key])
-                val = tmp.iloc[0]["total"]
+            if len(df) == 1:
+                label = str(_cell(df, 0, key))
+                val = pd.to_numeric(_cell(df, 0, "total"), errors="coerce")
                 return {
                     "type": "metric",
                     "title": f"{key.capitalize()} mais comum",
-                    "value": _ptbr_number(val),
+                    "value": _ptbr_number(0 if pd.isna(val) else val),
                     "subtitle": label,
                 }
             else:
+                tmp = _as_pandas(df)[[key, "total"]].copy()
+                tmp["total"] = pd.to_numeric(tmp["total"], errors="coerce").fillna(0)
                 fig = _bar_with_value_labels(tmp, cat_col=key, value_col="total")
                 return {"type": "bar", "fig": fig}
 
     # 2) Contagem simples 'n'
     if "n" in cols_lower and len(df) == 1:
         try:
-            n_val = float(df.iloc[0][df.columns[cols_lower.index("n")]])
+            n_val = float(_cell(df, 0, columns[cols_lower.index("n")]))
         except Exception:
             n_val = None
         if n_val is not None:
@@ -189,6 +216,36 @@ def _viz_suggestion(df: pd.DataFrame) -> Optional[Dict[str, Any]]:
 
 
 
+def _render_budget(container: Any, session_id: str) -> None:
+    """Uso do orçamento de bytes do BigQuery (janela deslizante) na barra lateral."""
+    usage = budget_usage(session_id)
+    with container.container():
+        st.markdown("### Orçamento BigQuery")
+        st.caption(f"Janela de {usage['window_s'] / 3600:g} h")
+        for label, used, limit in (
+            ("Sessão", usage["session_bytes"], usage["session_limit"]),
+            ("Processo", usage["process_bytes"], usage["process_limit"]),
+        ):
+            if limit:
+                st.progress(
+                    min(1.0, used / limit),
+                    text=f"{label}: {_fmt_int(used)} de {_fmt_int(limit)} bytes",
+                )
+            else:
+                st.write(f"**{label}**: {_fmt_int(used)} bytes (sem limite)")
+
+
+@st.cache_resource(show_spinner=False)
+def _warm_schemas_once() -> Dict[str, Any]:
+    """Pré-carga dos schemas (fato + dimensões) uma vez por processo do Streamlit."""
+    return warm_schemas()
+
+
+_warm_schemas_once()
+
+# Identificador da sessão (orçamento de bytes por usuário da UI)
+session_id = st.session_state.setdefault("budget_session", uuid.uuid4().hex[:12])
+
 # Sidebar
 with st.sidebar:
     st.markdown("## ⚙️ Configurações")
@@ -212,6 +269,9 @@ with st.sidebar:
         "A UI respeita as mesmas variáveis de ambiente do backend. "
         "Não exibimos segredos (ex.: OPENAI_API_KEY)."
     )
+    st.divider()
+    # Preenchido ao final do script, já com o consumo desta execução
+    budget_box = st.empty()
 
 
 
@@ -243,7 +303,7 @@ if run_clicked:
 
     with st.spinner("Consultando o agente..."):
         try:
-            state = ask_agent_cached(q, llm_on=llm_on)
+            state = ask_agent_cached(q, llm_on=llm_on, _session=session_id)
         except Exception as e:
             st.error(f"Falha inesperada ao executar o agente: {e!r}")
             st.stop()
@@ -277,11 +337,13 @@ if run_clicked:
         st.error(answer)
     else:
         st.success(answer)
+    if not is_chitchat and meta.get("query_path") == "cube":
+        st.caption(f"Respondido pelo cubo local (dados até {meta.get('cube_fresh_through')}).")
 
     # Blocos apenas para perguntas de DADOS
     if not is_chitchat:
         # Prévia dos dados
-        if isinstance(df, pd.DataFrame):
+        if _is_tabular(df):
             with st.expander("Prévia dos dados", expanded=False):
                 try:
                     st.dataframe(df.head(max_rows), use_container_width=True)
@@ -290,7 +352,7 @@ if run_clicked:
                 try:
                     st.download_button(
                         "Baixar CSV",
-                        df.to_csv(index=False).encode("utf-8"),
+                        _as_pandas(df).to_csv(index=False).encode("utf-8"),
                         file_name="resultado.csv",
                         mime="text/csv",
                     )
@@ -298,7 +360,7 @@ if run_clicked:
                     st.caption("Não foi possível preparar o download do CSV.")
 
         # Visualização automática
-        if isinstance(df, pd.DataFrame):
+        if _is_tabular(df):
             viz = _viz_suggestion(df)
             if viz:
                 st.markdown("#### Visualização")
@@ -318,6 +380,8 @@ if run_clicked:
                 st.info("Nenhum SQL gerado (falha de geração).")
             if state.get("validation_error"):
                 st.error(f"Erro de validação/execução: {state['validation_error']}")
+            elif meta.get("query_path") == "cube":
+                st.info("Respondido pelo cubo local: sem dry-run nem consulta ao BigQuery.")
             elif validation_ok is True:
                 st.success("Dry-run OK")
 
@@ -328,6 +392,8 @@ if run_clicked:
                 trimmed["sql_preview"] = str(trimmed["sql_preview"])[:800]
             st.json(trimmed)
 
+_render_budget(budget_box, session_id)
+
 # Rodapé
 st.markdown("---")
 st.caption(
@@ -0,0 +1,70 @@
+"""
+Fixtures compartilhadas pelos testes.
+
+- `write_mirror`: grava um espelho local de `chamado` (layout Hive, uma pasta
+  por `data_particao`) e a tabela de bairros, como `scripts/sync_mirror.py`.
+"""
+
+import datetime as dt
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+CHAMADO = "datario.adm_central_atendimento_1746.chamado"
+BAIRRO = "datario.dados_mestres.bairro"
+_COLUMNS = ("id_chamado", "id_bairro", "tipo", "subtipo", "nome_unidade_organizacional")
+
+
+def mirror_rows(today=None):
+    """Linhas base (data_particao, id_bairro, tipo, subtipo, unidade); hoje em UTC."""
+    today = today or dt.datetime.now(dt.timezone.utc).date()
+    return [
+        (dt.date(2024, 11, 28), "1", "Buraco", "Reparo de buraco", "SECONSERVA"),
+        (
+            dt.date(2024, 11, 28),
+            "2",
+            "Estacionamento",
+            "Fiscalização de estacionamento irregular",
+            "CET-RIO",
+        ),
+        (dt.date(2023, 5, 2), "1", "Buraco", "Reparo de buraco", "SECONSERVA"),
+        (dt.date(2023, 7, 9), "1", "Buraco", "Reparo de buraco", "SECONSERVA"),
+        (today, "2", "Iluminação Pública", "Reparo de lâmpada apagada", "RIOLUZ"),
+        (today, "1", "Iluminação Pública", "Reparo de lâmpada apagada", "RIOLUZ"),
+        (today, "1", "Iluminação Pública", "Poste caído", "RIOLUZ"),
+        (
+            today,
+            "2",
+            "Estacionamento",
+            "Fiscalização de estacionamento irregular",
+            "CET-RIO",
+        ),
+    ]
+
+
+def _write_mirror(root, extra_rows=()):
+    by_day = {}
+    for i, (day, bairro, tipo, subtipo, unidade) in enumerate(
+        [*mirror_rows(), *extra_rows]
+    ):
+        by_day.setdefault(day, []).append((f"c{i}", bairro, tipo, subtipo, unidade))
+    for day, items in by_day.items():
+        part = root / CHAMADO / f"data_particao={day:%Y-%m-%d}"
+        part.mkdir(parents=True)
+        cols = list(zip(*items))
+        pq.write_table(
+            pa.table({n: pa.array(c, pa.string()) for n, c in zip(_COLUMNS, cols)}),
+            part / "part-0.parquet",
+        )
+    pq.write_table(
+        pa.table({"id_bairro": [1, 2], "nome": ["Centro", "Tijuca"]}),
+        root / f"{BAIRRO}.parquet",
+    )
+    return root
+
+
+@pytest.fixture
+def write_mirror():
+    """`write_mirror(root, extra_rows=())`: linhas base + `extra_rows` do teste."""
+    return _write_mirror
@@ -0,0 +1,180 @@
+"""
+Testes do backend local (DuckDB sobre snapshot Parquet), sem Google Cloud.
+
+Critérios cobertos
+------------------
+- Tradução de dialeto: tabelas entre crases, DATE_SUB com INTERVAL, CAST INT64.
+- Schema exposto com nomes de tipo do BigQuery (STRING, INT64, DATE...).
+- Os templates do gerador validam e executam no snapshot, com resultados corretos.
+- Guardas estáticas (SELECT-only, sem SELECT *) também valem no backend local.
+- Backend sem algum método do contrato falha já na criação.
+- Filtro IN pelo dicionário de categorias dá o mesmo resultado que o LIKE.
+"""
+
+import datetime as dt
+
+import pytest
+
+pytest.importorskip("duckdb")
+
+from src.agent import categories, cube, nodes  # noqa: E402
+from src.utils import backends  # noqa: E402
+
+CHAMADO = "datario.adm_central_atendimento_1746.chamado"
+BAIRRO = "datario.dados_mestres.bairro"
+
+
+EXTRA_ROWS = [
+    (dt.date(2023, 8, 1), "2", "Buraco", "Reparo de buraco", "SECONSERVA"),
+]
+
+
+@pytest.fixture
+def local_backend(tmp_path, monkeypatch, write_mirror):
+    write_mirror(tmp_path, EXTRA_ROWS)
+    backend = backends.DuckDBBackend(str(tmp_path))
+    backends.set_backend(backend)
+    monkeypatch.setattr(nodes, "_SCHEMA_CACHE", {})
+    yield backend
+    backends.set_backend(None)
+
+
+def test_translate_sql_dialect():
+    sql = (
+        "SELECT CAST(c.id_bairro AS INT64) AS b FROM `p.d.t` c "
+        "WHERE data_particao >= DATE_SUB(CURRENT_DATE(), INTERVAL 365 DAY)"
+    )
+    out = backends.translate_sql(sql)
+    assert '"p.d.t" c' in out and "AS BIGINT" in out
+    assert "CAST((CURRENT_DATE()) - INTERVAL 365 DAY AS DATE)" in out
+
+
+def test_schema_uses_bigquery_type_names(local_backend):
+    schema = local_backend.table_schema(
+        "datario.adm_central_atendimento_1746", "chamado"
+    )
+    assert schema["subtipo"] == "STRING" and schema["data_particao"] == "DATE"
+    assert (
+        local_backend.table_schema("datario.dados_mestres", "bairro")["id_bairro"]
+        == "INT64"
+    )
+
+
+@pytest.mark.parametrize(
+    "question, column, expected",
+    [
+        ("Quantos chamados foram abertos no dia 28/11/2024?", "n", 2),
+        (
+            "Qual o subtipo de chamado mais comum relacionado a Iluminação Pública?",
+            "subtipo",
+            "Reparo de lâmpada apagada",
+        ),
+        (
+            "Quais os 3 bairros que mais tiveram chamados abertos sobre reparo de buraco em 2023?",
+            "bairro",
+            "Centro",
+        ),
+        (
+            "Qual o nome da unidade organizacional que mais atendeu chamados de "
+            "Fiscalização de estacionamento irregular?",
+            "unidade",
+            "CET-RIO",
+        ),
+    ],
+)
+def test_templates_run_on_local_snapshot(local_backend, question, column, expected):
+    sql = nodes.generate_sql(question)["sql"]
+    v = nodes.validate_sql(sql)
+    assert v["ok"] is True, v["error"]
+    out = nodes.execute_sql(sql, validation=v, result_format="arrow")
+    assert out["ok"] is True, out["error"]
+    assert out["query_path"] == "duckdb"
+    assert nodes._cell(out["df"], 0, column) == expected
+
+
+@pytest.mark.parametrize(
+    "question, column, expected",
+    [
+        (
+            "Qual o subtipo de chamado mais comum relacionado a Iluminação Pública?",
+            "subtipo",
+            "Reparo de lâmpada apagada",
+        ),
+        (
+            "Quais os 3 bairros que mais tiveram chamados abertos sobre reparo de buraco em 2023?",
+            "bairro",
+            "Centro",
+        ),
+        (
+            "Qual o nome da unidade organizacional que mais atendeu chamados de "
+            "Fiscalização de estacionamento irregular?",
+            "unidade",
+            "CET-RIO",
+        ),
+    ],
+)
+def test_category_in_filter_matches_like(
+    local_backend, tmp_path, monkeypatch, question, column, expected
+):
+    monkeypatch.setattr(categories, "CATEGORY_IN_ENABLED", True)
+    monkeypatch.setattr(categories, "CATEGORY_DIR", str(tmp_path / "categories"))
+    monkeypatch.setattr(cube, "CUBE_DIR", str(tmp_path / "sem-cubo"))
+    monkeypatch.setattr(backends, "LOCAL_SNAPSHOT_DIR", str(tmp_path / "sem-espelho"))
+    # Carga cobre o snapshot inteiro (G3 filtra 2023)
+    monkeypatch.setattr(categories, "CATEGORY_LOOKBACK_DAYS", 36500)
+    categories.clear_dictionary()
+    try:
+        entry = categories.load_dictionary()
+        assert entry is not None
+        # A carga só vale até ontem (hoje ainda recebe chamados); simula uma
+        # feita após o fim do dia, que cobre as janelas que terminam hoje (G1/G4)
+        entry["through"] = dt.datetime.now(dt.timezone.utc).date().isoformat()
+        sql = nodes.generate_sql(question)["sql"]
+    finally:
+        categories.clear_dictionary()
+    # Snapshot só tem colunas do dicionário (tipo/subtipo): nenhum LIKE sobra
+    assert " IN (" in sql and "LIKE" not in sql
+    out = nodes.execute_sql(
+        sql, validation=nodes.validate_sql(sql), result_format="arrow"
+    )
+    assert out["ok"] is True, out["error"]
+    assert nodes._cell(out["df"], 0, column) == expected
+
+
+def test_local_backend_keeps_static_guards(local_backend):
+    ok = local_backend.dry_run(f"SELECT COUNT(1) AS n FROM `{CHAMADO}`")
+    assert ok["ok"] is True and ok["validation_token"] is None
+    assert local_backend.dry_run(f"SELECT * FROM `{CHAMADO}`")["ok"] is False
+    assert local_backend.execute(f"DELETE FROM `{CHAMADO}` WHERE 1=1")["ok"] is False
+
+
+def test_incomplete_backend_fails_on_creation():
+    class _NoSchema(backends.Backend):
+        def dry_run(self, sql):
+            return {"ok": True}
+
+        def execute(self, sql, prevalidated=None, result_format="pandas", timeout=None):
+            return {"ok": True}
+
+    with pytest.raises(TypeError, match="table_schema"):
+        _NoSchema()
+
+
+def test_schema_profile_built_once_per_backend(local_backend, monkeypatch):
+    calls = []
+    table_schema = local_backend.table_schema
+
+    def _counting(dataset, table):
+        calls.append(table)
+        return table_schema(dataset, table)
+
+    monkeypatch.setattr(local_backend, "table_schema", _counting)
+    for _ in range(3):
+        nodes.generate_sql(
+            "Qual o subtipo de chamado mais comum relacionado a Iluminação Pública?"
+        )
+    assert calls == ["chamado", "bairro"]
+    profile = nodes._SCHEMA_CACHE[(local_backend.name, None)]
+    assert profile.category_column == "subtipo" and profile.day_expr == "data_particao"
+    # id_bairro STRING no fato × INT64 na dimensão (lido do snapshot, não presumido)
+    assert profile.join_on == "c.id_bairro = CAST(b.id_bairro AS STRING)"
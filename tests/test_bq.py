@@ -10,9 +10,38 @@ Critérios cobertos
 - Bloqueio de 'SELECT *' (projeções devem ser explícitas).
 - Aceitação de CTEs (WITH ... SELECT) como SELECT-only válido.
 - Respeito ao teto de bytes faturáveis (maximum_bytes_billed).
+- Reaproveitamento do dry-run pelo executor (validation_token), com cliente fake.
+- Cache de dry-run por SQL normalizado (hit/miss), com cliente fake.
+- Cache persistente de resultados: política de TTL por partição e leitura do disco.
+- Modo "arrow": resultado colunar com conversão preguiçosa para pandas.
+- Escolha REST × Storage Read API por tamanho do resultado e fallback para REST;
+  o caminho relatado é o que a biblioteca usou (caminho curto → REST).
+- API assíncrona (aexecute): polling sem bloquear o loop e cancelamento do job.
+- Prazo por chamada: job cancelado e diagnóstico (job_id, elapsed_ms) no retorno.
+- Single-flight: chamadas idênticas concorrentes (threads e asyncio) usam um só job.
+- execute_many: ordem preservada, deduplicação (com cópias próprias do resultado),
+  prazo único por consulta e orçamento de bytes do lote.
+- Caminho curto (query_and_wait) para consultas pequenas; fluxo de job nas grandes.
+  Erro transitório ou prazo no caminho curto: o job já criado é achado pelo
+  rótulo da requisição (sem segunda submissão) e o job_id vai no outcome.
+- Estatísticas do job (cache_hit, bytes faturados, fila × execução, plano) no outcome.
+- Retentativas com jitter só para erros transitórios; reenvio com o mesmo job id
+  recupera o job existente (Conflict) em vez de criar outro.
+- Controle de admissão: recusa rápida com fila cheia e espera reportada no outcome.
+- Orçamento de bytes por sessão/processo em janela deslizante; exceção ou
+  cancelamento liberam a reserva (e as fichas de admissão ainda na fila).
 """
 
+import asyncio
+import datetime as dt
+import hashlib
 import importlib
+import threading
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pytest
 
 import src.utils.bq as bq  # importa como módulo para permitir reload nos testes
 
@@ -117,3 +146,811 @@ def test_execute_respects_max_bytes_billed(monkeypatch):
     # Limpeza: restaura variável e módulo original para não afetar outros testes
     monkeypatch.delenv("BQ_MAX_BYTES_BILLED", raising=False)
     importlib.reload(bq)
+
+
+# Cliente fake (sem rede) para testar o fluxo do executor
+
+
+class _FakeJob:
+    def __init__(self, dry_run: bool, total_rows: int = 1):
+        self.dry_run = dry_run
+        self.total_bytes_processed = 1024
+        self.total_rows = total_rows
+        self.schema = ["n"]
+        self.read_with = []
+        self.polls_until_done = 0
+        self.cancelled = False
+        self.job_id = "job_fake"
+        self.hang = False
+        self.gate = None
+
+    def result(self, timeout=None):
+        if self.hang and not self.dry_run:
+            raise TimeoutError("fake timeout")
+        if self.gate is not None and not self.dry_run:
+            if not self.gate.wait(timeout):
+                raise TimeoutError("fake timeout")
+        return self
+
+    def done(self):
+        self.polls_until_done -= 1
+        return self.polls_until_done < 0
+
+    def cancel(self):
+        self.cancelled = True
+        return True
+
+    def to_dataframe(self, bqstorage_client=None, create_bqstorage_client=False):
+        self.read_with.append(bqstorage_client)
+        return pd.DataFrame({"n": [42]})
+
+    def to_arrow(self, bqstorage_client=None, create_bqstorage_client=False):
+        self.read_with.append(bqstorage_client)
+        return pa.table({"n": [42]})
+
+
+class _FakeClient:
+    def __init__(self):
+        self.calls = []
+        self.jobs = []
+        self.polls_until_done = 0
+        self.hang = False
+        self.gate = None
+
+    def query(self, sql, job_config=None, **kwargs):
+        is_dry = bool(getattr(job_config, "dry_run", False))
+        self.calls.append("dry" if is_dry else "run")
+        job = _FakeJob(is_dry)
+        job.polls_until_done = self.polls_until_done
+        job.hang = self.hang
+        job.gate = self.gate
+        self.jobs.append(job)
+        return job
+
+    def query_and_wait(self, sql, job_config=None, **kwargs):
+        self.calls.append("fast")
+        return _FakeJob(False)
+
+
+@pytest.fixture
+def fake_client(monkeypatch, tmp_path):
+    """Substitui o cliente BigQuery por um fake e isola caches/limites do módulo."""
+    fake = _FakeClient()
+    monkeypatch.setattr(bq, "get_bq_client", lambda *a, **k: fake)
+    monkeypatch.setattr(bq, "MAX_BYTES_BILLED", 2 * 10**9)
+    monkeypatch.setattr(bq, "RESULT_CACHE_DIR", str(tmp_path / "bq_results"))
+    # Fluxo completo de job por padrão; o caminho curto tem teste próprio
+    monkeypatch.setattr(bq, "QUERY_MODE", "job")
+    # Sem limites de admissão por padrão; o controle tem teste próprio
+    monkeypatch.setattr(bq, "_ADMISSION", bq._Admission(0, 0, 0))
+    monkeypatch.setattr(bq, "_LEDGER", bq._BudgetLedger(3600))
+    bq.clear_dry_run_cache()
+    yield fake
+    bq.clear_dry_run_cache()
+
+
+def test_execute_reuses_prevalidated_dry_run(fake_client):
+    """Com token válido, o executor não repete o dry-run; com token de outro SQL, repete."""
+    fake = fake_client
+
+    dv = bq.dry_run(SQL_OK)
+    assert dv["ok"] is True and dv.get("validation_token")
+
+    out = bq.execute(SQL_OK, prevalidated=dv)
+    assert out["ok"] is True
+    assert fake.calls == ["dry", "run"]
+
+    # Token de outro SQL não é aceito: dry-run é refeito
+    out = bq.execute(SQL_WITH_OK, prevalidated=dv)
+    assert out["ok"] is True
+    assert fake.calls == ["dry", "run", "dry", "run"]
+
+
+def test_prevalidated_verdict_must_be_issued_here(fake_client):
+    """Veredito forjado ou com bytes adulterados não dispensa o dry-run."""
+    fake = fake_client
+    dv = bq.dry_run(SQL_OK)
+
+    # Token sem a chave do processo (hash simples do SQL)
+    forged = {
+        "ok": True,
+        "dry_run_bytes": 0,
+        "validation_token": hashlib.sha256(SQL_OK.encode()).hexdigest(),
+    }
+    out = bq.execute(SQL_OK, prevalidated=forged)
+    assert out["ok"] is True and out["dry_run_bytes"] == 1024
+    assert fake.calls == ["dry", "run"]
+
+    # Token legítimo, mas estimativa zerada: também refaz
+    bq.clear_dry_run_cache()
+    bq.clear_result_cache()
+    tampered = dict(dv, dry_run_bytes=0)
+    bq.execute(SQL_OK, prevalidated=tampered)
+    assert fake.calls == ["dry", "run", "dry", "run"]
+
+
+def test_dry_run_cache_hits_normalized_sql(fake_client):
+    """O mesmo SQL (módulo espaços/comentários) é validado uma única vez na API."""
+    fake = fake_client
+
+    first = bq.dry_run(SQL_OK)
+    second = bq.dry_run("-- mesma consulta\n" + "  ".join(SQL_OK.split()))
+
+    assert first["ok"] is True and second["ok"] is True
+    assert second.get("dry_run_cached") is True
+    assert second["dry_run_bytes"] == first["dry_run_bytes"]
+    assert fake.calls == ["dry"]
+    assert bq.dry_run_cache_stats()["hits"] == 1
+
+
+def test_result_cache_ttl_policy():
+    """Faixas fechadas no passado não expiram; CURRENT_DATE/hoje/faixa aberta expiram."""
+    today = dt.datetime.now(dt.timezone.utc).date()
+    assert bq._result_cache_ttl(SQL_OK) is None
+    assert (
+        bq._result_cache_ttl(
+            "SELECT COUNT(1) AS n FROM t WHERE data_particao >= DATE '2023-01-01' "
+            "AND data_particao < DATE '2024-01-01'"
+        )
+        is None
+    )
+    assert (
+        bq._result_cache_ttl(
+            "SELECT COUNT(1) AS n FROM t "
+            "WHERE data_particao >= DATE_SUB(CURRENT_DATE(), INTERVAL 365 DAY)"
+        )
+        == bq.RESULT_CACHE_TTL
+    )
+    assert (
+        bq._result_cache_ttl(
+            f"SELECT COUNT(1) AS n FROM t WHERE data_particao = DATE '{today:%Y-%m-%d}'"
+        )
+        == bq.RESULT_CACHE_TTL
+    )
+    assert (
+        bq._result_cache_ttl(
+            "SELECT COUNT(1) AS n FROM t WHERE data_particao >= DATE '2023-01-01'"
+        )
+        == bq.RESULT_CACHE_TTL
+    )
+
+
+def test_result_cache_ttl_recognises_generator_date_predicates():
+    """Ano via EXTRACT e dia via DATE(data_inicio) também fecham a janela."""
+    this_year = dt.datetime.now(dt.timezone.utc).date().year
+    by_year = (
+        "SELECT b.nome AS bairro, COUNT(1) AS total FROM t c JOIN b "
+        "ON c.id_bairro = b.id_bairro WHERE (EXTRACT(YEAR FROM c.data_inicio) = {}) "
+        "GROUP BY bairro"
+    )
+    assert bq._result_cache_ttl(by_year.format(2023)) is None
+    assert bq._result_cache_ttl(by_year.format(this_year)) == bq.RESULT_CACHE_TTL
+    assert (
+        bq._result_cache_ttl(
+            "SELECT COUNT(1) AS n FROM t WHERE DATE(data_inicio) = DATE '2024-11-28'"
+        )
+        is None
+    )
+    assert (
+        bq._result_cache_ttl(
+            "SELECT COUNT(1) AS n FROM t WHERE EXTRACT(YEAR FROM data_inicio) >= 2023"
+        )
+        == bq.RESULT_CACHE_TTL
+    )
+
+
+def test_result_cache_serves_repeated_query_from_disk(fake_client):
+    """Segunda execução do mesmo SQL vem do disco, sem dry-run nem job."""
+    first = bq.execute(SQL_OK)
+    assert first["ok"] is True and not first.get("result_cached")
+
+    second = bq.execute(SQL_OK)
+    assert second["ok"] is True and second.get("result_cached") is True
+    assert second["df"]["n"].tolist() == [42]
+    assert fake_client.calls == ["dry", "run"]
+
+
+def test_execute_arrow_mode_is_lazy(fake_client):
+    """No modo arrow, escalares vêm do Arrow e o pandas só é criado sob demanda."""
+    out = bq.execute(SQL_OK, result_format="arrow")
+    assert out["ok"] is True and out.get("df") is None
+
+    res = out["table"]
+    assert isinstance(res, bq.ArrowResult)
+    assert res.shape == (1, 1) and res.value(0, "n") == 42
+    assert res._df is None
+    assert res.to_pandas()["n"].tolist() == [42]
+
+    # Hit no cache em disco preserva o formato pedido
+    again = bq.execute(SQL_OK, result_format="arrow")
+    assert again.get("result_cached") is True
+    assert again["table"].head_records(1) == [{"n": 42}]
+
+
+def test_read_path_selection_and_fallback(monkeypatch):
+    """
+    Resultados pequenos vão por REST; grandes por Storage; falha no Storage cai
+    no REST; caminho curto e primeira página completa são relatados como REST.
+    """
+    monkeypatch.setattr(bq, "USE_BQSTORAGE", "auto")
+    small = _FakeJob(False, total_rows=1)
+    big = _FakeJob(False, total_rows=bq.BQSTORAGE_MIN_ROWS)
+
+    class _Storage:
+        pass
+
+    monkeypatch.setattr(bq, "get_bqstorage_client", lambda: _Storage())
+    _, path, _ = bq._read_result(small, small, "arrow")
+    assert path == "rest"
+    _, path, ms = bq._read_result(big, big, "arrow")
+    assert path == "storage" and ms >= 0
+
+    # Biblioteca ausente → REST
+    monkeypatch.setattr(bq, "get_bqstorage_client", lambda: None)
+    _, path, _ = bq._read_result(big, big, "pandas")
+    assert path == "rest"
+
+    # Falha na leitura via Storage → REST
+    def _boom(bqstorage_client=None, create_bqstorage_client=False):
+        if bqstorage_client is not None:
+            raise RuntimeError("storage indisponível")
+        return pa.table({"n": [42]})
+
+    monkeypatch.setattr(bq, "get_bqstorage_client", lambda: _Storage())
+    monkeypatch.setattr(big, "to_arrow", _boom)
+    table, path, _ = bq._read_result(big, big, "arrow")
+    assert path == "rest" and table.num_rows == 1
+
+    # Caminho curto (job=None, `query_and_wait`): sempre REST, sem Storage
+    fast = _FakeJob(False, total_rows=bq.BQSTORAGE_MIN_ROWS)
+    _, path, _ = bq._read_result(None, fast, "arrow")
+    assert path == "rest" and fast.read_with == [None]
+
+    # Primeira página já cobre o resultado: a biblioteca leria por REST
+    cached = _FakeJob(False, total_rows=bq.BQSTORAGE_MIN_ROWS)
+    cached._should_use_bqstorage = lambda client, create: False
+    _, path, _ = bq._read_result(cached, cached, "arrow")
+    assert path == "rest" and cached.read_with == [None]
+
+
+def test_close_all_closes_storage_transport(monkeypatch):
+    """O cliente da Storage Read API é fechado pela API pública (`transport.close`)."""
+    closed = []
+
+    class _Transport:
+        def close(self):
+            closed.append(True)
+
+    class _Storage:
+        transport = _Transport()
+
+    monkeypatch.setattr(bq, "_CLIENTS", {})
+    monkeypatch.setattr(bq, "_BQSTORAGE_CLIENT", _Storage())
+    bq.close_all()
+    assert closed == [True] and bq._BQSTORAGE_CLIENT is None
+
+    # Cliente sem `transport` (outra versão da biblioteca): encerra sem erro
+    monkeypatch.setattr(bq, "_BQSTORAGE_CLIENT", object())
+    bq.close_all()
+
+
+def test_rest_fallback_respects_call_deadline(fake_client, monkeypatch):
+    """Falha no Storage: o REST usa o prazo restante; prazo esgotado → timed_out + cancel."""
+    monkeypatch.setattr(bq, "USE_BQSTORAGE", "auto")
+    monkeypatch.setattr(bq, "BQSTORAGE_MIN_ROWS", 1)
+    monkeypatch.setattr(bq, "get_bqstorage_client", lambda: object())
+    waits = []
+    storage_delay = 0.0
+    result = _FakeJob.result
+
+    def _result(self, timeout=None):
+        if not self.dry_run:
+            waits.append(timeout)
+        return result(self, timeout)
+
+    def _to_arrow(self, bqstorage_client=None, create_bqstorage_client=False):
+        if bqstorage_client is not None:
+            time.sleep(storage_delay)
+            raise RuntimeError("storage indisponível")
+        return pa.table({"n": [42]})
+
+    monkeypatch.setattr(_FakeJob, "result", _result)
+    monkeypatch.setattr(_FakeJob, "to_arrow", _to_arrow)
+
+    out = bq.execute(SQL_OK, result_format="arrow", timeout=2)
+    assert out["ok"] is True and out["read_path"] == "rest"
+    assert len(waits) == 2 and waits[1] <= 2
+
+    waits.clear()
+    storage_delay = 0.3
+    out = bq.execute(SQL_WITH_OK, result_format="arrow", timeout=0.2)
+    assert out.get("timed_out") is True and len(waits) == 1
+    assert fake_client.jobs[-1].cancelled is True
+
+
+def test_aexecute_polls_until_done(fake_client, monkeypatch):
+    """aexecute consulta o estado do job até terminar e devolve o mesmo contrato."""
+    monkeypatch.setattr(bq, "ASYNC_POLL_INTERVAL", 0.001)
+    fake_client.polls_until_done = 3
+
+    out = asyncio.run(bq.aexecute(SQL_OK, result_format="arrow"))
+    assert out["ok"] is True
+    assert out["table"].value(0, "n") == 42
+    assert fake_client.calls == ["dry", "run"]
+
+
+def test_aexecute_cancellation_cancels_job(fake_client, monkeypatch):
+    """Cancelar a tarefa cancela o job em andamento no BigQuery."""
+    monkeypatch.setattr(bq, "ASYNC_POLL_INTERVAL", 0.001)
+    monkeypatch.setattr(bq, "ASYNC_POLL_MAX_INTERVAL", 0.001)
+    fake_client.polls_until_done = 10**9
+
+    async def _scenario():
+        task = asyncio.create_task(bq.aexecute(SQL_OK))
+        while not any(not j.dry_run for j in fake_client.jobs):
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(_scenario())
+    assert [j.cancelled for j in fake_client.jobs if not j.dry_run] == [True]
+
+
+def test_execute_timeout_cancels_job(fake_client):
+    """Prazo estourado: job cancelado, job_id e tempo decorrido no outcome."""
+    fake_client.hang = True
+
+    out = bq.execute(SQL_OK, timeout=0.5)
+    assert out["ok"] is False and out.get("timed_out") is True
+    assert out["job_id"] == "job_fake" and out["elapsed_ms"] >= 0
+    assert "Tempo limite" in out["error"]
+    assert [j.cancelled for j in fake_client.jobs if not j.dry_run] == [True]
+
+
+def test_execute_timeout_covers_dry_run(fake_client, monkeypatch):
+    """Dry-run travado consome o prazo da chamada: nenhum job é submetido."""
+    seen = []
+
+    def _hanging_query(sql, job_config=None, timeout=None, **kwargs):
+        seen.append(timeout)
+        raise TimeoutError("fake dry-run timeout")
+
+    monkeypatch.setattr(fake_client, "query", _hanging_query)
+
+    out = bq.execute(SQL_OK, timeout=0.5)
+    assert out["ok"] is False and out.get("timed_out") is True
+    assert "dry-run" in out["error"]
+    assert seen and all(t is not None and t <= 0.5 for t in seen)
+    assert bq.dry_run_cache_stats()["size"] == 0
+
+
+def test_aexecute_deadline_cancels_job(fake_client, monkeypatch):
+    """No modo async, o prazo por chamada também cancela o job."""
+    monkeypatch.setattr(bq, "ASYNC_POLL_INTERVAL", 0.001)
+    fake_client.polls_until_done = 10**9
+
+    out = asyncio.run(bq.aexecute(SQL_OK, timeout=0.05))
+    assert out.get("timed_out") is True and out["job_id"] == "job_fake"
+    assert [j.cancelled for j in fake_client.jobs if not j.dry_run] == [True]
+
+
+def test_singleflight_coalesces_threads(fake_client):
+    """N threads com o mesmo SQL em paralelo submetem um único job."""
+    fake_client.gate = threading.Event()
+    bq.reset_singleflight_stats()
+    results = []
+
+    def _call():
+        results.append(bq.execute(SQL_OK, result_format="arrow"))
+
+    threads = [threading.Thread(target=_call) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for _ in range(500):
+        if bq.singleflight_stats()["coalesced"] == 3:
+            break
+        threading.Event().wait(0.01)
+    fake_client.gate.set()
+    for t in threads:
+        t.join(5)
+
+    assert len(results) == 4 and all(r["ok"] for r in results)
+    assert fake_client.calls.count("run") == 1
+    assert sum(bool(r.get("coalesced")) for r in results) == 3
+    assert bq.singleflight_stats() == {"coalesced": 3, "in_flight": 0}
+
+
+def _wait_for(cond, attempts=500):
+    for _ in range(attempts):
+        if cond():
+            return True
+        threading.Event().wait(0.01)
+    return False
+
+
+def test_singleflight_follower_takes_over_after_leader_timeout(fake_client):
+    """Prazo curto do líder não derruba o seguidor: ele assume e executa."""
+    fake_client.gate = threading.Event()
+    bq.reset_singleflight_stats()
+    results = {}
+
+    def _call(name, timeout):
+        results[name] = bq.execute(SQL_OK, timeout=timeout)
+
+    leader = threading.Thread(target=_call, args=("leader", 0.3))
+    leader.start()
+    assert _wait_for(lambda: fake_client.calls.count("run") == 1)
+    follower = threading.Thread(target=_call, args=("follower", 10))
+    follower.start()
+    assert _wait_for(lambda: bq.singleflight_stats()["coalesced"] == 1)
+    leader.join(5)
+    # O seguidor virou líder e submeteu o próprio job
+    assert _wait_for(lambda: fake_client.calls.count("run") == 2)
+    fake_client.gate.set()
+    follower.join(5)
+
+    assert results["leader"].get("timed_out") is True
+    assert results["follower"]["ok"] is True and not results["follower"].get(
+        "coalesced"
+    )
+    assert bq.singleflight_stats() == {"coalesced": 1, "in_flight": 0}
+
+
+def test_singleflight_spans_budget_sessions_and_copies_df(fake_client):
+    """Sessões diferentes compartilham o job (paga o líder); cada uma recebe seu DataFrame."""
+    fake_client.gate = threading.Event()
+    bq.reset_singleflight_stats()
+    results = {}
+
+    def _call(session):
+        with bq.budget_session(session):
+            results[session] = bq.execute(SQL_OK)
+
+    leader = threading.Thread(target=_call, args=("aba-1",))
+    leader.start()
+    assert _wait_for(lambda: fake_client.calls.count("run") == 1)
+    followers = [threading.Thread(target=_call, args=(s,)) for s in ("aba-2", "aba-3")]
+    for t in followers:
+        t.start()
+    assert _wait_for(lambda: bq.singleflight_stats()["coalesced"] == 2)
+    fake_client.gate.set()
+    for t in [leader, *followers]:
+        t.join(5)
+
+    assert fake_client.calls.count("run") == 1
+    assert all(out["ok"] for out in results.values())
+    assert len({id(out["df"]) for out in results.values()}) == 3
+    assert results["aba-2"]["coalesced"] and results["aba-3"]["coalesced"]
+    assert bq.budget_usage("aba-1")["session_bytes"] > 0
+    assert bq.budget_usage("aba-2")["session_bytes"] == 0
+
+
+def test_singleflight_coalesces_async_tasks(fake_client, monkeypatch):
+    """Tarefas asyncio concorrentes com o mesmo SQL compartilham o job."""
+    monkeypatch.setattr(bq, "ASYNC_POLL_INTERVAL", 0.001)
+    monkeypatch.setattr(bq, "ASYNC_POLL_MAX_INTERVAL", 0.001)
+    fake_client.polls_until_done = 50
+    bq.reset_singleflight_stats()
+
+    async def _scenario():
+        return await asyncio.gather(*(bq.aexecute(SQL_OK) for _ in range(3)))
+
+    results = asyncio.run(_scenario())
+    assert all(r["ok"] for r in results)
+    assert fake_client.calls.count("run") == 1
+    assert bq.singleflight_stats()["coalesced"] == 2
+
+
+def test_execute_many_order_dedup_and_budget(fake_client):
+    """Outcomes na ordem da entrada; SQL repetido roda uma vez; orçamento do lote vale."""
+    sqls = [SQL_OK, SQL_WITH_OK, SQL_OK, SQL_BLOCKED]
+    outs = bq.execute_many(sqls, max_concurrency=2, result_format="arrow")
+
+    assert [o["ok"] for o in outs] == [True, True, True, False]
+    assert "Apenas SELECT" in outs[3]["error"]
+    assert fake_client.calls.count("run") == 2
+    assert all(o["query_ms"] >= 0 for o in outs)
+    # Duplicatas não compartilham o resultado mutável
+    assert outs[0]["table"] is not outs[2]["table"]
+    outs = bq.execute_many([SQL_OK, SQL_OK])
+    outs[0]["df"].loc[0, "n"] = -1
+    assert outs[1]["df"].loc[0, "n"] == 42
+
+    # Orçamento de 1 KiB: só a primeira consulta distinta (1024 bytes) cabe
+    bq.clear_result_cache()
+    bq.clear_dry_run_cache()
+    outs = bq.execute_many(
+        [SQL_OK, SQL_WITH_OK], max_concurrency=1, max_total_bytes=1024
+    )
+    assert outs[0]["ok"] is True
+    assert outs[1]["ok"] is False and "Orçamento de bytes do lote" in outs[1]["error"]
+
+
+def test_execute_many_shares_one_deadline_per_query(fake_client, monkeypatch):
+    """O prazo de cada consulta do lote cobre dry-run e execução juntos."""
+    seen = []
+    real_dry_run, real_execute = bq.dry_run, bq.execute
+
+    def _slow_dry_run(sql, project_id=None, timeout=None):
+        seen.append(("dry", timeout))
+        time.sleep(0.2)
+        return real_dry_run(sql, project_id=project_id, timeout=timeout)
+
+    def _execute(sql, **kwargs):
+        seen.append(("run", kwargs["timeout"]))
+        return real_execute(sql, **kwargs)
+
+    monkeypatch.setattr(bq, "dry_run", _slow_dry_run)
+    monkeypatch.setattr(bq, "execute", _execute)
+    assert bq.execute_many([SQL_OK], timeout=1.0)[0]["ok"] is True
+    (_, dry_timeout), (_, run_timeout) = seen
+    assert dry_timeout <= 1.0 and run_timeout <= 0.8
+
+
+def test_fast_path_for_small_queries(fake_client, monkeypatch):
+    """No modo auto, consultas baratas usam query_and_wait; caras, o fluxo de job."""
+    monkeypatch.setattr(bq, "QUERY_MODE", "auto")
+    monkeypatch.setattr(bq, "FAST_PATH_MAX_BYTES", 4096)
+
+    out = bq.execute(SQL_OK, result_format="arrow")
+    assert out["ok"] is True and out["query_path"] == "fast"
+    assert out["table"].value(0, "n") == 42
+    assert fake_client.calls == ["dry", "fast"]
+
+    monkeypatch.setattr(bq, "FAST_PATH_MAX_BYTES", 10)
+    out = bq.execute(SQL_WITH_OK)
+    assert out["ok"] is True and out["query_path"] == "job"
+    assert fake_client.calls[-1] == "run"
+
+
+def test_fast_path_transient_error_reuses_submitted_job(fake_client, monkeypatch):
+    """Resposta perdida no caminho curto: o job já criado é achado pelo rótulo, não resubmetido."""
+    from google.api_core.exceptions import ServiceUnavailable
+
+    monkeypatch.setattr(bq, "QUERY_MODE", "auto")
+    monkeypatch.setattr(bq, "FAST_PATH_MAX_BYTES", 4096)
+    monkeypatch.setattr(bq, "RETRY_INITIAL_BACKOFF", 0.001)
+    created, creates_job = [], [True]
+
+    def _lost_response(sql, job_config=None, **kwargs):
+        fake_client.calls.append("fast")
+        if creates_job[0]:
+            job = _FakeJob(False)
+            job.job_id = "job_servidor"
+            job.labels = dict(job_config.labels)
+            created.append(job)
+        raise ServiceUnavailable("resposta perdida")
+
+    monkeypatch.setattr(fake_client, "query_and_wait", _lost_response)
+    monkeypatch.setattr(
+        fake_client, "list_jobs", lambda **kwargs: iter(created), raising=False
+    )
+
+    out = bq.execute(SQL_OK)
+    assert out["ok"] is True and out["query_path"] == "job"
+    assert out["job_id"] == "job_servidor"
+    assert fake_client.calls == ["dry", "fast"]  # nenhum segundo job
+
+    # Requisição que não chegou a criar job: o fluxo de job submete uma vez
+    created.clear()
+    creates_job[0] = False
+    out = bq.execute(SQL_WITH_OK)
+    assert out["ok"] is True and fake_client.calls[-1] == "run"
+
+
+def test_fast_path_timeout_reports_job_id(fake_client, monkeypatch):
+    """Prazo estourado no caminho curto ainda informa o job criado pela lib."""
+    monkeypatch.setattr(bq, "QUERY_MODE", "auto")
+    monkeypatch.setattr(bq, "FAST_PATH_MAX_BYTES", 4096)
+    created = []
+
+    def _slow(sql, job_config=None, **kwargs):
+        job = _FakeJob(False)
+        job.job_id = "job_lento"
+        job.labels = dict(job_config.labels)
+        created.append(job)
+        raise TimeoutError("fake timeout")
+
+    monkeypatch.setattr(fake_client, "query_and_wait", _slow)
+    monkeypatch.setattr(
+        fake_client, "list_jobs", lambda **kwargs: iter(created), raising=False
+    )
+    out = bq.execute(SQL_OK, timeout=0.5)
+    assert out["timed_out"] is True and out["query_path"] == "fast"
+    assert out["job_id"] == "job_lento"
+
+
+def test_job_stats_in_outcome(fake_client, monkeypatch):
+    """O outcome traz estatísticas do job serializáveis (fila e execução em ms)."""
+    t0 = dt.datetime(2024, 11, 28, 12, 0, 0, tzinfo=dt.timezone.utc)
+    stats = {
+        "cache_hit": False,
+        "total_bytes_billed": 10 * 1024 * 1024,
+        "slot_millis": 1234,
+        "created": t0,
+        "started": t0 + dt.timedelta(milliseconds=300),
+        "ended": t0 + dt.timedelta(milliseconds=1300),
+    }
+    real_query = fake_client.query
+
+    def _query(sql, job_config=None, **kwargs):
+        job = real_query(sql, job_config=job_config, **kwargs)
+        for k, v in stats.items():
+            setattr(job, k, v)
+        return job
+
+    monkeypatch.setattr(fake_client, "query", _query)
+    out = bq.execute(SQL_OK)
+    js = out["job_stats"]
+    assert js["job_id"] == "job_fake" and js["cache_hit"] is False
+    assert js["total_bytes_billed"] == 10 * 1024 * 1024 and js["slot_millis"] == 1234
+    assert js["queue_ms"] == 300 and js["run_ms"] == 1000
+    assert js["created"].startswith("2024-11-28T12:00:00")
+
+
+def test_retries_transient_errors_with_idempotent_job_id(fake_client, monkeypatch):
+    """503 após a criação do job: o reenvio (mesmo id) recupera o job; sem duplicar."""
+    from google.api_core.exceptions import Conflict, ServiceUnavailable
+
+    monkeypatch.setattr(bq, "RETRY_INITIAL_BACKOFF", 0.001)
+    created = {}
+    real_query = fake_client.query
+    failures = {"dry": 1, "run": 1}
+
+    def _query(sql, job_config=None, job_id=None, **kwargs):
+        kind = "dry" if getattr(job_config, "dry_run", False) else "run"
+        if kind == "run" and job_id in created:
+            raise Conflict("Already Exists: Job")
+        job = real_query(sql, job_config=job_config, **kwargs)
+        if kind == "run":
+            job.job_id = job_id
+            created[job_id] = job
+        if failures[kind]:
+            failures[kind] -= 1
+            # A resposta "se perde" depois de o BigQuery já ter criado o job
+            raise ServiceUnavailable("backend indisponível")
+        return job
+
+    monkeypatch.setattr(fake_client, "query", _query)
+    monkeypatch.setattr(
+        fake_client,
+        "get_job",
+        lambda job_id, location=None: created[job_id],
+        raising=False,
+    )
+
+    out = bq.execute(SQL_OK)
+    assert out["ok"] is True and out["df"].iloc[0]["n"] == 42
+    assert out["retries"] == 2 and out["backoff_ms"] >= 0
+    assert len(created) == 1 and out["job_id"] == next(iter(created))
+    assert out["job_id"].startswith(bq.JOB_ID_PREFIX)
+
+
+def test_non_retryable_errors_fail_fast(fake_client, monkeypatch):
+    """Erros de SQL (BadRequest) não são repetidos."""
+    from google.api_core.exceptions import BadRequest
+
+    def _query(sql, job_config=None, **kwargs):
+        fake_client.calls.append("dry")
+        raise BadRequest("Syntax error")
+
+    monkeypatch.setattr(fake_client, "query", _query)
+    out = bq.dry_run(SQL_OK)
+    assert out["ok"] is False and out["retries"] == 0
+    assert fake_client.calls == ["dry"]
+
+
+def test_admission_control_rejects_overflow_quickly(fake_client, monkeypatch):
+    """Sem vaga (ou sem fichas) dentro da espera máxima, a consulta é recusada sem job."""
+    monkeypatch.setattr(bq, "ADMISSION_MAX_WAIT", 0.05)
+    monkeypatch.setattr(bq, "_ADMISSION", bq._Admission(1, 0, 0))
+    assert bq._ADMISSION.try_slot()  # ocupa a única vaga
+
+    out = bq.execute(SQL_OK)
+    assert out["ok"] is False and out["throttled"] is True
+    assert "simultâneas" in out["error"] and out["queue_wait_ms"] >= 40
+    assert fake_client.calls == ["dry"]
+
+    bq._ADMISSION.release()
+    out = bq.execute(SQL_OK)
+    assert out["ok"] is True and out["queue_wait_ms"] >= 0
+    assert bq.admission_stats() == {"in_flight": 0, "admitted": 2, "rejected": 1}
+
+    # Balde de 1 job/s: a segunda consulta precisaria esperar ~1 s (> 50 ms)
+    monkeypatch.setattr(bq, "_ADMISSION", bq._Admission(0, 1, 0))
+    assert bq.execute("SELECT 1 AS n")["ok"] is True
+    out = asyncio.run(bq.aexecute("SELECT 2 AS n"))
+    assert out["throttled"] is True and "taxa" in out["error"]
+
+
+def test_budget_ledger_per_session(fake_client, monkeypatch):
+    """Esgotado o orçamento da sessão, novas consultas são recusadas; outras sessões seguem."""
+    monkeypatch.setattr(bq, "SESSION_BUDGET_BYTES", 1500)
+    configs = []
+    real_query = fake_client.query
+
+    def _query(sql, job_config=None, **kwargs):
+        configs.append(job_config)
+        return real_query(sql, job_config=job_config, **kwargs)
+
+    monkeypatch.setattr(fake_client, "query", _query)
+
+    with bq.budget_session("Ana #1"):
+        assert bq.execute(SQL_OK)["ok"] is True  # 1024 bytes estimados
+        run_cfg = configs[-1]
+        assert run_cfg.maximum_bytes_billed == 1500
+        assert run_cfg.labels["session"] == "ana__1"
+
+        out = bq.execute(SQL_WITH_OK)
+        assert out["ok"] is False and out["budget_exceeded"] is True
+        assert "sessão" in out["error"]
+        usage = bq.budget_usage()
+        assert usage["session_bytes"] == 1024 and usage["queries"] == 1
+
+    with bq.budget_session("outra"):
+        assert bq.execute(SQL_WITH_OK)["ok"] is True
+    assert bq.budget_usage("outra")["process_bytes"] == 2048
+
+
+def test_budget_reservation_released_when_execution_raises(fake_client, monkeypatch):
+    """Exceção depois da reserva não deixa os bytes presos no orçamento da sessão."""
+
+    def _boom(*args, **kwargs):
+        raise RuntimeError("falha inesperada")
+
+    async def _aboom(*args, **kwargs):
+        raise RuntimeError("falha inesperada")
+
+    monkeypatch.setattr(bq, "_run_admitted", _boom)
+    monkeypatch.setattr(bq, "_arun_admitted", _aboom)
+    with bq.budget_session("aba-erro"):
+        with pytest.raises(RuntimeError):
+            bq.execute(SQL_OK)
+        with pytest.raises(RuntimeError):
+            asyncio.run(bq.aexecute(SQL_WITH_OK))
+    usage = bq.budget_usage("aba-erro")
+    assert usage["session_bytes"] == 0 and usage["process_bytes"] == 0
+    assert bq.admission_stats()["in_flight"] == 0
+
+
+def test_cancelled_aexecute_releases_budget_and_tokens(fake_client, monkeypatch):
+    """Tarefa cancelada na fila de admissão devolve as fichas e a reserva."""
+    monkeypatch.setattr(bq, "ADMISSION_MAX_WAIT", 5.0)
+    monkeypatch.setattr(bq, "_ADMISSION", bq._Admission(1, 0, 10**6))
+    assert bq._ADMISSION.try_slot()  # ocupa a única vaga
+
+    async def _scenario():
+        with bq.budget_session("aba-cancelada"):
+            task = asyncio.ensure_future(bq.aexecute(SQL_OK))
+            for _ in range(500):
+                if bq.budget_usage("aba-cancelada")["session_bytes"]:
+                    break
+                await asyncio.sleep(0.01)
+            assert bq._ADMISSION._bytes.tokens < 10**6  # 1024 fichas reservadas
+            task.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await task
+
+    asyncio.run(_scenario())
+    bq._ADMISSION._bytes.refill(time.monotonic())
+    assert bq._ADMISSION._bytes.tokens == 10**6
+    assert bq.budget_usage("aba-cancelada")["session_bytes"] == 0
+    assert fake_client.calls == ["dry"]
+    bq._ADMISSION.release()
+
+
+def test_budget_ledger_drops_idle_sessions(monkeypatch):
+    """Sessões sem lançamentos na janela saem do razão (uma por aba do app)."""
+    monkeypatch.setattr(bq, "SESSION_BUDGET_BYTES", 0)
+    ledger = bq._BudgetLedger(0.05)
+    for i in range(100):
+        ledger.reserve(f"aba-{i}", 10)
+    assert len(ledger._entries) == 101  # sessões + processo
+
+    time.sleep(0.06)
+    ledger.reserve("nova", 10)
+    assert set(ledger._entries) == {"nova", bq._PROCESS_KEY}
+    time.sleep(0.06)
+    assert ledger.usage("nova")["session_bytes"] == 0
+    assert "nova" not in ledger._entries
@@ -0,0 +1,220 @@
+"""
+Testes do dicionário de categorias (src/agent/categories.py), com backend fake.
+
+Critérios cobertos
+------------------
+- `match` segue a regra do LIKE: todos os termos contidos, sem diferenciar caixa.
+- A geração nunca espera: sem dicionário usa LIKE e agenda a carga em segundo
+  plano (uma consulta limitada por partição, na sessão "categories"); processo
+  novo responde do disco.
+- Espelho local é usado antes do backend.
+- Dicionário vencido é servido e recarregado em segundo plano.
+- Sem dicionário (falha na carga), o gerador mantém o LIKE e não retenta a cada
+  pergunta; janela anterior à cobertura do dicionário, ou que passa do último
+  dia completo que ele viu (hoje, ou partição lida antes do fim do dia: um
+  valor novo ainda não estaria lá), também fica com LIKE.
+- Valores com aspas e barra invertida viram literais escapados.
+"""
+
+import datetime as dt
+import json
+import time
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from src.agent import categories, cube, nodes
+from src.utils import backends, bq
+
+SCHEMA = {
+    "data_particao": "DATE",
+    "tipo": "STRING",
+    "subtipo": "STRING",
+    "descricao": "STRING",
+}
+
+
+class _FakeBackend(backends.Backend):
+    name = "fake"
+
+    def __init__(self, rows):
+        self.rows, self.queries, self.sessions = rows, [], []
+
+    def dry_run(self, sql):
+        return {"ok": True, "dry_run_bytes": 0}
+
+    def table_schema(self, dataset, table):
+        return dict(SCHEMA)
+
+    def execute(self, sql, prevalidated=None, result_format="pandas", timeout=None):
+        self.queries.append(sql)
+        self.sessions.append(bq._BUDGET_SESSION.get())
+        if self.rows is None:
+            return {"ok": False, "error": "sem acesso"}
+        return {"ok": True, "df": pd.DataFrame(self.rows, columns=["tipo", "subtipo"])}
+
+
+@pytest.fixture
+def fake(tmp_path, monkeypatch):
+    backend = _FakeBackend(
+        [
+            ("Iluminação Pública", "Reparo de lâmpada apagada"),
+            ("Iluminação Pública", "Poste caído"),
+            ("Buraco", "Reparo de buraco"),
+            ("Buraco", None),
+        ]
+    )
+    backends.set_backend(backend)
+    monkeypatch.setattr(categories, "CATEGORY_DIR", str(tmp_path / "categories"))
+    monkeypatch.setattr(cube, "CUBE_DIR", str(tmp_path / "sem-cubo"))
+    monkeypatch.setattr(backends, "LOCAL_SNAPSHOT_DIR", str(tmp_path / "sem-espelho"))
+    monkeypatch.setattr(categories, "CATEGORY_IN_ENABLED", True)
+    profile = nodes.SchemaProfile.from_schema(SCHEMA)
+    monkeypatch.setattr(nodes, "_profile", lambda: profile)
+    categories.clear_dictionary()
+    yield backend
+    categories.clear_dictionary()
+    backends.set_backend(None)
+
+
+def test_match_follows_like_semantics():
+    values = ["Reparo de Buraco", "Buraco", "Reparo de lâmpada"]
+    assert categories.match(values, ["reparo", "buraco"]) == ["Reparo de Buraco"]
+    assert categories.match(values, ["BURACO"]) == ["Reparo de Buraco", "Buraco"]
+
+
+def _wait_loaded(deadline=5.0):
+    end = time.monotonic() + deadline
+    while categories._REFRESHING and time.monotonic() < end:
+        time.sleep(0.01)
+
+
+Q_ILUMINACAO = "Qual o subtipo de chamado mais comum relacionado a Iluminação Pública?"
+
+
+def _closed_filter(terms=nodes._TERMS_ILUMINACAO, days=30):
+    """Filtro do gerador para uma janela encerrada ontem (fim exclusivo = hoje, UTC)."""
+    today = dt.datetime.now(dt.timezone.utc).date()
+    return nodes._text_filter(
+        nodes._profile(), terms, today - dt.timedelta(days=days), today
+    )
+
+
+def test_generator_never_waits_and_loads_in_background(fake):
+    sql = nodes.generate_sql(Q_ILUMINACAO)["sql"]
+    assert " IN (" not in sql and "LOWER(tipo) LIKE '%iluminação%'" in sql
+    _wait_loaded()
+    assert len(fake.queries) == 1
+    assert "WHERE data_particao >= DATE '" in fake.queries[0]
+    assert fake.sessions == [categories.CATEGORY_BUDGET_SESSION]
+
+    sql = _closed_filter()
+    assert "subtipo IN" not in sql  # nenhum subtipo contém "iluminação pública"
+    assert "tipo IN ('Iluminação Pública')" in sql
+    assert "LOWER(descricao) LIKE '%iluminação%'" in sql
+    assert "LOWER(tipo)" not in sql
+
+    # Processo novo: dicionário vem do disco, sem consulta
+    categories.clear_dictionary()
+    assert " IN (" in _closed_filter()
+    assert len(fake.queries) == 1
+
+
+def test_window_before_dictionary_coverage_keeps_like(fake):
+    assert categories.load_dictionary() is not None
+    # G3 filtra 2023 inteiro; a carga só cobre os últimos LOOKBACK dias
+    sql = nodes.generate_sql("Quais os 3 bairros com reparo de buraco em 2023?")["sql"]
+    assert " IN (" not in sql and "LOWER(subtipo) LIKE '%buraco%'" in sql
+
+
+def test_window_past_dictionary_coverage_keeps_like(fake):
+    entry = categories.load_dictionary()
+    today = dt.datetime.now(dt.timezone.utc).date()
+    # Hoje ainda recebe chamados: a carga só vale como completa até ontem
+    assert entry["through"] == (today - dt.timedelta(days=1)).isoformat()
+    assert "tipo IN ('Iluminação Pública')" in _closed_filter()
+
+    # Tipo que surge depois da carga: a janela que termina hoje fica com LIKE
+    fake.rows = fake.rows + [("Iluminação Pública Especial", None)]
+    sql = nodes.generate_sql(Q_ILUMINACAO)["sql"]
+    assert " IN (" not in sql and "LOWER(tipo) LIKE '%iluminação%'" in sql
+    p = nodes._profile()
+    assert " IN (" not in nodes._text_filter(
+        p, ("iluminação",), today - dt.timedelta(days=7), today + dt.timedelta(days=1)
+    )
+
+
+def test_mirror_is_used_before_backend(fake, tmp_path, monkeypatch):
+    root = tmp_path / "espelho"
+    table = root / nodes.TAB_CHAMADO
+    part = table / "data_particao=2020-01-01"
+    part.mkdir(parents=True)
+    pq.write_table(
+        pa.table({"tipo": ["Buraco", "Buraco"], "subtipo": ["Reparo de buraco", None]}),
+        part / "part-0.parquet",
+    )
+    (table / categories.MANIFEST).write_text(
+        json.dumps(
+            {
+                "columns": ["tipo", "subtipo"],
+                "since": "2020-01-01",
+                "partitions": {
+                    "2020-01-01": {"synced_at": "2024-06-02T03:00:00+00:00"},
+                    "2024-06-01": {"synced_at": "2024-06-02T03:00:00+00:00"},
+                    # lida antes do fim do dia: ainda pode ganhar valores novos
+                    "2024-06-02": {"synced_at": "2024-06-02T03:00:00+00:00"},
+                },
+            }
+        ),
+        encoding="utf-8",
+    )
+    monkeypatch.setattr(backends, "LOCAL_SNAPSHOT_DIR", str(root))
+
+    entry = categories.load_dictionary()
+    assert entry["source"] == "mirror" and entry["since"] == "2020-01-01"
+    assert entry["through"] == "2024-06-01"
+    assert entry["values"] == {"tipo": ["Buraco"], "subtipo": ["Reparo de buraco"]}
+    assert fake.queries == []
+    sql = nodes.generate_sql("Quais os 3 bairros com reparo de buraco em 2023?")["sql"]
+    assert "subtipo IN ('Reparo de buraco')" in sql
+
+
+def test_stale_dictionary_is_served_and_refreshed(fake, monkeypatch):
+    assert categories.load_dictionary(["tipo", "subtipo"]) is not None
+    fake.rows = fake.rows + [("Calçada", "Reparo de calçada")]
+    monkeypatch.setattr(categories, "CATEGORY_TTL", 0)
+    assert "Calçada" not in categories.get_dictionary(["tipo"])["values"]["tipo"]
+
+    deadline = time.monotonic() + 5
+    while len(fake.queries) < 2 and time.monotonic() < deadline:
+        time.sleep(0.01)
+    _wait_loaded()
+    assert "Calçada" in categories.get_dictionary(["tipo"])["values"]["tipo"]
+
+
+def test_generator_falls_back_to_like_without_dictionary(fake):
+    fake.rows = None
+    q = (
+        "Qual o nome da unidade organizacional que mais atendeu chamados de "
+        "Fiscalização de estacionamento irregular?"
+    )
+    sql = nodes.generate_sql(q)["sql"]
+    assert " IN (" not in sql and "LOWER(tipo) LIKE '%fiscalização%'" in sql
+    _wait_loaded()
+    # Falha recente não é retentada a cada pergunta
+    assert " IN (" not in nodes.generate_sql(q)["sql"]
+    _wait_loaded()
+    assert len(fake.queries) == 1
+
+
+def test_in_values_are_escaped(fake):
+    fake.rows = [("Iluminação Pública", "Lâmpada d'água \\ iluminação pública")]
+    assert categories.load_dictionary() is not None
+    sql = _closed_filter()
+    assert "subtipo IN ('Lâmpada d\\'água \\\\ iluminação pública')" in sql
+    assert (
+        backends.translate_sql(sql).count("'Lâmpada d''água \\ iluminação pública'")
+        == 1
+    )
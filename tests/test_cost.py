@@ -0,0 +1,100 @@
+"""
+Testes do modelo local de custo (src/utils/cost.py), sem acesso ao BigQuery.
+
+Critérios cobertos
+------------------
+- Estimativa = bytes das colunas referenciadas × fração das partições filtradas.
+- JOIN com aliases: colunas atribuídas à tabela certa; dimensão sem partição.
+- Sem metadados em cache, `fetch=False` não estima (e não faz I/O).
+- Recusa local de candidatos muito acima do teto, antes do dry-run.
+- Metadados persistidos em disco e estatísticas de drift × dry-run.
+"""
+
+import time
+
+import pytest
+
+import src.utils.bq as bq
+import src.utils.cost as cost
+
+CHAMADO = "datario.adm_central_atendimento_1746.chamado"
+BAIRRO = "datario.dados_mestres.bairro"
+
+
+def _no_network(*args, **kwargs):
+    raise AssertionError("o modelo local não deve acessar a rede")
+
+
+@pytest.fixture
+def model(monkeypatch, tmp_path):
+    monkeypatch.setattr(cost, "COST_MODEL_DIR", str(tmp_path / "bq_cost"))
+    monkeypatch.setattr(bq, "execute", _no_network)
+    monkeypatch.setattr(bq, "dry_run", _no_network)
+    monkeypatch.setattr(bq, "_LEDGER", bq._BudgetLedger(3600))
+    cost.clear_cost_model()
+    now = time.time()
+    cost._STATS[CHAMADO] = cost._TableStats(
+        CHAMADO,
+        now,
+        ["id_chamado", "data_particao", "id_bairro", "tipo", "subtipo"],
+        {"2023-06-01": 100, "2024-11-27": 100, "2024-11-28": 200},
+        400,
+        {"data_particao": 800, "id_bairro": 1600, "tipo": 4000, "subtipo": 8000},
+    )
+    cost._STATS[BAIRRO] = cost._TableStats(
+        BAIRRO, now, ["id_bairro", "nome"], None, None, {"id_bairro": 10, "nome": 30}
+    )
+    yield cost
+    cost.clear_cost_model()
+
+
+def test_estimate_uses_partition_fraction(model):
+    sql = (
+        f"SELECT COUNT(1) AS n FROM `{CHAMADO}` WHERE data_particao = DATE '2024-11-28'"
+    )
+    # data_particao: 800 bytes × 200/400 da tabela na partição
+    assert model.estimate_bytes(sql, fetch=False) == 400
+
+
+def test_estimate_join_with_aliases(model):
+    sql = (
+        f"SELECT b.nome AS bairro, COUNT(1) AS total FROM `{CHAMADO}` c "
+        f"JOIN `{BAIRRO}` b ON c.id_bairro = CAST(b.id_bairro AS STRING) "
+        f"WHERE (data_particao >= DATE '2023-01-01' AND data_particao < DATE '2024-01-01') "
+        f"AND ((LOWER(subtipo) LIKE '%reparo%') OR (LOWER(tipo) LIKE '%tipo%')) "
+        f"GROUP BY bairro ORDER BY total DESC LIMIT 3"
+    )
+    # chamado: (800 + 1600 + 4000 + 8000) × 100/400 ; bairro: 10 + 30 (inteira)
+    assert model.estimate_bytes(sql, fetch=False) == 3600 + 40
+
+
+def test_missing_metadata_returns_none_without_io(model):
+    sql = f"SELECT id_chamado FROM `{CHAMADO}` WHERE data_particao = DATE '2024-11-28'"
+    assert model.estimate_bytes(sql, fetch=False) is None  # coluna sem tamanho
+    assert model.estimate_bytes("SELECT 1 AS n FROM `p.d.outra`", fetch=False) is None
+
+
+def test_precheck_rejects_obviously_over_budget(model, monkeypatch):
+    sql = f"SELECT subtipo FROM `{CHAMADO}` WHERE data_particao >= DATE '2023-01-01'"
+    monkeypatch.setattr(bq, "MAX_BYTES_BILLED", 10_000)
+    est, err = model.precheck(sql)
+    assert est == 8800 and err is None  # subtipo + data_particao
+
+    monkeypatch.setattr(bq, "MAX_BYTES_BILLED", 1_000)
+    est, err = model.precheck(sql)
+    assert est == 8800 and "sem dry-run" in err
+
+
+def test_stats_persist_and_drift(model):
+    model._save_stats(model._STATS[BAIRRO])
+    model.clear_cost_model()
+    loaded = model._load_stats(BAIRRO)
+    assert loaded is not None and loaded.columns == {"id_bairro": 10, "nome": 30}
+
+    assert model.record_drift(110, 100) == pytest.approx(10.0)
+    assert model.record_drift(90, 100) == pytest.approx(-10.0)
+    assert model.record_drift(None, 100) is None
+    stats = model.drift_stats()
+    assert stats["samples"] == 2
+    assert stats["mean_abs_pct"] == pytest.approx(10.0)
+    assert stats["mean_pct"] == pytest.approx(0.0)
@@ -0,0 +1,225 @@
+"""
+Testes do cubo de rollup diário (src/agent/cube.py + scripts/build_cube.py), sem BigQuery.
+
+Critérios cobertos
+------------------
+- Cubo construído a partir do espelho local: uma linha por dia × dimensões.
+- Reconstrução incremental: só partições alteradas são reagregadas.
+- Templates do gerador respondidos pelo cubo; janela além da atualização → BigQuery.
+- Dia da janela sem agregar (falha/orçamento), reagregação de versão nova que
+  falhou, partição de hoje lida antes do fim do dia ou manifesto sem as
+  partições da origem → BigQuery, nunca uma contagem parcial ou antiga.
+- No grafo: acerto no cubo pula dry-run/execução e expõe a data de atualização em `meta`.
+"""
+
+import datetime as dt
+import json
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from scripts import build_cube
+from src.agent import cube, graph, nodes
+
+CHAMADO = "datario.adm_central_atendimento_1746.chamado"
+BAIRRO = "datario.dados_mestres.bairro"
+COLUMNS = ["id_bairro", "tipo", "subtipo", "nome_unidade_organizacional"]
+
+ROWS = {
+    "2023-05-02": [("1", "Buraco", "Reparo de buraco", "SECONSERVA")] * 3,
+    "2023-08-01": [
+        ("2", "Buraco", "Reparo de buraco", "SECONSERVA"),
+        ("2", "Reparo de buraco", None, "SECONSERVA"),
+    ],
+    "2024-11-28": [
+        ("1", "Buraco", "Reparo de buraco", "SECONSERVA"),
+        ("2", "Estacionamento", "Fiscalização de estacionamento irregular", "CET-RIO"),
+    ],
+}
+
+
+def _write_partition(root, day, rows):
+    part = root / CHAMADO / f"data_particao={day}"
+    part.mkdir(parents=True, exist_ok=True)
+    cols = list(zip(*rows))
+    pq.write_table(
+        pa.table({c: pa.array(v, pa.string()) for c, v in zip(COLUMNS, cols)}),
+        part / "part-0.parquet",
+    )
+
+
+def _write_manifest(root, versions):
+    manifest = {
+        "columns": COLUMNS,
+        "partitions": {
+            day: {"last_modified": versions.get(day, "v1"), "rows": len(rows)}
+            for day, rows in ROWS.items()
+        },
+    }
+    (root / CHAMADO / "_manifest.json").write_text(json.dumps(manifest))
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch):
+    root = tmp_path / "mirror"
+    for day, rows in ROWS.items():
+        _write_partition(root, day, rows)
+    _write_manifest(root, {})
+    pq.write_table(
+        pa.table({"id_bairro": [1, 2], "nome": ["Centro", "Tijuca"]}),
+        root / f"{BAIRRO}.parquet",
+    )
+    profile = nodes.SchemaProfile.from_schema(
+        {"data_particao": "DATE", **{c: "STRING" for c in COLUMNS}}
+    )
+    monkeypatch.setattr(nodes, "_profile", lambda: profile)
+    monkeypatch.setattr(cube, "CUBE_DIR", str(tmp_path / "cube"))
+    monkeypatch.setattr(cube, "CUBE_ENABLED", True)
+    cube.clear_cube()
+    yield root
+    cube.clear_cube()
+
+
+def _quiet(*_args, **_kwargs):
+    pass
+
+
+def _build(mirror):
+    return build_cube.build(source="mirror", mirror=str(mirror), log=_quiet)
+
+
+def test_incremental_build_from_mirror(mirror):
+    first = _build(mirror)
+    assert first["downloaded"] == sorted(ROWS) and not first["failed"]
+    # 3 chamados idênticos em 2023-05-02 viram uma linha com n=3
+    part = pq.read_table(
+        f"{cube.CUBE_DIR}/{CHAMADO}/data_particao=2023-05-02/part-0.parquet"
+    )
+    assert part.num_rows == 1 and part.column("n").to_pylist() == [3]
+
+    assert _build(mirror)["downloaded"] == []
+
+    ROWS_CHANGED = ROWS["2024-11-28"] + [
+        ("1", "Buraco", "Reparo de buraco", "SECONSERVA")
+    ]
+    _write_partition(mirror, "2024-11-28", ROWS_CHANGED)
+    _write_manifest(mirror, {"2024-11-28": "v2"})
+    assert _build(mirror)["downloaded"] == ["2024-11-28"]
+    assert cube.cube_info()["fresh_through"] == "2024-11-28"
+
+
+def test_cube_answers_templates_and_falls_back_when_stale(mirror):
+    _build(mirror)
+
+    day = nodes.generate_sql("Quantos chamados foram abertos no dia 28/11/2024?")
+    out = cube.answer_from_cube(day["template"])
+    assert out["ok"] and out["table"].to_pylist() == [{"n": 2}]
+    assert out["fresh_through"] == "2024-11-28"
+
+    top = nodes.generate_sql(
+        "Quais os 3 bairros que mais tiveram chamados abertos sobre reparo de buraco em 2023?"
+    )
+    out = cube.answer_from_cube(top["template"])
+    assert out["table"].to_pylist() == [
+        {"bairro": "Centro", "total": 3},
+        {"bairro": "Tijuca", "total": 2},
+    ]
+
+    # Janela móvel (últimos 365 dias) vai além de 2024-11-28: BigQuery
+    recent = nodes.generate_sql(
+        "Qual o subtipo de chamado mais comum relacionado a Iluminação Pública?"
+    )
+    out = cube.answer_from_cube(recent["template"])
+    assert not out["ok"] and "desatualizado" in out["reason"]
+
+
+def _edit_cube_manifest(edit):
+    path = f"{cube.CUBE_DIR}/{CHAMADO}/_manifest.json"
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    edit(manifest)
+    with open(path, "w", encoding="utf-8") as f:
+        json.dump(manifest, f)
+    cube.clear_cube()
+
+
+def test_cube_with_gaps_or_unknown_coverage_falls_back(mirror):
+    _build(mirror)
+    q_day = nodes.generate_sql("Quantos chamados foram abertos no dia 28/11/2024?")
+    q_2023 = nodes.generate_sql(
+        "Quais os 3 bairros que mais tiveram chamados abertos sobre reparo de buraco em 2023?"
+    )
+
+    # 2023-08-01 não foi agregado (ex.: recusado pelo orçamento)
+    _edit_cube_manifest(lambda m: m["partitions"].pop("2023-08-01"))
+    out = cube.answer_from_cube(q_2023["template"])
+    assert not out["ok"] and "incompleto" in out["reason"]
+    assert cube.answer_from_cube(q_day["template"])["ok"]
+
+    # Manifesto sem a lista da origem: cobertura desconhecida
+    _edit_cube_manifest(lambda m: m.pop("source_partitions"))
+    out = cube.answer_from_cube(q_day["template"])
+    assert not out["ok"] and "manifesto" in out["reason"]
+
+
+def test_failed_reaggregation_is_not_served_stale(mirror):
+    _build(mirror)
+    q_day = nodes.generate_sql("Quantos chamados foram abertos no dia 28/11/2024?")
+
+    # Origem mudou e a reagregação falha: a contagem antiga não vale mais
+    _write_manifest(mirror, {"2024-11-28": "v2"})
+    (mirror / CHAMADO / "data_particao=2024-11-28" / "part-0.parquet").unlink()
+    cube.clear_cube()
+    assert list(_build(mirror)["failed"]) == ["2024-11-28"]
+    out = cube.answer_from_cube(q_day["template"])
+    assert not out["ok"] and "incompleto" in out["reason"]
+
+
+def test_partition_read_mid_day_is_not_served(mirror):
+    today = dt.datetime.now(dt.timezone.utc).date()
+    _write_partition(mirror, today.isoformat(), ROWS["2024-11-28"])
+    path = mirror / CHAMADO / "_manifest.json"
+    manifest = json.loads(path.read_text())
+    manifest["partitions"][today.isoformat()] = {
+        "last_modified": "v1",
+        "rows": 2,
+        "synced_at": dt.datetime.now(dt.timezone.utc).isoformat(),
+    }
+    path.write_text(json.dumps(manifest))
+    _build(mirror)
+
+    info = cube.cube_info()
+    assert info["fresh_through"] == today.isoformat()
+    assert info["missing"] == [today.isoformat()]
+    assert info["complete_through"] == "2024-11-28"
+    q_today = nodes.generate_sql(
+        f"Quantos chamados foram abertos no dia {today:%d/%m/%Y}?"
+    )
+    out = cube.answer_from_cube(q_today["template"])
+    assert not out["ok"] and "incompleto" in out["reason"]
+    # Dias encerrados continuam respondidos pelo cubo
+    q_day = nodes.generate_sql("Quantos chamados foram abertos no dia 28/11/2024?")
+    assert cube.answer_from_cube(q_day["template"])["ok"]
+
+    # Partição lida antes do fim do dia é baixada de novo na próxima execução
+    assert _build(mirror)["downloaded"] == [today.isoformat()]
+
+
+def test_graph_serves_cube_hits_without_bigquery(mirror, monkeypatch):
+    _build(mirror)
+
+    def _no_bigquery(*args, **kwargs):
+        raise AssertionError("acerto no cubo não deve validar/executar SQL")
+
+    monkeypatch.setattr(graph, "validate_sql", _no_bigquery)
+    monkeypatch.setattr(graph, "execute_sql", _no_bigquery)
+    graph.reset_graph()
+    try:
+        state = graph.run_debug("Quantos chamados foram abertos no dia 28/11/2024?")
+    finally:
+        graph.reset_graph()
+    assert state["answer"] == "Contagem: 2."
+    assert state["meta"]["query_path"] == "cube"
+    assert state["meta"]["cube_fresh_through"] == "2024-11-28"
+    assert dt.date.fromisoformat(state["meta"]["cube_built_at"][:10])
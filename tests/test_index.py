@@ -0,0 +1,92 @@
+"""
+Testes do índice colunar em memória (src/agent/index.py), sem BigQuery.
+
+Critérios cobertos
+------------------
+- Os 4 templates do gerador respondidos pelo índice, a partir do espelho local.
+- Semântica SQL: LIKE em qualquer coluna textual, INNER JOIN com bairros,
+  nulos como grupo próprio.
+- Cobertura: colunas ausentes ou corte `since` → o índice não responde.
+- Limite de memória recusa a carga.
+"""
+
+import datetime as dt
+
+import pytest
+
+from src.agent import nodes
+from src.agent.index import ChamadoIndex
+
+CHAMADO = "datario.adm_central_atendimento_1746.chamado"
+BAIRRO = "datario.dados_mestres.bairro"
+
+SCHEMA = {
+    "data_particao": "DATE",
+    "id_bairro": "STRING",
+    "tipo": "STRING",
+    "subtipo": "STRING",
+    "nome_unidade_organizacional": "STRING",
+}
+
+
+# Além das linhas base: subtipo nulo que casa por `tipo` e bairro inexistente
+EXTRA_ROWS = [
+    (dt.date(2023, 8, 1), "2", "Reparo de buraco", None, "SECONSERVA"),
+    (dt.date(2023, 8, 2), "9", "Buraco", "Reparo de buraco", "SECONSERVA"),
+]
+
+
+@pytest.fixture
+def mirror(tmp_path, monkeypatch, write_mirror):
+    write_mirror(tmp_path, EXTRA_ROWS)
+    profile = nodes.SchemaProfile.from_schema(SCHEMA)
+    monkeypatch.setattr(nodes, "_profile", lambda: profile)
+    return tmp_path
+
+
+@pytest.mark.parametrize(
+    "question, expected",
+    [
+        ("Quantos chamados foram abertos no dia 28/11/2024?", [{"n": 2}]),
+        (
+            "Qual o subtipo de chamado mais comum relacionado a Iluminação Pública?",
+            [{"subtipo": "Reparo de lâmpada apagada", "total": 2}],
+        ),
+        (
+            # id 9 não existe em bairro (INNER JOIN); a linha de subtipo nulo casa por `tipo`
+            "Quais os 3 bairros que mais tiveram chamados abertos sobre reparo de buraco em 2023?",
+            [{"bairro": "Centro", "total": 2}, {"bairro": "Tijuca", "total": 1}],
+        ),
+        (
+            "Qual o nome da unidade organizacional que mais atendeu chamados de "
+            "Fiscalização de estacionamento irregular?",
+            [{"unidade": "CET-RIO", "total": 1}],
+        ),
+    ],
+)
+def test_index_answers_generator_templates(mirror, question, expected):
+    index = ChamadoIndex.from_mirror(str(mirror))
+    assert len(index) == 10 and index.first_day == dt.date(2023, 5, 2)
+    answer = index.answer(nodes.generate_sql(question)["template"])
+    assert answer is not None and answer.to_pylist() == expected
+
+
+def test_null_group_and_coverage(mirror):
+    index = ChamadoIndex.from_mirror(str(mirror))
+    template = nodes.generate_sql(
+        "Quais os 3 bairros que mais tiveram chamados abertos sobre reparo de buraco em 2023?"
+    )["template"]
+    by_subtipo = dict(template, group="subtipo", label="subtipo")
+    assert index.top(by_subtipo) == [("Reparo de buraco", 3), (None, 1)]
+
+    assert index.answer(dict(template, group="categoria")) is None
+    assert index.answer(dict(template, text_columns=["descricao"])) is None
+
+    recent = ChamadoIndex.from_mirror(str(mirror), since=dt.date(2024, 1, 1))
+    assert len(recent) == 6
+    assert recent.answer(template) is None  # 2023 ficou fora da carga
+
+
+def test_memory_budget_refuses_load(mirror):
+    with pytest.raises(MemoryError):
+        ChamadoIndex.from_mirror(str(mirror), max_bytes=64)
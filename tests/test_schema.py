@@ -0,0 +1,246 @@
+"""
+Testes da descoberta de schema (src/utils/schema.py), com cliente fake.
+
+Critérios cobertos
+------------------
+- Caminho principal por metadados da tabela (`get_table`), sem dry-run nem job:
+  campos aninhados/repetidos, particionamento, clustering e versão da tabela.
+- Fallback para INFORMATION_SCHEMA.COLUMNS quando `get_table` falha.
+- Pré-carga em lote: `get_table` em paralelo, uma consulta a INFORMATION_SCHEMA
+  por dataset para o que falhar, e o resultado servido por `get_table_schema`.
+- Cache persistente: processo novo responde do disco; cópia vencida é servida e
+  revalidada em segundo plano; mudança de versão avisa os ouvintes e remonta
+  o perfil do gerador (`SchemaProfile`) na próxima pergunta.
+"""
+
+import datetime as dt
+import time
+
+import pandas as pd
+import pytest
+from google.api_core.exceptions import Forbidden
+from google.cloud import bigquery
+
+import src.utils.bq as bq
+import src.utils.schema as schema
+
+
+class _FakeClient:
+    def __init__(self, table=None, error=None):
+        self.table, self.error, self.calls = table, error, []
+
+    def get_table(self, ref, timeout=None):
+        self.calls.append(ref)
+        if self.error:
+            raise self.error
+        return self.table
+
+
+def _no_query(*args, **kwargs):
+    raise AssertionError("caminho por metadados não deve executar consultas")
+
+
+@pytest.fixture(autouse=True)
+def _fresh_cache(tmp_path, monkeypatch):
+    monkeypatch.setattr(schema, "SCHEMA_CACHE_DIR", str(tmp_path / "schema"))
+    schema.clear_schema_cache()
+    yield
+    schema.clear_schema_cache()
+
+
+def _table(etag, columns):
+    table = bigquery.Table(
+        "p.d.chamado", schema=[bigquery.SchemaField(c, "STRING") for c in columns]
+    )
+    table._properties["etag"] = etag
+    return table
+
+
+def test_schema_from_table_metadata(monkeypatch):
+    table = bigquery.Table(
+        "p.d.chamado",
+        schema=[
+            bigquery.SchemaField("id_chamado", "STRING"),
+            bigquery.SchemaField("data_particao", "DATE"),
+            bigquery.SchemaField("n", "INTEGER"),
+            bigquery.SchemaField("tags", "STRING", mode="REPEATED"),
+            bigquery.SchemaField(
+                "local",
+                "RECORD",
+                fields=[
+                    bigquery.SchemaField("lat", "FLOAT"),
+                    bigquery.SchemaField("ok", "BOOLEAN"),
+                ],
+            ),
+        ],
+    )
+    table.time_partitioning = bigquery.TimePartitioning(field="data_particao")
+    table.clustering_fields = ["id_chamado"]
+    table._properties.update(
+        {"etag": "abc==", "lastModifiedTime": "1732752000000", "numRows": "42"}
+    )
+    client = _FakeClient(table)
+    monkeypatch.setattr(bq, "get_bq_client", lambda *a, **k: client)
+    monkeypatch.setattr(schema, "execute", _no_query)
+
+    assert schema.get_table_schema("p.d", "chamado") == {
+        "id_chamado": "STRING",
+        "data_particao": "DATE",
+        "n": "INT64",
+        "tags": "ARRAY<STRING>",
+        "local": "STRUCT<lat FLOAT64, ok BOOL>",
+    }
+    meta = schema.get_table_metadata("p.d", "chamado")
+    assert meta["source"] == "metadata" and client.calls == ["p.d.chamado"]
+    assert meta["partitioning"] == {
+        "type": "DAY",
+        "field": "data_particao",
+        "require_filter": False,
+    }
+    assert meta["clustering"] == ["id_chamado"]
+    assert meta["fields"][4]["fields"][0] == {
+        "name": "lat",
+        "type": "FLOAT64",
+        "mode": "NULLABLE",
+        "fields": [],
+    }
+    assert meta["etag"] == "abc==" and meta["num_rows"] == 42
+    assert dt.datetime.fromisoformat(meta["last_modified"]).year == 2024
+
+
+def test_schema_falls_back_to_information_schema(monkeypatch):
+    client = _FakeClient(error=Forbidden("sem bigquery.tables.get"))
+    monkeypatch.setattr(bq, "get_bq_client", lambda *a, **k: client)
+    df = pd.DataFrame(
+        {
+            "table_name": ["chamado"] * 3,
+            "column_name": ["id_chamado", "data_particao", "subtipo"],
+            "data_type": ["string", "DATE", "STRING"],
+            "is_partitioning_column": ["NO", "YES", "NO"],
+            "clustering_ordinal_position": pd.array([2, None, 1], dtype="Int64"),
+        }
+    )
+    monkeypatch.setattr(schema, "execute", lambda sql: {"ok": True, "df": df})
+
+    meta = schema.get_table_metadata("p.d", "chamado")
+    assert meta["source"] == "information_schema"
+    assert meta["columns"] == {
+        "id_chamado": "STRING",
+        "data_particao": "DATE",
+        "subtipo": "STRING",
+    }
+    assert meta["partitioning"]["field"] == "data_particao"
+    assert meta["clustering"] == ["subtipo", "id_chamado"]
+
+
+def test_persistent_cache_serves_new_process_without_bigquery(monkeypatch):
+    client = _FakeClient(_table("v1", ["id_chamado"]))
+    monkeypatch.setattr(bq, "get_bq_client", lambda *a, **k: client)
+    assert schema.get_table_schema("p.d", "chamado") == {"id_chamado": "STRING"}
+
+    # "Novo processo": memória vazia, só o arquivo em disco
+    schema.clear_schema_cache()
+    client.error = AssertionError("cache fresco não deve ir ao BigQuery")
+    assert schema.get_table_schema("p.d", "chamado") == {"id_chamado": "STRING"}
+    assert client.calls == ["p.d.chamado"]
+
+
+def test_stale_entry_is_served_and_revalidated_in_background(monkeypatch):
+    client = _FakeClient(_table("v1", ["id_chamado"]))
+    monkeypatch.setattr(bq, "get_bq_client", lambda *a, **k: client)
+    changes = []
+    monkeypatch.setattr(schema, "_LISTENERS", [])
+    schema.add_schema_listener(lambda ds, tb, meta: changes.append((tb, meta["etag"])))
+    schema.get_table_schema("p.d", "chamado")
+
+    client.table = _table("v2", ["id_chamado", "subtipo"])
+    monkeypatch.setattr(schema, "SCHEMA_CACHE_TTL", 0)
+    # Vencido, mas dentro de MAX_STALE: devolve a cópia antiga sem esperar
+    assert schema.get_table_schema("p.d", "chamado") == {"id_chamado": "STRING"}
+
+    deadline = time.monotonic() + 5
+    while not changes and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert changes[-1] == ("chamado", "v2")
+    monkeypatch.setattr(schema, "SCHEMA_CACHE_TTL", 3600)
+    assert "subtipo" in schema.get_table_schema("p.d", "chamado")
+
+    # Mais velho que MAX_STALE: busca síncrona
+    monkeypatch.setattr(schema, "SCHEMA_CACHE_TTL", 0)
+    monkeypatch.setattr(schema, "SCHEMA_CACHE_MAX_STALE", 0)
+    client.table = _table("v3", ["id_chamado"])
+    assert schema.get_table_schema("p.d", "chamado") == {"id_chamado": "STRING"}
+
+
+def test_prefetch_loads_tables_into_shared_registry(monkeypatch):
+    tables = {"p.d.chamado": _table("v1", ["id_chamado"])}
+
+    class _Client(_FakeClient):
+        def get_table(self, ref, timeout=None):
+            self.calls.append(ref)
+            if ref not in tables:
+                raise Forbidden("sem bigquery.tables.get")
+            return tables[ref]
+
+    client = _Client()
+    monkeypatch.setattr(bq, "get_bq_client", lambda *a, **k: client)
+    queries = []
+
+    def _execute(sql):
+        queries.append(sql)
+        df = pd.DataFrame(
+            {
+                "table_name": ["bairro", "bairro", "subprefeitura"],
+                "column_name": ["id_bairro", "nome", "id"],
+                "data_type": ["INT64", "STRING", "INT64"],
+                "is_partitioning_column": ["NO"] * 3,
+                "clustering_ordinal_position": pd.array([None] * 3, dtype="Int64"),
+            }
+        )
+        return {"ok": True, "df": df}
+
+    monkeypatch.setattr(schema, "execute", _execute)
+    out = schema.prefetch_schemas(
+        ["p.d.chamado", "p.m.bairro", "p.m.subprefeitura", "p.m.inexistente"]
+    )
+    assert sorted(out["fetched"]) == ["p.d.chamado", "p.m.bairro", "p.m.subprefeitura"]
+    assert list(out["failed"]) == ["p.m.inexistente"] and not out["ok"]
+    # Um único INFORMATION_SCHEMA para as três tabelas do dataset p.m
+    assert len(queries) == 1 and "`p.m.INFORMATION_SCHEMA.COLUMNS`" in queries[0]
+
+    client.calls.clear()
+    monkeypatch.setattr(schema, "execute", _no_query)
+    assert schema.get_table_schema("p.m", "bairro") == {
+        "id_bairro": "INT64",
+        "nome": "STRING",
+    }
+    assert schema.prefetch_schemas(["p.d.chamado"])["cached"] == ["p.d.chamado"]
+    assert client.calls == []
+
+
+def test_generator_profile_follows_schema_version(monkeypatch):
+    from src.agent import categories, nodes
+    from src.utils import backends
+
+    client = _FakeClient(_table("v1", ["data_particao", "tipo"]))
+    monkeypatch.setattr(bq, "get_bq_client", lambda *a, **k: client)
+    monkeypatch.setattr(nodes, "_SCHEMA_CACHE", {})
+    monkeypatch.setattr(categories, "CATEGORY_IN_ENABLED", False)
+    backends.set_backend(backends.BigQueryBackend())
+    question = "Qual o subtipo de chamado mais comum relacionado a Iluminação Pública?"
+    try:
+        assert nodes.generate_sql(question)["sql"].startswith("SELECT tipo,")
+
+        # Tabela muda; cópia vencida é servida e revalidada em segundo plano
+        client.table = _table("v2", ["data_particao", "tipo", "subtipo"])
+        monkeypatch.setattr(schema, "SCHEMA_CACHE_TTL", 0)
+        nodes.generate_sql(question)
+        deadline = time.monotonic() + 5
+        while schema._REFRESHING and time.monotonic() < deadline:
+            time.sleep(0.01)
+        monkeypatch.setattr(schema, "SCHEMA_CACHE_TTL", 3600)
+
+        assert nodes.generate_sql(question)["sql"].startswith("SELECT subtipo,")
+        assert list(nodes._SCHEMA_CACHE) == [("bigquery", "v2|None")]
+    finally:
+        backends.set_backend(None)
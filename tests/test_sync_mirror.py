@@ -0,0 +1,116 @@
+"""
+Testes do espelho incremental de `chamado` (scripts/sync_mirror.py), sem BigQuery.
+
+Critérios cobertos
+------------------
+- Primeira sincronização baixa todas as partições, no layout Hive.
+- Sincronizações seguintes baixam só partições novas/alteradas.
+- Retomada: partições já gravadas não são refeitas após uma falha no meio.
+- Arquivos temporários nunca aparecem no glob *.parquet dos leitores.
+- Downloads em paralelo herdam a sessão de orçamento do chamador.
+"""
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+import pytest
+
+from scripts import sync_mirror
+from src.agent.nodes import TAB_BAIRRO, TAB_CHAMADO
+from src.utils import bq
+
+
+@pytest.fixture
+def source(monkeypatch):
+    remote = {
+        "2024-11-27": {"last_modified": "2024-11-28 03:00:00", "rows": 2},
+        "2024-11-28": {"last_modified": "2024-11-29 03:00:00", "rows": 1},
+    }
+    fetched = []
+    fail = set()
+
+    def _fetch(day, columns):
+        if day in fail:
+            raise RuntimeError("falha simulada")
+        fetched.append(day)
+        n = remote[day]["rows"]
+        return pa.table({c: [f"{c}-{day}"] * n for c in columns})
+
+    monkeypatch.setattr(sync_mirror, "mirror_columns", lambda: ["id_bairro", "subtipo"])
+    monkeypatch.setattr(sync_mirror, "list_partitions", lambda: dict(remote))
+    monkeypatch.setattr(sync_mirror, "fetch_partition", _fetch)
+    monkeypatch.setattr(
+        sync_mirror,
+        "fetch_bairro",
+        lambda: pa.table({"id_bairro": [1], "nome": ["Centro"]}),
+    )
+    return remote, fetched, fail
+
+
+def _quiet(*_args, **_kwargs):
+    pass
+
+
+def test_incremental_sync_downloads_only_new_or_changed(tmp_path, source):
+    remote, fetched, _ = source
+
+    first = sync_mirror.sync(dest=str(tmp_path), log=_quiet)
+    assert first["downloaded"] == ["2024-11-27", "2024-11-28"] and first["rows"] == 3
+    part = tmp_path / TAB_CHAMADO / "data_particao=2024-11-27" / "part-0.parquet"
+    assert pq.read_table(part).column_names == ["id_bairro", "subtipo"]
+    assert (tmp_path / f"{TAB_BAIRRO}.parquet").exists()
+
+    fetched.clear()
+    assert sync_mirror.sync(dest=str(tmp_path), log=_quiet)["downloaded"] == []
+    assert fetched == []
+
+    remote["2024-11-28"] = {"last_modified": "2024-11-30 03:00:00", "rows": 4}
+    remote["2024-11-29"] = {"last_modified": "2024-11-30 03:00:00", "rows": 1}
+    again = sync_mirror.sync(dest=str(tmp_path), log=_quiet)
+    assert again["downloaded"] == ["2024-11-28", "2024-11-29"]
+    assert again["unchanged"] == ["2024-11-27"]
+
+
+def test_interrupted_sync_resumes(tmp_path, source):
+    _, fetched, fail = source
+    fail.add("2024-11-28")
+
+    partial = sync_mirror.sync(dest=str(tmp_path), workers=1, log=_quiet)
+    assert partial["downloaded"] == ["2024-11-27"] and "2024-11-28" in partial["failed"]
+
+    fail.clear()
+    fetched.clear()
+    resumed = sync_mirror.sync(dest=str(tmp_path), log=_quiet)
+    assert resumed["downloaded"] == ["2024-11-28"] and fetched == ["2024-11-28"]
+
+    files = sorted(p.name for p in (tmp_path / TAB_CHAMADO).rglob("*.parquet"))
+    assert files == ["part-0.parquet", "part-0.parquet"]
+    assert not list((tmp_path / TAB_CHAMADO).rglob("*.tmp-*"))
+
+
+def test_parallel_downloads_keep_budget_session(tmp_path, source, monkeypatch):
+    sessions = []
+    fetch = sync_mirror.fetch_partition
+
+    def _fetch(day, columns):
+        sessions.append(bq._BUDGET_SESSION.get())
+        return fetch(day, columns)
+
+    monkeypatch.setattr(sync_mirror, "fetch_partition", _fetch)
+    with bq.budget_session("mirror-sync"):
+        sync_mirror.sync(dest=str(tmp_path), workers=2, log=_quiet)
+    assert sessions == ["mirror-sync", "mirror-sync"]
+
+
+def test_budget_override(monkeypatch):
+    monkeypatch.setattr(bq, "SESSION_BUDGET_BYTES", 20 * 10**9)
+    monkeypatch.setattr(bq, "PROCESS_BUDGET_BYTES", 200 * 10**9)
+    sync_mirror.apply_budget(500)
+    assert bq.SESSION_BUDGET_BYTES == bq.PROCESS_BUDGET_BYTES == 500 * 10**9
+    sync_mirror.apply_budget(0)
+    assert bq.SESSION_BUDGET_BYTES == bq.PROCESS_BUDGET_BYTES == 0
+    hint = sync_mirror.budget_hint(
+        {"failed": {"2024-11-28": "RuntimeError('Orçamento de bytes da sessão ...')"}},
+        "mirror-sync",
+    )
+    assert hint and "--budget-gb" in hint
+    assert sync_mirror.budget_hint({"failed": {"x": "timeout"}}, "mirror-sync") is None